@@ -7,4 +7,6 @@ docker pull ghcr.io/xant-tv/ecumene/ecumene-nginx:latest
 
 # Compose command to deploy on remote host
 docker-compose -f docker-compose.yml up -d --no-build
-docker run -d -v "/opt/oracle/network/admin:/opt/oracle/network/admin" --env-file .env --name ecumene-bot ghcr.io/xant-tv/ecumene/ecumene-core:latest bot
\ No newline at end of file
+# Compose reads .env by itself but the bot needs the archive folder for its volume as well
+AUDIT_ARCHIVE_FOLDER=${AUDIT_ARCHIVE_FOLDER:-$(grep -E '^AUDIT_ARCHIVE_FOLDER=' .env | cut -d= -f2- | sed 's/#.*//' | xargs)}
+docker run -d -v "/opt/oracle/network/admin:/opt/oracle/network/admin" -v "$AUDIT_ARCHIVE_FOLDER:/app/archive" --env-file .env --name ecumene-bot ghcr.io/xant-tv/ecumene/ecumene-core:latest bot
\ No newline at end of file
@@ -6,6 +6,8 @@ import logging
 from urllib.parse import urlencode
 from types import SimpleNamespace
 
+from util.metrics import CALL_BNET, count_call
+
 MTYPES = dict(xbox=1, playstation=2, steam=3, blizzard=4, stadia=5, epic=6, bungie=254)
 MLEVELS = dict(beginner=1, member=2, admin=3, actingfounder=4, founder=5) # Just like with Halo - Bungie never made a 4th.
 
@@ -73,6 +75,7 @@ class BungieInterface():
     def _execute_(self, method, url, headers=None, params=None, json=None, data=None):
         """Provide a `requests` method to execute."""
         self.log.info(f'{method.__name__.upper()} -> {url}')
+        count_call(CALL_BNET)
         response = method(url, headers=headers, params=params, json=json, data=data)
         if not response.ok:
             try:
@@ -227,6 +230,24 @@ class BungieInterface():
         content = self._strip_outer_(response)
         return content
 
+    def approve_requests_to_join_group(self, token, group_id, memberships):
+        """Approve many pending requests at once from (membership_type, membership_id) pairs."""
+        url = self._get_url_('GroupV2', group_id, 'Members', 'ApproveList')
+        headers = self._get_headers_with_token_(token)
+        data = {
+            'memberships': [
+                {
+                    'membershipId': membership_id,
+                    'membershipType': membership_type
+                } for membership_type, membership_id in memberships
+            ]
+        }
+        # As with denial, each membership carries its own internal result code.
+        # Leave inspection of those to the caller since a partial success is still useful.
+        response = self._execute_(requests.post, url, headers=headers, json=data)
+        content = self._strip_outer_(response)
+        return content
+
     def _deny_request_to_join_group_(self, token, group_id, membership_type, membership_id):
         """This function should not be called even though it is simpler. Bungie has not implemented this endpoint. We can dream."""
         url = self._get_url_('GroupV2', group_id, 'Members', 'Deny', membership_type, membership_id)
@@ -0,0 +1,206 @@
+import asyncio
+import logging
+import threading
+import time
+
+from sqlalchemy.exc import DBAPIError, DisconnectionError, InterfaceError, OperationalError, TimeoutError
+
+from db.client import DatabaseService
+from db.query.audit import insert_audit_records_with_options, update_audit_records
+
+AUDIT_FLUSH_INTERVAL = 5 # Seconds between timed flushes.
+AUDIT_FLUSH_SIZE = 50 # Pending writes before a flush is forced.
+AUDIT_RETRY_LIMIT = 5 # Failed flushes a record survives before it is dropped.
+AUDIT_RETRY_BACKOFF = 5 # Seconds before retrying after a failed flush, doubled on each consecutive failure.
+AUDIT_RETRY_BACKOFF_MAX = 5*60 # Longest wait between retries.
+
+class EcumeneAuditBuffer():
+    """
+    Write-behind buffer for audit records.
+    Collects inserts and status updates in memory and writes them to the database in batches.
+    An update that lands before its insert has been flushed is merged into that insert.
+    Records that fail to write because the database is unavailable are queued again and retried with backoff.
+    """
+
+    def __init__(self, db: DatabaseService, interval=AUDIT_FLUSH_INTERVAL, size=AUDIT_FLUSH_SIZE, retries=AUDIT_RETRY_LIMIT):
+        self.log = logging.getLogger(f'{self.__module__}.{self.__class__.__name__}')
+        self.db = db
+        self.interval = interval
+        self.size = size
+        self.retries = retries
+        self.task = None
+
+        # Retry state for records that could not be written.
+        self.attempts = dict()
+        self.failures = 0
+        self.retry_at = 0
+
+        # Flushes run in a worker thread so guard the pending structures.
+        self.lock = threading.Lock()
+        self.flushing = threading.Lock()
+        self.inserts = dict()
+        self.options = dict()
+        self.updates = dict()
+
+    def pending(self):
+        """Number of records waiting to be written."""
+        return len(self.inserts) + len(self.updates)
+
+    def start(self):
+        """Begin timed flushing on the running event loop. Safe to call more than once."""
+        if self.task and not self.task.done():
+            return
+        self.task = asyncio.get_event_loop().create_task(self._run_())
+
+    async def _run_(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.flush_async()
+
+    async def insert(self, data, options):
+        """Queue a new audit record alongside its normalised option rows."""
+        record_id = data.get('record_id')
+        with self.lock:
+            self.inserts[record_id] = data
+            self.options[record_id] = options
+        await self._flush_if_full_()
+
+    async def update(self, data):
+        """Queue values to update on an existing audit record."""
+        values = dict(data)
+        record_id = values.pop('record_id')
+        with self.lock:
+            if record_id in self.inserts:
+                # Record has not been written yet so write the final values in one go.
+                self.inserts[record_id].update(values)
+            else:
+                self.updates.setdefault(record_id, dict()).update(values)
+        await self._flush_if_full_()
+
+    async def _flush_if_full_(self):
+        # Records keep queueing while a failed flush is backing off.
+        if self.pending() >= self.size and time.time() >= self.retry_at:
+            await self.flush_async()
+
+    async def flush_async(self):
+        """Flush without blocking the event loop."""
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(None, self.flush)
+
+    def flush(self, force=False):
+        """Write all pending records to the database. Waits out any backoff unless forced."""
+        # Only one flush writes at a time.
+        # Otherwise an update could be written before the insert it targets has committed.
+        with self.flushing:
+            if not force and time.time() < self.retry_at:
+                return
+
+            # Swap out pending structures so new records can queue while we write.
+            with self.lock:
+                inserts, options, updates = self.inserts, self.options, self.updates
+                self.inserts, self.options, self.updates = dict(), dict(), dict()
+            if not (inserts or updates):
+                return
+
+            # Inserts must go first as updates can target records inserted in this flush.
+            # Each part is its own transaction so a failure only retries the part that failed.
+            failed_inserts = dict()
+            failed_updates = dict()
+            if inserts:
+                failed_inserts = self._write_batch_(inserts, lambda batch: self._write_inserts_(batch, options))
+            if updates:
+                failed_updates = self._write_batch_(updates, self._write_updates_)
+            for record_id in set(inserts.keys()) - set(failed_inserts.keys()):
+                self.attempts.pop(record_id, None)
+            for record_id in set(updates.keys()) - set(failed_updates.keys()):
+                self.attempts.pop(record_id, None)
+
+            if failed_inserts or failed_updates:
+                requeued = self._requeue_(failed_inserts, options, failed_updates)
+                self.failures += 1
+                backoff = min(AUDIT_RETRY_BACKOFF * 2 ** (self.failures - 1), AUDIT_RETRY_BACKOFF_MAX)
+                self.retry_at = time.time() + backoff
+                self.log.warning(f'Requeued {requeued} record(s), retrying in {backoff} second(s)')
+            else:
+                self.failures = 0
+                self.retry_at = 0
+            self.log.info(f'Flushed {len(inserts) - len(failed_inserts)} insert(s) and {len(updates) - len(failed_updates)} update(s)')
+
+    def _is_transient_(self, error):
+        """Whether a write failed because the database was unavailable rather than because of the data."""
+        if isinstance(error, (OperationalError, InterfaceError, DisconnectionError, TimeoutError)):
+            return True
+        if isinstance(error, DBAPIError):
+            # No statement means we never got as far as running one.
+            return error.connection_invalidated or error.statement is None
+        return False
+
+    def _write_batch_(self, records, write):
+        """Write records together, falling back to one at a time. Returns any that should be retried later."""
+        try:
+            write(records)
+            return dict()
+        except Exception as e:
+            if self._is_transient_(e):
+                self.log.error(f'Audit flush failed, requeueing {len(records)} record(s): {e}')
+                return records
+            # One bad row fails the whole batch so fall back to writing individually.
+            self.log.error(f'Batched audit flush failed, retrying individually: {e}')
+        retry = dict()
+        for record_id, data in records.items():
+            try:
+                write({record_id: data})
+            except Exception as e:
+                if self._is_transient_(e):
+                    retry[record_id] = data
+                    continue
+                # Bad data will never write so drop it, keeping its contents in the log.
+                self.log.error(f'Dropped audit record {record_id} {data}: {e}')
+        return retry
+
+    def _requeue_(self, inserts, options, updates):
+        """Put failed writes back in front of anything queued since, dropping records that are out of retries."""
+        requeued = 0
+        with self.lock:
+            for record_id, data in inserts.items():
+                if not self._retry_(record_id, data):
+                    self.updates.pop(record_id, None)
+                    continue
+                # Updates that arrived while the insert was in flight merge back into it.
+                self.inserts[record_id] = {**data, **self.updates.pop(record_id, dict())}
+                self.options[record_id] = options.get(record_id)
+                requeued += 1
+            for record_id, values in updates.items():
+                if not self._retry_(record_id, values):
+                    continue
+                self.updates[record_id] = {**values, **self.updates.get(record_id, dict())}
+                requeued += 1
+        return requeued
+
+    def _retry_(self, record_id, data):
+        attempts = self.attempts.get(record_id, 0) + 1
+        if attempts > self.retries:
+            self.attempts.pop(record_id, None)
+            self.log.error(f'Dropped audit record {record_id} {data} after {self.retries} failed attempt(s)')
+            return False
+        self.attempts[record_id] = attempts
+        return True
+
+    def _write_inserts_(self, inserts, options):
+        # Every row needs the same keys to be executed as one statement.
+        keys = set()
+        for data in inserts.values():
+            keys.update(data.keys())
+        rows = [{key: data.get(key) for key in keys} for data in inserts.values()]
+        option_rows = [row for record_id in inserts.keys() for row in options.get(record_id) or list()]
+        # Records and their options are written together so neither is left without the other.
+        insert_audit_records_with_options(self.db, rows, option_rows)
+
+    def _write_updates_(self, updates):
+        # Group updates by the columns they touch so each group shares a statement.
+        groups = dict()
+        for record_id, values in updates.items():
+            row = {'record_id': record_id, **values}
+            groups.setdefault(tuple(sorted(row.keys())), list()).append(row)
+        for rows in groups.values():
+            update_audit_records(self.db, 'record_id', rows)
\ No newline at end of file
@@ -0,0 +1,320 @@
+import asyncio
+import logging
+import threading
+
+from collections import OrderedDict
+
+from bnet.client import BungieInterfaceError
+from db.client import DatabaseService
+from db.query.admins import get_admin_by_id
+from db.query.clans import get_all_clans_in_guild
+from db.query.members import get_blacklist, get_member_by_id, get_members_matching, get_registered_discord_ids
+from db.query.permissions import get_permissions_in_guild
+from util.data import chunks
+from util.time import get_current_time
+
+PERMISSION_CACHE_TTL = 5*60 # Seconds before a guild index is reloaded regardless of invalidation.
+CLAN_CACHE_TTL = 5*60 # As above but for the clan directory.
+ADMIN_EXPIRY_MARGIN = 5*60 # Seconds before access expiry that a cached token is reloaded.
+MEMBER_CACHE_SIZE = 1024 # Full member records held in memory at once.
+MEMBER_RELOAD_INTERVAL = 60 # Seconds between reconciling the registered set with the database.
+ADMIN_AUTH_ERRORS = [
+    'WebAuthRequired',
+    'AccessTokenHasExpired',
+    'AuthorizationRecordExpired',
+    'AuthorizationRecordRevoked'
+]
+BLACKLIST_RELOAD_INTERVAL = 60 # Seconds between reconciling the blacklist with the database.
+BLACKLIST_GUILD_ID = '0' # Entries against this member identifier block the entire guild.
+
+class EcumenePermissionCache():
+    """
+    Per-guild index of command permissions.
+    Maps each permission identifier to the set of roles granted it.
+    Guilds load lazily on first check and are dropped whenever their grants change.
+    """
+
+    def __init__(self, db: DatabaseService, ttl=PERMISSION_CACHE_TTL):
+        self.log = logging.getLogger(f'{self.__module__}.{self.__class__.__name__}')
+        self.db = db
+        self.ttl = ttl
+        self.guilds = dict()
+
+    def _load_(self, guild_id):
+        index = dict()
+        results = get_permissions_in_guild(self.db, guild_id)
+        for role_id, permission_id in zip(results.get('role_id', list()), results.get('permission_id', list())):
+            index.setdefault(permission_id, set()).add(role_id)
+        self.guilds[guild_id] = (get_current_time(), index)
+        self.log.info(f'Loaded {len(index)} permission(s) for guild {guild_id}')
+        return index
+
+    def _get_index_(self, guild_id):
+        cached = self.guilds.get(guild_id)
+        # Reload anything older than the TTL in case grants were changed elsewhere.
+        if not cached or get_current_time() - cached[0] > 1000 * self.ttl:
+            return self._load_(guild_id)
+        return cached[1]
+
+    def get_permitted_roles(self, guild_id, permission_ids):
+        """Get every role permitted to run any of the permission identifiers."""
+        index = self._get_index_(guild_id)
+        permitted = set()
+        for permission_id in permission_ids:
+            permitted |= index.get(permission_id, set())
+        return permitted
+
+    def invalidate(self, guild_id):
+        """Drop the index for a guild so it is reloaded on next check."""
+        self.guilds.pop(guild_id, None)
+
+class EcumeneBlacklistCache():
+    """
+    In-memory copy of the blacklist as a set of (guild, member) pairs.
+    Updated directly by block commands and reconciled with the database on an interval.
+    Whole guilds are blocked with the placeholder member identifier.
+    """
+
+    def __init__(self, db: DatabaseService, interval=BLACKLIST_RELOAD_INTERVAL):
+        self.log = logging.getLogger(f'{self.__module__}.{self.__class__.__name__}')
+        self.db = db
+        self.interval = interval
+        self.entries = None
+        self.task = None
+
+    def load(self):
+        """Replace the cached blacklist with the current database state."""
+        results = get_blacklist(self.db)
+        entries = set(zip(results.get('guild_id', list()), results.get('discord_id', list())))
+        # Swap in one go so checks never see a partially loaded set.
+        self.entries = entries
+        return len(entries)
+
+    def start(self):
+        """Begin timed reconciliation on the running event loop. Safe to call more than once."""
+        if self.task and not self.task.done():
+            return
+        self.task = asyncio.get_event_loop().create_task(self._run_())
+
+    async def _run_(self):
+        loop = asyncio.get_event_loop()
+        while True:
+            try:
+                count = await loop.run_in_executor(None, self.load)
+                self.log.info(f'Reconciled {count} blacklist entries')
+            except Exception as e:
+                # Keep serving the last known state until the database comes back.
+                self.log.error(f'Failed to reconcile blacklist: {e}')
+            await asyncio.sleep(self.interval)
+
+    def _is_listed_(self, guild_id, discord_id):
+        if self.entries is None:
+            self.load()
+        return (str(guild_id), str(discord_id)) in self.entries
+
+    def is_user_blocked(self, guild_id, discord_id):
+        return self._is_listed_(guild_id, discord_id)
+
+    def is_guild_blocked(self, guild_id):
+        return self._is_listed_(guild_id, BLACKLIST_GUILD_ID)
+
+    def add(self, guild_id, discord_id):
+        """Record a new blacklist entry already written to the database."""
+        if self.entries is not None:
+            self.entries.add((str(guild_id), str(discord_id)))
+
+    def remove(self, guild_id, discord_id):
+        """Forget a blacklist entry already removed from the database."""
+        if self.entries is not None:
+            self.entries.discard((str(guild_id), str(discord_id)))
+
+class EcumeneClanDirectory():
+    """
+    Per-guild directory of registered clans indexed by clan and role identifiers.
+    Guilds load lazily and are dropped whenever a clan is registered or removed.
+    Results keep the same structure as the database queries they replace.
+    """
+
+    def __init__(self, db: DatabaseService, ttl=CLAN_CACHE_TTL):
+        self.log = logging.getLogger(f'{self.__module__}.{self.__class__.__name__}')
+        self.db = db
+        self.ttl = ttl
+        self.guilds = dict()
+
+    def _load_(self, guild_id):
+        clans = get_all_clans_in_guild(self.db, guild_id)
+        rows = [dict(zip(clans.keys(), values)) for values in zip(*clans.values())]
+        directory = {
+            'all': clans,
+            'clan_id': {row.get('clan_id'): row for row in rows},
+            'role_id': {row.get('role_id'): row for row in rows}
+        }
+        self.guilds[guild_id] = (get_current_time(), directory)
+        self.log.info(f'Loaded {len(rows)} clan(s) for guild {guild_id}')
+        return directory
+
+    def _get_directory_(self, guild_id):
+        cached = self.guilds.get(guild_id)
+        # Reload anything older than the TTL in case a signal was missed.
+        if not cached or get_current_time() - cached[0] > 1000 * self.ttl:
+            return self._load_(guild_id)
+        return cached[1]
+
+    def get_all_clans(self, guild_id):
+        """Get all clans registered in a guild."""
+        return self._get_directory_(guild_id).get('all')
+
+    def get_clan(self, guild_id, target_column, identifier):
+        """Get a single clan in a guild by either clan or role identifier."""
+        row = self._get_directory_(guild_id).get(target_column).get(str(identifier))
+        if not row:
+            return dict()
+        return {key: [value] for key, value in row.items()}
+
+    def invalidate(self, guild_id):
+        """Drop the directory for a guild so it is reloaded on next lookup."""
+        self.guilds.pop(guild_id, None)
+
+class EcumeneAdminCache():
+    """
+    Process-local cache of administrator credentials keyed by admin identifier.
+    Tokens close to expiry are reloaded before use as the task process rotates them ahead of time.
+    Calls made with a token that was rotated underneath us are retried once with fresh credentials.
+    """
+
+    def __init__(self, db: DatabaseService, margin=ADMIN_EXPIRY_MARGIN):
+        self.log = logging.getLogger(f'{self.__module__}.{self.__class__.__name__}')
+        self.db = db
+        self.margin = margin
+        self.admins = dict()
+
+    def _load_(self, admin_id):
+        admin = get_admin_by_id(self.db, admin_id)
+        if not admin:
+            self.admins.pop(admin_id, None)
+            return dict()
+        self.admins[admin_id] = admin
+        return admin
+
+    def get_admin(self, admin_id):
+        """Get administrator credentials in the same structure as the database query."""
+        admin = self.admins.get(admin_id)
+        if not admin or admin.get('access_expires_at')[0] - get_current_time() < 1000 * self.margin:
+            return self._load_(admin_id)
+        return admin
+
+    def get_token(self, admin_id):
+        """Get a current access token for an administrator."""
+        admin = self.get_admin(admin_id)
+        if not admin:
+            return None
+        return admin.get('access_token')[0]
+
+    def call(self, admin_id, method, *args, **kwargs):
+        """Call a Bungie method with the administrator token as its first argument."""
+        try:
+            return method(self.get_token(admin_id), *args, **kwargs)
+        except BungieInterfaceError as e:
+            if e.status not in ADMIN_AUTH_ERRORS:
+                raise
+            # Token was likely rotated between reading it and using it.
+            self.log.info(f'Retrying {method.__name__} for {admin_id} with reloaded credentials')
+            self._load_(admin_id)
+            return method(self.get_token(admin_id), *args, **kwargs)
+
+    def invalidate(self, admin_id):
+        """Drop cached credentials so they are reloaded on next use."""
+        self.admins.pop(admin_id, None)
+
+class EcumeneMemberCache():
+    """
+    Set of registered Discord identifiers plus a bounded LRU of full member records.
+    Identifiers are held as integers to keep the set compact for large member counts.
+    Registration changes are applied per member as they are signalled and the set is reconciled on an interval.
+    Unknown identifiers are always confirmed with the database in case a signal was missed.
+    """
+
+    def __init__(self, db: DatabaseService, size=MEMBER_CACHE_SIZE, interval=MEMBER_RELOAD_INTERVAL):
+        self.log = logging.getLogger(f'{self.__module__}.{self.__class__.__name__}')
+        self.db = db
+        self.size = size
+        self.interval = interval
+        self.registered = None
+        self.task = None
+
+        # Signals are applied from a worker thread so guard the record order.
+        self.lock = threading.Lock()
+        self.records = OrderedDict()
+
+    def load(self):
+        """Replace the registered set with the current database state."""
+        results = get_registered_discord_ids(self.db)
+        self.registered = set(int(discord_id) for discord_id in results.get('discord_id', list()))
+        return len(self.registered)
+
+    def start(self):
+        """Begin timed reconciliation of the registered set on the running event loop. Safe to call more than once."""
+        if self.task and not self.task.done():
+            return
+        self.task = asyncio.get_event_loop().create_task(self._run_())
+
+    async def _run_(self):
+        loop = asyncio.get_event_loop()
+        while True:
+            try:
+                count = await loop.run_in_executor(None, self.load)
+                self.log.info(f'Reconciled {count} registered member(s)')
+            except Exception as e:
+                # Keep serving the last known state until the database comes back.
+                # Lookups fall back to the database until the first load succeeds.
+                self.log.error(f'Failed to reconcile registered members: {e}')
+            await asyncio.sleep(self.interval)
+
+    def _remember_(self, discord_id, member):
+        with self.lock:
+            self.records[discord_id] = member
+            self.records.move_to_end(discord_id)
+            while len(self.records) > self.size:
+                self.records.popitem(last=False)
+
+    def filter_registered(self, discord_ids):
+        """Reduce a batch of Discord identifiers to those that are registered."""
+        discord_ids = [str(discord_id) for discord_id in discord_ids]
+        if self.registered is not None:
+            return set(discord_id for discord_id in discord_ids if int(discord_id) in self.registered)
+        # Not loaded yet so resolve the whole batch with as few queries as possible.
+        registered = set()
+        for chunk in chunks(discord_ids, 1000):
+            matched = get_members_matching(self.db, 'discord_id', chunk)
+            registered |= set(matched.get('discord_id', list()))
+        return registered
+
+    def get_member(self, discord_id):
+        """Get the member record for a Discord user in the same structure as the database query."""
+        discord_id = str(discord_id)
+        with self.lock:
+            member = self.records.get(discord_id)
+            if member:
+                self.records.move_to_end(discord_id)
+                return member
+        # Never trust absence from the set alone as a missed signal would lock the user out.
+        member = get_member_by_id(self.db, 'discord_id', discord_id)
+        if member:
+            if self.registered is not None:
+                self.registered.add(int(discord_id))
+            self._remember_(discord_id, member)
+        return member
+
+    def refresh(self, discord_id):
+        """Re-read a single member after their registration has changed."""
+        discord_id = str(discord_id)
+        with self.lock:
+            self.records.pop(discord_id, None)
+        member = get_member_by_id(self.db, 'discord_id', discord_id)
+        if self.registered is not None:
+            if member:
+                self.registered.add(int(discord_id))
+            else:
+                self.registered.discard(int(discord_id))
+        if member:
+            self._remember_(discord_id, member)
\ No newline at end of file
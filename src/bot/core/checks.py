@@ -2,9 +2,7 @@ import copy
 import logging
 import discord
 
-from db.query.members import check_blacklist
-from db.query.permissions import get_permitted_roles_bulk
-from bot.core.shared import DATABASE, BNET, DICT_OF_ALL_GRANTABLE_COMMANDS
+from bot.core.shared import DATABASE, BNET, PERMISSIONS, BLACKLIST, DICT_OF_ALL_GRANTABLE_COMMANDS
 
 def get_command_name(cmd, default=''):
     """Extracts command name."""
@@ -46,6 +44,7 @@ class EcumeneCheck():
 
     def __init__(self):
         self.log = logging.getLogger(f'{self.__module__}.{self.__class__.__name__}')
+        self.paths = dict() # Command lineage never changes once registered.
 
     def user_is_guild_owner(self, ctx):
         self.log.info(f'Check is_guild_owner() invoked')
@@ -55,24 +54,29 @@ class EcumeneCheck():
         self.log.info(f'Check user_can_manage_server() invoked')
         return ctx.guild is not None and ctx.author.guild_permissions.manage_guild
 
+    def _get_permission_paths_(self, cmd):
+        """Get display path and role paths for a command, remembering them per command."""
+        key = cmd.qualified_name
+        if key not in self.paths:
+            lineage = list()
+            lineage = get_lineage(cmd, lineage)
+            # Obtain role paths from lineage.
+            permission_ids = list()
+            permission_ids = get_lineage_paths(list(reversed(lineage)), permission_ids)
+            self.paths[key] = ('/'.join(reversed(lineage)), permission_ids)
+        return self.paths.get(key)
+
     def user_has_role_permission(self, ctx):
         self.log.info(f'Check user_has_role_permission() invoked')
 
         # Get lineage and display path.
-        lineage = list()
-        lineage = get_lineage(ctx.command, lineage)
-        display_path = '/'.join(reversed(lineage))
+        display_path, permission_ids = self._get_permission_paths_(ctx.command)
         self.log.info(f'Checking permissions against "{display_path}"...')
 
-        # Obtain role paths from lineage.
-        permission_ids = list()
-        permission_ids = get_lineage_paths(list(reversed(lineage)), permission_ids)
-
-        # Get permitted roles in bulk from database.
-        results = get_permitted_roles_bulk(DATABASE, str(ctx.guild.id), permission_ids)
-        if not results:
+        # Get permitted roles in bulk from the guild permission index.
+        permitted = PERMISSIONS.get_permitted_roles(str(ctx.guild.id), permission_ids)
+        if not permitted:
             return False
-        permitted = results.get('role_id')
 
         # Loop author roles to compare with permitted.
         for role in ctx.author.roles:
@@ -92,14 +96,14 @@ class EcumeneCheck():
 
     def user_is_not_blacklisted(self, ctx):
         self.log.info(f'Check user_is_not_blacklisted() invoked')
-        blacklisted = check_blacklist(DATABASE, ctx.guild.id, ctx.author.id)
+        blacklisted = BLACKLIST.is_user_blocked(ctx.guild.id, ctx.author.id)
         if blacklisted:
             return False
         return True
     
     def guild_is_not_blacklisted(self, ctx):
         self.log.info(f'Check guild_is_not_blacklisted() invoked')
-        blacklisted = check_blacklist(DATABASE, ctx.guild.id, '0')
+        blacklisted = BLACKLIST.is_guild_blocked(ctx.guild.id)
         if blacklisted:
             return False
         return True
\ No newline at end of file
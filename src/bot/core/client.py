@@ -8,12 +8,14 @@ from bot.core.cogs.clan import Clan
 from bot.core.cogs.guild import Guild
 from bot.core.cogs.identity import Identity
 
-from bot.core.shared import DATABASE
+from bot.core.roles import EcumeneRoleManager
+from bot.core.shared import DATABASE, AUDIT, BLACKLIST, CLANS, ADMINS, MEMBERS, SIGNALS
 from db.query.headers import get_guild_system_role, delete_system_role, publish_system_role
-from db.query.members import get_members_matching, get_member_by_id
 from db.query.channels import delete_channel_configuration
+from db.query.automations import delete_guild_automations
 from util.local import get_guild_ids, get_system_role
-from util.data import chunks
+from util.enum import SignalType
+from util.metrics import CALL_DISCORD, count_call
 
 class EcumeneBot():
     """
@@ -29,6 +31,15 @@ class EcumeneBot():
             debug_guilds=get_guild_ids()
         )
         self.token = os.getenv('DISCORD_TOKEN')
+        self.roles = EcumeneRoleManager(self.client)
+
+        # Count every request made to Discord so commands can report how many they made.
+        self._count_discord_requests_()
+
+        # Drop cached state when another process tells us it has changed.
+        SIGNALS.subscribe(SignalType.CLANS.value, CLANS.invalidate)
+        SIGNALS.subscribe(SignalType.ADMINS.value, ADMINS.invalidate)
+        SIGNALS.subscribe(SignalType.MEMBERS.value, MEMBERS.refresh)
 
         # Add all commands to bot via their respective Cogs.
         self.client.add_cog(Audit(self.log))
@@ -61,10 +72,37 @@ class EcumeneBot():
             'on_member_join'
         )
 
+    def _count_discord_requests_(self):
+        """Wrap the HTTP client so each Discord request is counted against the current command."""
+        request = self.client.http.request
+        async def counted_request(*args, **kwargs):
+            count_call(CALL_DISCORD)
+            return await request(*args, **kwargs)
+        self.client.http.request = counted_request
+
     async def ready(self):
         """Trigger on bot ready."""
         self.log.info(f'Logged in as {self.client.user} (ID={self.client.user.id})')
 
+        # Begin flushing buffered audit records in the background.
+        AUDIT.start()
+
+        # Load the blacklist and keep it reconciled with changes made elsewhere.
+        BLACKLIST.start()
+
+        # Load every registered identifier so joins can be checked without a query.
+        MEMBERS.start()
+
+        # Carry on granting roles anywhere that was interrupted.
+        # Ready fires again after reconnects, which will not duplicate work already running.
+        self.roles.resume_proliferations()
+
+        # Periodically repair any drift between role holders and registrations.
+        self.roles.start_reconciliation()
+
+        # Listen for changes published by the web and task processes.
+        SIGNALS.start()
+
     async def new_guild(self, guild):
         """Trigger on joining a new guild."""
         self.log.info(f'Discovered a new guild "{guild.name}" (ID={guild.id})')
@@ -83,22 +121,8 @@ class EcumeneBot():
             publish_system_role(DATABASE, str(guild.id), str(role.id))
 
         # Now we would need to grant the role to all users in the guild registered with Ecumene.
-        # This monstrosity could take forever on large servers.
-        member_ids = list()
-        for guild_member in guild.members:
-            member_ids.append(str(guild_member.id))
-        self.log.info(f"Found {len(member_ids)} members in guild")
-
-        # Chunk members and process, adding role to each of them.
-        member_chunks = list(chunks(member_ids, 1000))
-        for chunk in member_chunks:
-            matched = get_members_matching(DATABASE, 'discord_id', chunk)
-            if not matched:
-                continue
-            for user_id in matched.get('discord_id'):
-                member = guild.get_member(int(user_id))
-                await member.add_roles(role)
-        self.log.info('Proliferated member roles!')
+        # This could take a long time on large servers so run it in the background with saved progress.
+        self.roles.proliferate(guild, role)
 
     async def leave_guild(self, guild):
         """Trigger on losing access to a guild."""
@@ -108,28 +132,22 @@ class EcumeneBot():
         # At that point you no longer have server access.
         # We also can't delete the old role on rejoin because it will be above us in the permissions list.
         self.log.info('Removing system role...')
+        self.roles.cancel_proliferation(guild.id)
+        delete_guild_automations(DATABASE, str(guild.id))
         delete_system_role(DATABASE, str(guild.id))
         delete_channel_configuration(DATABASE, str(guild.id))
 
     async def sync_member(self, member):
         """Trigger on a new member joining any guild the bot is in."""
 
-        # Check if the member exists in my database.
-        matched = get_member_by_id(DATABASE, 'discord_id', str(member.id))
-        if not matched:
-            return
-
-        # Thankfully we can limit the scope to just this guild.
-        guild = member.guild
-
-        # Get the role for the guild.
-        results = get_guild_system_role(DATABASE, str(guild.id))
-        if not results:
-            return
-        role = guild.get_role(int(results.get('role_id')[0]))
-
-        # Give the member the role.
-        await member.add_roles(role)
+        # Joins arrive in bursts so buffer them per guild.
+        # Registration and role grants are then handled for the whole batch at once.
+        self.roles.queue_join(member)
 
     def run(self):
-        self.client.run(self.token)
\ No newline at end of file
+        try:
+            self.client.run(self.token)
+        finally:
+            # Write out anything still buffered once the client has closed.
+            self.log.info(f'Flushing {AUDIT.pending()} buffered audit record(s)...')
+            AUDIT.flush(force=True)
\ No newline at end of file
@@ -6,9 +6,10 @@ from discord.ext import commands
 from bot.core.checks import EcumeneCheck
 from bot.core.interactions import EcumeneConfirmRemoveClan
 from bot.core.routines import routine_before, routine_after, routine_error
-from bot.core.shared import DATABASE, BNET, DICT_OF_ALL_GRANTABLE_COMMANDS
+from bot.core.shared import DATABASE, CLANS, BNET, DICT_OF_ALL_GRANTABLE_COMMANDS
 from web.core.shared import WEB_RESOURCES
-from db.query.clans import get_all_clans_in_guild, get_clan_in_guild, delete_clan_in_guild
+from db.query.clans import delete_clan_in_guild, get_clan_registrations
+from db.query.rosters import delete_roster
 from db.query.transactions import update_transaction
 from util.encrypt import generate_state
 from util.enum import TransactionType, AuditRecordType
@@ -127,7 +128,7 @@ class Admin(commands.Cog):
         await ctx.defer(ephemeral=True)
 
         # Check if we have this clan in this guild.
-        results = get_clan_in_guild(DATABASE, str(ctx.guild.id), 'clan_id', clan)
+        results = CLANS.get_clan(str(ctx.guild.id), 'clan_id', clan)
         if not results:
             await ctx.respond("This clan is not managed by Ecumene for this server.")
             return
@@ -159,6 +160,11 @@ class Admin(commands.Cog):
 
         # Remove the clan entry.
         delete_clan_in_guild(DATABASE, str(ctx.guild.id), clan)
+        CLANS.invalidate(str(ctx.guild.id))
+
+        # Snapshots are shared between servers so only drop the roster once no server administers the clan.
+        if not get_clan_registrations(DATABASE, clan):
+            delete_roster(DATABASE, clan)
         await message.edit(f'Designated clan **{clan_name}** has been removed.', view=None)
         await routine_after(ctx, AuditRecordType.SUCCESS)
 
@@ -174,7 +180,7 @@ class Admin(commands.Cog):
         await ctx.defer(ephemeral=True)
 
         # Get clans for this server.
-        clans = get_all_clans_in_guild(DATABASE, str(ctx.guild.id))
+        clans = CLANS.get_all_clans(str(ctx.guild.id))
         if not clans:
             await ctx.respond('Ecumene does not manage any clans on this server.')
             await routine_after(ctx, AuditRecordType.FAILED_CONTEXT)
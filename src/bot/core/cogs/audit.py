@@ -4,18 +4,22 @@ from discord.commands import slash_command, SlashCommandGroup
 from discord.ext import commands
 
 from bot.core.checks import EcumeneCheck
+from bot.core.history import get_command_identifiers
 from bot.core.routines import routine_before, routine_after, routine_error
 from bot.core.shared import DATABASE, BNET, DICT_OF_ALL_COMMAND_GROUPS
 from db.query.audit import \
     get_audit_records_with_period, \
     get_audit_records_with_command_and_period, \
     get_audit_records_with_user_and_period, \
-    get_audit_records_with_target_and_period
-from util.data import make_structure, format_audit_records
+    get_audit_records_with_target_and_period, \
+    get_audit_summary_with_period, \
+    get_audit_latency_with_period
+from util.data import make_structure, format_audit_records, format_audit_summary, format_audit_histogram, format_audit_latency
 from util.enum import AuditRecordType
 from util.encrypt import generate_local
 from util.local import file_path, delete_file, write_file
 from util.time import get_current_time
+from web.core.shared import WEB_RESOURCES
 
 AUDIT_TIME_PERIODS = {
     'Last Day': 24*60*60,
@@ -23,6 +27,7 @@ AUDIT_TIME_PERIODS = {
     'Last Month': 31*24*60*60,
     'Last Year': 366*24*60*60
 }
+AUDIT_SUMMARY_LIMIT = 10 # Rows shown per breakdown in the summary embed.
 CHECKS = EcumeneCheck()
 
 class Audit(commands.Cog):
@@ -32,6 +37,8 @@ class Audit(commands.Cog):
       - /audit command <command> <period> (gets audit logs for a specific command from period to now)
       - /audit user <user> <period> (gets audit logs for a specific user from period to now)
       - /audit target <user> <period> (gets audit logs that affected a specific target from period to now)
+      - /audit summary <period> (gets aggregate usage and failure counts from period to now)
+      - /audit latency <period> (gets latency percentiles and call counts per command from period to now)
     """
     def __init__(self, log):
         self.log = log
@@ -98,10 +105,12 @@ class Audit(commands.Cog):
         # Defer response until processing is done.
         await ctx.defer()
 
-        # Obtain the equivalent lookback and command identifier from selections.
+        # Obtain the equivalent lookback and command identifiers from selections.
+        # Expanding the group lets the database match identifiers exactly instead of by pattern.
         lookback_seconds = AUDIT_TIME_PERIODS.get(period, 0)
-        command_id = DICT_OF_ALL_COMMAND_GROUPS.get(command, '%')
-        audit_records = get_audit_records_with_command_and_period(DATABASE, str(ctx.guild_id), lookback_seconds, command_id)
+        command_root = DICT_OF_ALL_COMMAND_GROUPS.get(command)
+        command_ids = get_command_identifiers(ctx.bot, command_root) or [command_root]
+        audit_records = get_audit_records_with_command_and_period(DATABASE, str(ctx.guild_id), lookback_seconds, command_ids)
 
         # If no records, we can exit quickly.
         if not audit_records:
@@ -209,10 +218,141 @@ class Audit(commands.Cog):
         delete_file(fpath)
         await routine_after(ctx, AuditRecordType.SUCCESS)
 
+    @audit.command(
+        name='summary',
+        description='Get a summary of command usage and failures within the specified period.',
+        options=[
+            discord.Option(str, name='period', description='Time period to summarise audit logs.', choices=AUDIT_TIME_PERIODS.keys())
+        ]
+    )
+    @commands.check(CHECKS.guild_is_not_blacklisted)
+    @commands.check(CHECKS.user_has_privilege)
+    async def summary(self, ctx: discord.ApplicationContext, period: str):
+
+        # Defer response until processing is done.
+        await ctx.defer()
+
+        # Obtain the equivalent lookback from select period.
+        # Aggregation happens in the database so only summary rows come back.
+        lookback_seconds = AUDIT_TIME_PERIODS.get(period, 0)
+        audit_summary = get_audit_summary_with_period(DATABASE, str(ctx.guild_id), lookback_seconds)
+
+        # If no records, we can exit quickly.
+        if not audit_summary.get('status'):
+            await ctx.respond('There are no available audit records for this period.')
+            await routine_after(ctx, AuditRecordType.SUCCESS)
+            return
+
+        # Format each breakdown.
+        commands_df = format_audit_summary(make_structure(audit_summary.get('command_id')), 'command_id')
+        users_df = format_audit_summary(make_structure(audit_summary.get('discord_id')), 'discord_id')
+        status_df = format_audit_summary(make_structure(audit_summary.get('status')), 'status')
+        output = format_audit_histogram(make_structure(audit_summary.get('day')))
+
+        total = int(status_df['total'].sum())
+        failed = int(status_df['failed'].sum())
+        embed = discord.Embed(
+            title='Audit Summary',
+            description=f"Ecumene handled {total} command(s) in the {period.lower()} with {failed} failure(s) ({failed / total:.1%})."
+        )
+        embed.add_field(
+            name='Commands',
+            value='\n'.join([
+                f"`{row.command_id}`: {row.total} ({row.failed} failed, {row.failure_rate:.1%})"
+                for row in commands_df.head(AUDIT_SUMMARY_LIMIT).itertuples()
+            ]),
+            inline=False
+        )
+        embed.add_field(
+            name='Users',
+            value='\n'.join([
+                f"<@{row.discord_id}>: {row.total} ({row.failed} failed)"
+                for row in users_df.head(AUDIT_SUMMARY_LIMIT).itertuples()
+            ]),
+            inline=False
+        )
+        embed.add_field(
+            name='Statuses',
+            value='\n'.join([
+                f"`{row.status}`: {row.total}"
+                for row in status_df.itertuples()
+            ]),
+            inline=False
+        )
+        embed.set_footer(text=f"ecumene.cc", icon_url=WEB_RESOURCES.logo)
+
+        # Temporarily store the per-day histogram locally.
+        # This is one row per day so stays small regardless of volume.
+        uid = generate_local()
+        fpath = file_path(f"audit_summary_{uid}.csv")
+        self.log.info(f"Export structure -> {fpath} ({output.shape[0]} days)")
+        write_file(output, fpath)
+
+        # Attach this file into the message.
+        # Delete from local cache.
+        await ctx.respond(embed=embed, file=discord.File(fpath))
+        delete_file(fpath)
+        await routine_after(ctx, AuditRecordType.SUCCESS)
+
+    @audit.command(
+        name='latency',
+        description='Get latency percentiles for each command within the specified period.',
+        options=[
+            discord.Option(str, name='period', description='Time period to report command latency.', choices=AUDIT_TIME_PERIODS.keys())
+        ]
+    )
+    @commands.check(CHECKS.guild_is_not_blacklisted)
+    @commands.check(CHECKS.user_has_privilege)
+    async def latency(self, ctx: discord.ApplicationContext, period: str):
+
+        # Defer response until processing is done.
+        await ctx.defer()
+
+        # Obtain the equivalent lookback from select period.
+        # Percentiles are ranked in the database so only one row per command comes back.
+        lookback_seconds = AUDIT_TIME_PERIODS.get(period, 0)
+        audit_latency = get_audit_latency_with_period(DATABASE, str(ctx.guild_id), lookback_seconds)
+
+        # If no records, we can exit quickly.
+        if not audit_latency:
+            await ctx.respond('There are no timed audit records for this period.')
+            await routine_after(ctx, AuditRecordType.SUCCESS)
+            return
+
+        # Format and limit output.
+        output = format_audit_latency(make_structure(audit_latency))
+        embed = discord.Embed(
+            title='Audit Latency',
+            description=f"Latency in milliseconds (p50/p95/p99) and average Bungie/Discord/database calls per command in the {period.lower()}."
+        )
+        embed.add_field(
+            name='Commands',
+            value='\n'.join([
+                f"`{row.command_id}` ({row.total}): {row.p50}/{row.p95}/{row.p99} ms, {row.bnet_calls}/{row.discord_calls}/{row.db_calls} calls"
+                for row in output.head(AUDIT_SUMMARY_LIMIT).itertuples()
+            ]),
+            inline=False
+        )
+        embed.set_footer(text=f"ecumene.cc", icon_url=WEB_RESOURCES.logo)
+
+        # Temporarily store the full report locally.
+        uid = generate_local()
+        fpath = file_path(f"audit_latency_{uid}.csv")
+        self.log.info(f"Export structure -> {fpath} ({output.shape[0]} commands)")
+        write_file(output, fpath)
+
+        # Attach this file into the message.
+        # Delete from local cache.
+        await ctx.respond(embed=embed, file=discord.File(fpath))
+        delete_file(fpath)
+        await routine_after(ctx, AuditRecordType.SUCCESS)
+
     @period.before_invoke
     @cmd.before_invoke
     @user.before_invoke
     @target.before_invoke
+    @summary.before_invoke
+    @latency.before_invoke
     async def audit_before(self, ctx: discord.ApplicationContext):
         await routine_before(ctx, self.log)
 
@@ -220,5 +360,7 @@ class Audit(commands.Cog):
     @cmd.error
     @user.error
     @target.error
+    @summary.error
+    @latency.error
     async def audit_error(self, ctx: discord.ApplicationContext, error):
         await routine_error(ctx, self.log, error)
\ No newline at end of file
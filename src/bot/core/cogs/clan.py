@@ -5,30 +5,67 @@ from discord.ext import commands
 from bnet.client import BungieInterfaceError
 
 from bot.core.checks import EcumeneCheck
-from bot.core.interactions import EcumeneConfirm, EcumeneConfirmKick
+from bot.core.interactions import EcumeneConfirm, EcumeneConfirmKick, EcumeneRosterView
+from bot.core.history import generate_member_record
 from bot.core.routines import routine_before, routine_after, routine_error
-from bot.core.shared import DATABASE, BNET, DICT_OF_ALL_GRANTABLE_COMMANDS, PLATFORMS, EMOJIS
+from bot.core.invites import EcumeneClanFullError
+from bot.core.shared import DATABASE, AUDIT, CLANS, MEMBERS, ADMINS, BNET, INVITES, DICT_OF_ALL_GRANTABLE_COMMANDS, PLATFORMS, EMOJIS
 from web.core.shared import WEB_RESOURCES
-from db.query.admins import get_admin_by_id
-from db.query.clans import get_all_clans_in_guild, get_clan_in_guild
-from db.query.members import get_members_matching_by_all_ids, get_member_by_id
-from util.data import make_empty_structure, make_structure, append_frames, coalesce_clan_list, format_clan_list
+from db.query.members import get_members_matching_by_all_ids
+from db.query.rosters import record_roster, get_rosters, get_roster_snapshot_times, get_roster_changes_with_period
+from util.concurrency import gather_bounded, run_blocking
+from util.data import \
+    chunks, \
+    make_empty_structure, \
+    make_structure, \
+    append_frames, \
+    parse_clan_roster, \
+    get_roster_identifiers, \
+    get_inactive_cutoff, \
+    get_rank_changes, \
+    get_display_names, \
+    filter_inactive_roster, \
+    join_clan_roster, \
+    get_roster_snapshot, \
+    format_clan_list, \
+    format_roster_changes
 from util.encrypt import generate_local
-from util.enum import AuditRecordType
+from util.enum import AuditRecordType, RosterChangeType
 from util.local import file_path, delete_file, write_file
+from util.time import get_current_time, epoch_to_discord
 
 CHECKS = EcumeneCheck()
 FILTER_INACTIVE = 'Inactive'
+CLAN_CONCURRENCY = 3 # Clan rosters assembled at once for a single command.
+ROSTER_TIME_PERIODS = {
+    'Last Day': 24*60*60,
+    'Last Week': 7*24*60*60,
+    'Last Month': 31*24*60*60
+}
+PURGE_THRESHOLDS = [30, 60, 90, 180]
+RANK_UNCHANGED = 'Unchanged'
+RANKS = {
+    'Beginner': BNET.enum.mlevels.beginner,
+    'Member': BNET.enum.mlevels.member,
+    'Admin': BNET.enum.mlevels.admin
+}
+BULK_CONCURRENCY = 3 # Administrator calls in flight at once during bulk commands.
+BULK_INTERVAL = 0.5 # Seconds between starting each administrator call during bulk commands.
+BULK_PREVIEW_LIMIT = 20 # Names listed in bulk command summaries before truncating.
+MEMBER_QUERY_LIMIT = 100 # Most members Discord will return for a single query by identifier.
 EMPTY = ""
 
 class Clan(commands.Cog):
     """
     Cog holding all clan-related functions.
     Basically allows management of the:
-      - /clan list <filter: {all|inactive}> (list users in clans and information about them)
+      - /clan list <filter: {all|inactive}> <refresh> (page through users in clans and information about them, from snapshots unless refreshed)
+      - /clan changes <period> (list joins, departures, rank changes and activity logged between roster snapshots)
       - /clan kick <user> (kick a user from the clan, has interactive prompt but can be forced)
+      - /clan purge <days> <clan> (kick every member inactive for longer than some days, after a dry run)
       - /clan join <role> (doesn't actually join the clan, but prompts admin account to send a clan invite)
       - /clan rank <user> (this is used to promote and demote users)
+      - /clan ranks <role> <rank> <others> <inactive> <clan> (set ranks in bulk from a role and activity rule)
       - /clan status <role> (check the status of invites for the specified clan)
       - /clan invite <method> <user> <clan> (send or cancel invite for a user)
       - /clan request <method> <user> <clan> (accept or reject a pending request to join)
@@ -44,120 +81,159 @@ class Clan(commands.Cog):
         "Clan administration and user management."
     )
 
+    async def _resolve_members_(self, guild: discord.Guild, user_ids):
+        """
+        Resolve guild members by identifier, keyed by the identifier as given.
+        The gateway cache is checked first and any misses are queried in batches, caching what is found.
+        Users not in the guild are simply left out.
+        """
+        resolved = dict()
+        missing = list()
+        for user_id in user_ids:
+            member = guild.get_member(int(user_id))
+            if member:
+                resolved[user_id] = member
+            else:
+                missing.append(int(user_id))
+        for batch in chunks(missing, MEMBER_QUERY_LIMIT):
+            try:
+                found = await guild.query_members(user_ids=batch, limit=MEMBER_QUERY_LIMIT, cache=True)
+            except Exception as e:
+                # Leave this batch unresolved rather than failing the whole list.
+                self.log.warning(f'Unable to query {len(batch)} member(s) in guild {guild.id}: {e}')
+                continue
+            for member in found:
+                resolved[str(member.id)] = member
+        return resolved
+
+    async def _build_roster_(self, clan_id, inactive_only=False):
+        """
+        Build a clan's roster live and store it as the clan's latest snapshot.
+        Only inactive members are matched when asked, in which case the partial roster is not stored.
+        """
+
+        # Get all members from Bungie for the clan and match them with registrations.
+        # These block so run them off the event loop to let other clans proceed.
+        results = await run_blocking(BNET.get_members_in_group, clan_id)
+        details = parse_clan_roster(results, EMPTY)
+        if inactive_only:
+            # Activity is known from Bungie alone so drop active members before any enrichment.
+            details = filter_inactive_roster(details)
+        search_bnet, search_destiny = get_roster_identifiers(details, EMPTY)
+        records = await run_blocking(
+            get_members_matching_by_all_ids,
+            DATABASE,
+            search_bnet,
+            search_destiny
+        )
+        roster = join_clan_roster(details, records, EMPTY)
+        if inactive_only:
+            return roster
+
+        # The fetch has already been paid for so keep the snapshot current too.
+        try:
+            snapshot = get_roster_snapshot(roster, clan_id, get_current_time())
+            await run_blocking(record_roster, DATABASE, clan_id, snapshot)
+        except Exception as e:
+            self.log.warning(f'Unable to store roster snapshot for clan {clan_id}: {e}')
+        return roster
+
+    async def _describe_members_(self, guild: discord.Guild, roster):
+        """Add guild names and top roles for every registered member in a roster."""
+        roster['discord_name'] = EMPTY
+        roster['discord_role'] = EMPTY
+        if 'discord_id' not in roster.columns:
+            return
+
+        # Capture user names from server in one pass rather than a request per user.
+        user_ids = roster.loc[roster['discord_id'].notnull(), 'discord_id'].unique().tolist()
+        users = await self._resolve_members_(guild, user_ids)
+        names = {user_id: f"{user.name}#{user.discriminator}" for user_id, user in users.items()}
+        roles = {user_id: user.roles[-1] for user_id, user in users.items()} # First role is the everyone role. This will be the highest server role.
+        roster['discord_name'] = roster['discord_id'].map(names).fillna(EMPTY)
+        roster['discord_role'] = roster['discord_id'].map(roles).fillna(EMPTY)
+
+    async def _export_roster_(self, interaction: discord.Interaction, output):
+        """Send a roster as a file in reply to an interaction."""
+
+        # Temporarily store this file locally.
+        uid = generate_local()
+        fpath = file_path(f"list_{uid}.csv")
+        self.log.info(f"Export structure -> {fpath} ({output.shape[0]} records)")
+        write_file(output, fpath)
+
+        # Attach this file into the message.
+        # Delete from local cache.
+        await interaction.followup.send(file=discord.File(fpath))
+        delete_file(fpath)
+
     @clan.command(
         name='list',
         description='List all clan members and their details.',
         options=[
-            discord.Option(str, name='filter', description='Filter members based on criteria.', choices=['All', FILTER_INACTIVE])
+            discord.Option(str, name='filter', description='Filter members based on criteria.', choices=['All', FILTER_INACTIVE]),
+            discord.Option(bool, name='refresh', description='Rebuild rosters live rather than using the latest snapshot.', required=False, default=False)
         ]
     )
     @commands.check(CHECKS.guild_is_not_blacklisted)
     @commands.check(CHECKS.user_has_privilege)
-    async def members(self, ctx: discord.ApplicationContext, filter: str):
+    async def members(self, ctx: discord.ApplicationContext, filter: str, refresh: bool):
         
         # Defer response until processing is done.
         await ctx.defer()
 
-        # Get all clans registered in this guild from the database.
-        clans = get_all_clans_in_guild(DATABASE, str(ctx.guild.id))
+        # Get all clans registered in this guild from the clan directory.
+        clans = CLANS.get_all_clans(str(ctx.guild.id))
         if not clans:
             await ctx.respond("There are no clans configured for this guild.")
             await routine_after(ctx, AuditRecordType.FAILED_CONTEXT)
             return
+        clan_names = dict(zip(clans.get('clan_id'), clans.get('clan_name')))
+
+        # Filtering happens before any enrichment so only the members listed are matched and resolved.
+        inactive_only = filter == FILTER_INACTIVE
+        last_online_before = get_inactive_cutoff() if inactive_only else None
+
+        # Serve rosters from the scheduled snapshots unless asked to refresh.
+        rosters = dict()
+        snapshot_at = None
+        if not refresh:
+            snapshot_times = await run_blocking(get_roster_snapshot_times, DATABASE, list(clan_names.keys()))
+            if snapshot_times:
+                snapshot_at = min(snapshot_times.get('snapshot_at'))
+                snapshots = make_structure(await run_blocking(get_rosters, DATABASE, snapshot_times.get('clan_id'), last_online_before))
+                for clan_id in snapshot_times.get('clan_id'):
+                    roster = make_empty_structure()
+                    if not snapshots.empty:
+                        roster = snapshots.loc[snapshots['clan_id'] == clan_id]
+                    rosters[clan_id] = roster.drop(columns=['clan_id', 'snapshot_at'], errors='ignore')
+
+        # Anything without a snapshot yet is built live, each clan concurrently.
+        # Any failure is raised so the command errors as it would have before.
+        stale = [clan_id for clan_id in clan_names if clan_id not in rosters]
+        built = await gather_bounded(
+            [self._build_roster_(clan_id, inactive_only) for clan_id in stale],
+            CLAN_CONCURRENCY,
+            return_exceptions=False
+        )
+        rosters.update(zip(stale, built))
 
-        # Construct member details.
+        # Combine every clan and add guild details for the whole lot at once.
         members = make_empty_structure()
-        for clan_id, clan_name in zip(clans.get('clan_id'), clans.get('clan_name')):
-
-            # Describe how returns will be handled.
-            detail_map = {
-                'bnet_id': list(),
-                'destiny_id': list(),
-                'bungie_name': list(),
-                'join_date': list(),
-                'last_online': list()
-            }
-            records_map = {
-                'discord_id': list(),
-                'discord_name': list(),
-                'discord_role': list()
-            }
-
-            # Get all members from Bungie for each clan.
-            results = BNET.get_members_in_group(clan_id)
-            for member in results:
-                # Capture identifier and last online activity.
-                # The user's global display information may only be contained in one key! (Why Bungie?!)
-                # It's also possible for the user to not have a Bungie.net login!
-                bnet_info = member.get('bungieNetUserInfo') or dict()
-                destiny_info = member.get('destinyUserInfo')
-                display_name = bnet_info.get('bungieGlobalDisplayName') or destiny_info.get('bungieGlobalDisplayName')
-                display_code = bnet_info.get('bungieGlobalDisplayNameCode') or destiny_info.get('bungieGlobalDisplayNameCode')
-                join_date = member.get('joinDate')
-                # Leave display names null if they're incomplete.
-                bungie_name = None
-                if display_name and display_code:
-                    bungie_name = f"{display_name}#{str(display_code).zfill(4)}"
-                detail_map['bnet_id'].append(str(bnet_info.get('membershipId', EMPTY)))
-                detail_map['destiny_id'].append(str(destiny_info.get('membershipId', EMPTY)))
-                detail_map['bungie_name'].append(bungie_name)
-                detail_map['join_date'].append(join_date)
-                detail_map['last_online'].append(member.get('lastOnlineStatusChange'))
-            details = make_structure(detail_map)
-
-            # Extract database member information.
-            search_bnet = details.loc[(details['bnet_id'].notnull()) & (details['bnet_id'] != EMPTY), 'bnet_id'].to_list()
-            search_destiny = details.loc[(details['destiny_id'].notnull()) & (details['destiny_id'] != EMPTY), 'destiny_id'].to_list()
-            records = get_members_matching_by_all_ids(
-                DATABASE,
-                search_bnet,
-                search_destiny
-            )
-            struct = make_empty_structure()
-            if records:            
-                for user_id in records.get('discord_id'):
-                    user_discord_name = EMPTY
-                    user_discord_role = EMPTY
-                    # Capture user name from server.
-                    try:
-                        # This invokes a call to the Discord API so it can error.
-                        # It also causes significant slowdown of this function.
-                        user = await ctx.guild.fetch_member(user_id)
-                        user_discord_name = f"{user.name}#{user.discriminator}"
-                        roles = user.roles
-                        user_discord_role = roles[-1] # First role is the everyone role. This will be the highest server role.
-                    except Exception:
-                        # User is not in guild or somehow role get fails.
-                        pass
-                    records_map['discord_id'].append(user_id)
-                    records_map['discord_name'].append(user_discord_name)
-                    records_map['discord_role'].append(user_discord_role)
-                struct = make_structure(records)
-                for property in ['discord_name', 'discord_role']:
-                    struct[property] = struct['discord_id'].map(
-                        dict(
-                            zip(
-                                records_map.get('discord_id'), 
-                                records_map.get(property)
-                            )
-                        )
-                    )
-
-            # Structure and append additional details.
-            clan_members = details
-            if not struct.empty:
-                clan_members = coalesce_clan_list(details, struct, EMPTY)
+        for clan_id, clan_name in clan_names.items():
+            clan_members = rosters.get(clan_id).copy()
             clan_members['clan_id'] = clan_id
             clan_members['clan_name'] = clan_name
             members = append_frames(members, clan_members)
+        if members.empty:
+            await ctx.respond("There are no clan members matching this filter.")
+            await routine_after(ctx, AuditRecordType.SUCCESS)
+            return
+        await self._describe_members_(ctx.guild, members)
 
         # Processing of columns to make this human-readable.
         format_clan_list(members)
 
-        # Basic filtering of list based on status.
-        if filter == FILTER_INACTIVE:
-            members = members.loc[members['status'] == 'Inactive'] # Kinda hardcoded but it'll be fine for now.
-
         # Final output columns for the "pretty" output.
         output_cols = [
             'clan_id',
@@ -179,15 +255,60 @@ class Clan(commands.Cog):
                 members[col] = EMPTY
         output = members.loc[:, output_cols]
 
+        # Show the roster a page at a time, only writing the full export if asked for.
+        content = None
+        if snapshot_at is not None:
+            content = f"Rosters are from a snapshot taken {epoch_to_discord(snapshot_at, 'R')}. Use `refresh` to rebuild them live."
+        view = EcumeneRosterView(output, f"{ctx.guild.name} Clan Roster", self._export_roster_)
+        view.message = await ctx.respond(content=content, embed=view.render(), view=view)
+        await routine_after(ctx, AuditRecordType.SUCCESS)
+
+    @clan.command(
+        name='changes',
+        description='List joins, departures, rank changes and activity across clans within the specified period.',
+        options=[
+            discord.Option(str, name='period', description='Time period to query for roster changes.', choices=ROSTER_TIME_PERIODS.keys())
+        ]
+    )
+    @commands.check(CHECKS.guild_is_not_blacklisted)
+    @commands.check(CHECKS.user_has_privilege)
+    async def changes(self, ctx: discord.ApplicationContext, period: str):
+
+        # Defer response until processing is done.
+        await ctx.defer()
+
+        # Get all clans registered in this guild from the clan directory.
+        clans = CLANS.get_all_clans(str(ctx.guild.id))
+        if not clans:
+            await ctx.respond("There are no clans configured for this guild.")
+            await routine_after(ctx, AuditRecordType.FAILED_CONTEXT)
+            return
+        clan_names = dict(zip(clans.get('clan_id'), clans.get('clan_name')))
+
+        # Only the logged deltas are read, never whole rosters.
+        lookback_seconds = ROSTER_TIME_PERIODS.get(period, 0)
+        changes = get_roster_changes_with_period(DATABASE, list(clan_names.keys()), lookback_seconds)
+        if not changes:
+            await ctx.respond('There are no roster changes for this period.')
+            await routine_after(ctx, AuditRecordType.SUCCESS)
+            return
+
+        # Make structure, format and summarise.
+        struct = make_structure(changes)
+        struct['clan_name'] = struct['clan_id'].map(clan_names)
+        output = format_roster_changes(struct)
+        counts = output['change_type'].value_counts()
+        summary = ', '.join(f"{counts.get(change.value, 0)} {change.value.replace('_', ' ')}" for change in RosterChangeType)
+
         # Temporarily store this file locally.
         uid = generate_local()
-        fpath = file_path(f"list_{uid}.csv")
+        fpath = file_path(f"changes_{uid}.csv")
         self.log.info(f"Export structure -> {fpath} ({output.shape[0]} records)")
         write_file(output, fpath)
-        
+
         # Attach this file into the message.
         # Delete from local cache.
-        await ctx.respond(file=discord.File(fpath))
+        await ctx.respond(content=f"Roster changes for {period.lower()}: {summary}.", file=discord.File(fpath))
         delete_file(fpath)
         await routine_after(ctx, AuditRecordType.SUCCESS)
 
@@ -213,7 +334,7 @@ class Clan(commands.Cog):
             return
 
         # Get the member record for this user.
-        member = get_member_by_id(DATABASE, 'discord_id', str(user.id))
+        member = MEMBERS.get_member(str(user.id))
         if not member:
             await ctx.respond(f"User {user.mention} is not registered with Ecumene.")
             await routine_after(ctx, AuditRecordType.FAILED_CONTEXT)
@@ -240,7 +361,7 @@ class Clan(commands.Cog):
             user_membership_type = destiny_info.get('membershipType')
 
             # Pull the group administrator and credentials.
-            clan = get_clan_in_guild(DATABASE, str(ctx.guild.id), 'clan_id', group_id)
+            clan = CLANS.get_clan(str(ctx.guild.id), 'clan_id', group_id)
             if not clan:
                 continue
 
@@ -287,15 +408,16 @@ class Clan(commands.Cog):
         for kickable in to_kick:
 
             # This hopefully(?) always exists in the database.
-            # TODO: Needs a retry block in case of background token refresh causing a race condition. 
-            admin = get_admin_by_id(DATABASE, kickable.get('admin_id'))
+            # Credentials are cached and calls are retried once if the token was rotated underneath us.
+            admin_id = kickable.get('admin_id')
 
             # Now we can kick the user directly.
             group_id = kickable.get('group_id')
             group_name = kickable.get('group_name')
             try:
-                BNET.kick_member_from_group(
-                    admin.get('access_token')[0],
+                ADMINS.call(
+                    admin_id,
+                    BNET.kick_member_from_group,
                     kickable.get('group_id'),
                     kickable.get('membership_type'),
                     member.get('destiny_id')[0]
@@ -314,6 +436,139 @@ class Clan(commands.Cog):
         await message.edit(f"Kicked {user.mention} from {', '.join(kicked)}.", view=None)
         await routine_after(ctx, AuditRecordType.SUCCESS)
 
+    async def _call_for_member_(self, ctx: discord.ApplicationContext, index, admin_id, method, pairs, *args):
+        """Make one administrator call on behalf of a bulk command, leaving an audit record for the member either way."""
+        try:
+            # Credentials are cached and calls are retried once if the token was rotated underneath us.
+            await run_blocking(ADMINS.call, admin_id, method, *args)
+            status = AuditRecordType.SUCCESS
+        except BungieInterfaceError:
+            status = AuditRecordType.FAILED_ERROR
+        except Exception as e:
+            # Anything unexpected fails this member only, the rest of the batch carries on.
+            self.log.error(f'Unexpected failure calling {method.__name__} for {pairs}: {e}')
+            status = AuditRecordType.FAILED_ERROR
+        record = generate_member_record(ctx, index, pairs, status)
+        await AUDIT.insert(record.as_data(non_null_only=False), record.options_as_data())
+        return status == AuditRecordType.SUCCESS
+
+    @clan.command(
+        name='purge',
+        description='Kick every member who has been inactive for longer than the threshold.',
+        options=[
+            discord.Option(int, name='days', description='Days since last online before a member is purged.', choices=PURGE_THRESHOLDS),
+            discord.Option(discord.Role, name='clan', description='Only purge this clan.', required=False)
+        ]
+    )
+    @commands.check(CHECKS.guild_is_not_blacklisted)
+    @commands.check(CHECKS.user_has_privilege)
+    async def purge(self, ctx: discord.ApplicationContext, days: int, clan: discord.Role):
+
+        # Defer response until processing is done.
+        # Note the ephemeral deferral is required to hide the message.
+        await ctx.defer(ephemeral=True)
+
+        # Purge everything managed in this guild unless a single clan was given.
+        if clan:
+            clans = CLANS.get_clan(str(ctx.guild.id), 'role_id', str(clan.id))
+        else:
+            clans = CLANS.get_all_clans(str(ctx.guild.id))
+        if not clans:
+            await ctx.respond("There are no matching clans configured for this guild.")
+            await routine_after(ctx, AuditRecordType.FAILED_CONTEXT)
+            return
+
+        # Always read rosters live so nobody is kicked on stale activity.
+        clan_ids = clans.get('clan_id')
+        results = await gather_bounded(
+            [run_blocking(BNET.get_members_in_group, clan_id) for clan_id in clan_ids],
+            CLAN_CONCURRENCY,
+            return_exceptions=False
+        )
+
+        # Work out who would be kicked. Administrators and founders are never purged.
+        to_kick = list()
+        summary = list()
+        for clan_id, clan_name, admin_id, result in zip(clan_ids, clans.get('clan_name'), clans.get('admin_id'), results):
+            roster = filter_inactive_roster(parse_clan_roster(result, EMPTY), days*24*60*60)
+            roster = roster.loc[roster['member_type'] < BNET.enum.mlevels.admin]
+            for member in roster.to_dict('records'):
+                to_kick.append({
+                    'admin_id': admin_id,
+                    'clan_id': clan_id,
+                    'clan_name': clan_name,
+                    'destiny_id': member.get('destiny_id'),
+                    'membership_type': member.get('membership_type'),
+                    'bungie_name': member.get('bungie_name') or member.get('destiny_id')
+                })
+            if not roster.empty:
+                summary.append(f"**{clan_name}#{clan_id}**: {roster.shape[0]} member(s)")
+
+        if not to_kick:
+            await ctx.respond(f"Nobody has been inactive for more than {days} days.")
+            await routine_after(ctx, AuditRecordType.SUCCESS)
+            return
+
+        # Dry run first. Nothing happens until this is confirmed.
+        preview = ', '.join(kickable.get('bungie_name') for kickable in to_kick[:BULK_PREVIEW_LIMIT])
+        if len(to_kick) > BULK_PREVIEW_LIMIT:
+            preview += f" and {len(to_kick) - BULK_PREVIEW_LIMIT} more"
+        view = EcumeneConfirmKick()
+        message = await ctx.respond(
+            f"This will kick {len(to_kick)} member(s) inactive for more than {days} days.\n" + 
+            '\n'.join(summary) + 
+            f"\n\n{preview}\n\nAre you sure?", 
+            view=view
+        )
+
+        # Wait for the view to stop listening for input.
+        await view.wait()
+        if view.value is None:
+            # The view timed out - not sure how long the interaction lives for.
+            await message.edit('Your request has timed out.', view=None)
+            await routine_after(ctx, AuditRecordType.FAILED_TIMEOUT)
+            return
+        elif view.value:
+            # Confirmed - continue function execution.
+            pass
+        else:
+            # Cancelled - remove view and respond to user. Exit command.
+            await message.edit('Your request has been cancelled.', view=None)
+            await routine_after(ctx, AuditRecordType.CANCELLED)
+            return
+
+        # Kick with bounded concurrency, spacing requests to stay under Bungie's rate limits.
+        await message.edit(f"Purging {len(to_kick)} member(s)...", view=None)
+        kicked = await gather_bounded(
+            [
+                self._call_for_member_(
+                    ctx,
+                    index,
+                    kickable.get('admin_id'),
+                    BNET.kick_member_from_group,
+                    [('target', kickable.get('destiny_id')), ('clan', kickable.get('clan_id'))],
+                    kickable.get('clan_id'),
+                    kickable.get('membership_type'),
+                    kickable.get('destiny_id')
+                ) for index, kickable in enumerate(to_kick)
+            ],
+            BULK_CONCURRENCY,
+            return_exceptions=True,
+            interval=BULK_INTERVAL
+        )
+
+        # Final report. Anything other than a success, including a raised exception, counts as a failure.
+        failed = [kickable.get('bungie_name') for kickable, success in zip(to_kick, kicked) if success is not True]
+        report = f"Purged {len(to_kick) - len(failed)} of {len(to_kick)} inactive member(s)."
+        if failed:
+            report += f"\nUnable to kick: {', '.join(failed[:BULK_PREVIEW_LIMIT])}"
+            if len(failed) > BULK_PREVIEW_LIMIT:
+                report += f" and {len(failed) - BULK_PREVIEW_LIMIT} more"
+            report += ". Check clan admin configuration."
+        self.log.info(f"Purged {len(to_kick) - len(failed)} of {len(to_kick)} member(s) in guild {ctx.guild.id}")
+        await message.edit(report)
+        await routine_after(ctx, AuditRecordType.SUCCESS if not failed else AuditRecordType.FAILED_ERROR)
+
     @clan.command(
         name='rank',
         description='Promote or demote the specific user within the clan.',
@@ -348,7 +603,7 @@ class Clan(commands.Cog):
             return
 
         # Get the member record for this user.
-        member = get_member_by_id(DATABASE, 'discord_id', str(user.id))
+        member = MEMBERS.get_member(str(user.id))
         if not member:
             await ctx.respond(f"User {user.mention} is not registered with Ecumene.")
             await routine_after(ctx, AuditRecordType.FAILED_CONTEXT)
@@ -375,7 +630,7 @@ class Clan(commands.Cog):
             user_membership_type = destiny_info.get('membershipType')
 
             # Pull the group administrator and credentials.
-            clan = get_clan_in_guild(DATABASE, str(ctx.guild.id), 'clan_id', group_id)
+            clan = CLANS.get_clan(str(ctx.guild.id), 'clan_id', group_id)
             if not clan:
                 continue
 
@@ -422,15 +677,16 @@ class Clan(commands.Cog):
         for settable in to_set:
 
             # This hopefully(?) always exists in the database.
-            # TODO: Needs a retry block in case of background token refresh causing a race condition. 
-            admin = get_admin_by_id(DATABASE, settable.get('admin_id'))
+            # Credentials are cached and calls are retried once if the token was rotated underneath us.
+            admin_id = settable.get('admin_id')
 
             # Now we can kick the user directly.
             group_id = settable.get('group_id')
             group_name = settable.get('group_name')
             try:
-                BNET.set_membership_level(
-                    admin.get('access_token')[0],
+                ADMINS.call(
+                    admin_id,
+                    BNET.set_membership_level,
                     settable.get('group_id'),
                     settable.get('membership_type'),
                     member.get('destiny_id')[0],
@@ -450,6 +706,141 @@ class Clan(commands.Cog):
         await message.edit(f"Set {user.mention} to **{rank}** in {', '.join(was_set)}.", view=None)
         await routine_after(ctx, AuditRecordType.SUCCESS)
 
+    @clan.command(
+        name='ranks',
+        description='Set clan ranks in bulk from a Discord role and activity rule.',
+        options=[
+            discord.Option(discord.Role, name='role', description='Members with this role get the rank.'),
+            discord.Option(str, name='rank', description='Rank for members with the role.', choices=['Member', 'Admin']),
+            discord.Option(str, name='others', description='Rank for everyone else.', choices=[RANK_UNCHANGED, 'Beginner', 'Member']),
+            discord.Option(str, name='inactive', description='Rank for inactive members without the role.', choices=[RANK_UNCHANGED, 'Beginner', 'Member'], required=False, default=RANK_UNCHANGED),
+            discord.Option(discord.Role, name='clan', description='Only rank this clan.', required=False)
+        ]
+    )
+    @commands.check(CHECKS.guild_is_not_blacklisted)
+    @commands.check(CHECKS.user_has_privilege)
+    async def ranks(self, ctx: discord.ApplicationContext, role: discord.Role, rank: str, others: str, inactive: str, clan: discord.Role):
+
+        # Defer response until processing is done.
+        # Note the ephemeral deferral is required to hide the message.
+        await ctx.defer(ephemeral=True)
+
+        # Rank everything managed in this guild unless a single clan was given.
+        if clan:
+            clans = CLANS.get_clan(str(ctx.guild.id), 'role_id', str(clan.id))
+        else:
+            clans = CLANS.get_all_clans(str(ctx.guild.id))
+        if not clans:
+            await ctx.respond("There are no matching clans configured for this guild.")
+            await routine_after(ctx, AuditRecordType.FAILED_CONTEXT)
+            return
+
+        # Always read rosters live so current ranks are accurate, then match them to Discord users.
+        clan_ids = clans.get('clan_id')
+        results = await gather_bounded(
+            [run_blocking(BNET.get_members_in_group, clan_id) for clan_id in clan_ids],
+            CLAN_CONCURRENCY,
+            return_exceptions=False
+        )
+        holder_ids = set(str(holder.id) for holder in role.members)
+
+        # Only members whose rank differs from the rule are changed.
+        # Founders are never touched and neither is the account every clan command is authorised through.
+        to_set = list()
+        summary = list()
+        for clan_id, clan_name, admin_id, result in zip(clan_ids, clans.get('clan_name'), clans.get('admin_id'), results):
+            details = parse_clan_roster(result, EMPTY)
+            search_bnet, search_destiny = get_roster_identifiers(details, EMPTY)
+            records = await run_blocking(get_members_matching_by_all_ids, DATABASE, search_bnet, search_destiny)
+            changes = get_rank_changes(
+                join_clan_roster(details, records, EMPTY),
+                holder_ids,
+                RANKS.get(rank),
+                other_rank=RANKS.get(others),
+                inactive_rank=RANKS.get(inactive),
+                protected_rank=BNET.enum.mlevels.actingfounder,
+                protected_ids=[admin_id]
+            )
+            for member, name in zip(changes.to_dict('records'), get_display_names(changes, EMPTY)):
+                to_set.append({
+                    'admin_id': admin_id,
+                    'clan_id': clan_id,
+                    'destiny_id': member.get('destiny_id'),
+                    'membership_type': member.get('membership_type'),
+                    'rank': int(member.get('target_rank')),
+                    'bungie_name': name
+                })
+            if not changes.empty:
+                promoted = int((changes['target_rank'] > changes['member_type']).sum())
+                summary.append(f"**{clan_name}#{clan_id}**: {promoted} promotion(s), {changes.shape[0] - promoted} demotion(s)")
+
+        if not to_set:
+            await ctx.respond("Every rank already matches this rule.")
+            await routine_after(ctx, AuditRecordType.SUCCESS)
+            return
+
+        # Dry run first. Nothing happens until this is confirmed.
+        rank_names = {value: name for name, value in RANKS.items()}
+        preview = ', '.join(f"{settable.get('bungie_name')} → {rank_names.get(settable.get('rank'))}" for settable in to_set[:BULK_PREVIEW_LIMIT])
+        if len(to_set) > BULK_PREVIEW_LIMIT:
+            preview += f" and {len(to_set) - BULK_PREVIEW_LIMIT} more"
+        view = EcumeneConfirm()
+        message = await ctx.respond(
+            f"This will change the rank of {len(to_set)} member(s). Founders and the clan administrator account are never changed.\n" + 
+            '\n'.join(summary) + 
+            f"\n\n{preview}\n\nAre you sure?", 
+            view=view
+        )
+
+        # Wait for the view to stop listening for input.
+        await view.wait()
+        if view.value is None:
+            # The view timed out - not sure how long the interaction lives for.
+            await message.edit('Your request has timed out.', view=None)
+            await routine_after(ctx, AuditRecordType.FAILED_TIMEOUT)
+            return
+        elif view.value:
+            # Confirmed - continue function execution.
+            pass
+        else:
+            # Cancelled - remove view and respond to user. Exit command.
+            await message.edit('Your request has been cancelled.', view=None)
+            await routine_after(ctx, AuditRecordType.CANCELLED)
+            return
+
+        # Set ranks with bounded concurrency, spacing requests to stay under Bungie's rate limits.
+        await message.edit(f"Changing {len(to_set)} rank(s)...", view=None)
+        was_set = await gather_bounded(
+            [
+                self._call_for_member_(
+                    ctx,
+                    index,
+                    settable.get('admin_id'),
+                    BNET.set_membership_level,
+                    [('target', settable.get('destiny_id')), ('clan', settable.get('clan_id')), ('level', str(settable.get('rank')))],
+                    settable.get('clan_id'),
+                    settable.get('membership_type'),
+                    settable.get('destiny_id'),
+                    settable.get('rank')
+                ) for index, settable in enumerate(to_set)
+            ],
+            BULK_CONCURRENCY,
+            return_exceptions=True,
+            interval=BULK_INTERVAL
+        )
+
+        # Final report. Anything other than a success, including a raised exception, counts as a failure.
+        failed = [settable.get('bungie_name') for settable, success in zip(to_set, was_set) if success is not True]
+        report = f"Changed {len(to_set) - len(failed)} of {len(to_set)} rank(s)."
+        if failed:
+            report += f"\nUnable to change: {', '.join(failed[:BULK_PREVIEW_LIMIT])}"
+            if len(failed) > BULK_PREVIEW_LIMIT:
+                report += f" and {len(failed) - BULK_PREVIEW_LIMIT} more"
+            report += ". Check clan admin configuration."
+        self.log.info(f"Changed {len(to_set) - len(failed)} of {len(to_set)} rank(s) in guild {ctx.guild.id}")
+        await message.edit(report)
+        await routine_after(ctx, AuditRecordType.SUCCESS if not failed else AuditRecordType.FAILED_ERROR)
+
     @clan.command(
         name='status',
         description='Check members and invites for a specific clan.',
@@ -466,7 +857,7 @@ class Clan(commands.Cog):
 
         # Identify the clan based on the role mentioned.
         # Pull the group administrator and credentials.
-        group = get_clan_in_guild(DATABASE, str(ctx.guild.id), 'role_id', str(clan.id))
+        group = CLANS.get_clan(str(ctx.guild.id), 'role_id', str(clan.id))
         if not group:
             await ctx.respond(f"There is no clan associated with {clan.mention}.")
             await routine_after(ctx, AuditRecordType.FAILED_CONTEXT)
@@ -474,14 +865,14 @@ class Clan(commands.Cog):
         group_id = group.get('clan_id')[0]
         group_name = group.get('clan_name')[0]
 
-        # TODO: Needs a retry block in case of background token refresh causing a race condition. 
-        admin = get_admin_by_id(DATABASE, group.get('admin_id')[0])
+        # Credentials are cached and calls are retried once if the token was rotated underneath us.
+        admin_id = group.get('admin_id')[0]
 
         # Try and obtain group information.
         try:
             detail = BNET.get_group_by_id(group_id)
-            invited = BNET.get_invited_individuals(admin.get('access_token')[0], group_id)
-            pending = BNET.get_pending_in_group(admin.get('access_token')[0], group_id)
+            invited = ADMINS.call(admin_id, BNET.get_invited_individuals, group_id)
+            pending = ADMINS.call(admin_id, BNET.get_pending_in_group, group_id)
         except BungieInterfaceError:
             # Data retrieval failed. Throw a simple error.
             await ctx.respond(f"Failed to obtain information for {clan.mention}.")
@@ -564,7 +955,7 @@ class Clan(commands.Cog):
 
         # Identify the clan based on the role mentioned.
         # Pull the group administrator and credentials.
-        group = get_clan_in_guild(DATABASE, str(ctx.guild.id), 'role_id', str(clan.id))
+        group = CLANS.get_clan(str(ctx.guild.id), 'role_id', str(clan.id))
         if not group:
             await ctx.respond(f"There is no clan associated with {clan.mention}.")
             await routine_after(ctx, AuditRecordType.FAILED_CONTEXT)
@@ -572,14 +963,14 @@ class Clan(commands.Cog):
         group_id = group.get('clan_id')[0]
 
         # Get the member record for this user.
-        member = get_member_by_id(DATABASE, 'discord_id', str(user.id))
+        member = MEMBERS.get_member(str(user.id))
         if not member:
             await ctx.respond(f"User {user.mention} is not registered with Ecumene.")
             await routine_after(ctx, AuditRecordType.FAILED_CONTEXT)
             return
 
-        # TODO: Needs a retry block in case of background token refresh causing a race condition. 
-        admin = get_admin_by_id(DATABASE, group.get('admin_id')[0])
+        # Credentials are cached and calls are retried once if the token was rotated underneath us.
+        admin_id = group.get('admin_id')[0]
 
         # Passthrough in case method is poorly configured.
         if not method:
@@ -587,8 +978,9 @@ class Clan(commands.Cog):
 
         elif method == 'Send':
             try:
-                BNET.invite_user_to_group(
-                    admin.get('access_token')[0],
+                ADMINS.call(
+                    admin_id,
+                    BNET.invite_user_to_group,
                     group_id,
                     member.get('destiny_mtype')[0],
                     member.get('destiny_id')[0]
@@ -606,8 +998,9 @@ class Clan(commands.Cog):
 
         elif method == 'Cancel':
             try:
-                BNET.cancel_invite_to_group(
-                    admin.get('access_token')[0], 
+                ADMINS.call(
+                    admin_id,
+                    BNET.cancel_invite_to_group,
                     group_id, 
                     member.get('destiny_mtype')[0],  
                     member.get('destiny_id')[0]
@@ -646,7 +1039,7 @@ class Clan(commands.Cog):
 
         # Identify the clan based on the role mentioned.
         # Pull the group administrator and credentials.
-        group = get_clan_in_guild(DATABASE, str(ctx.guild.id), 'role_id', str(clan.id))
+        group = CLANS.get_clan(str(ctx.guild.id), 'role_id', str(clan.id))
         if not group:
             await ctx.respond(f"There is no clan associated with {clan.mention}.")
             await routine_after(ctx, AuditRecordType.FAILED_CONTEXT)
@@ -654,23 +1047,24 @@ class Clan(commands.Cog):
         group_id = group.get('clan_id')[0]
 
         # Get the member record for this user.
-        member = get_member_by_id(DATABASE, 'discord_id', str(user.id))
+        member = MEMBERS.get_member(str(user.id))
         if not member:
             await ctx.respond(f"User {user.mention} is not registered with Ecumene.")
             await routine_after(ctx, AuditRecordType.FAILED_CONTEXT)
             return
 
-        # TODO: Needs a retry block in case of background token refresh causing a race condition. 
-        admin = get_admin_by_id(DATABASE, group.get('admin_id')[0])
+        # Credentials are cached and calls are retried once if the token was rotated underneath us.
+        admin_id = group.get('admin_id')[0]
 
         # Passthrough in case method is poorly configured.
         if not method:
             pass
 
-        elif method == 'Accept':
+        elif method == 'Approve':
             try:
-                BNET.accept_request_to_join_group(
-                    admin.get('access_token')[0],
+                ADMINS.call(
+                    admin_id,
+                    BNET.accept_request_to_join_group,
                     group_id,
                     member.get('destiny_mtype')[0],
                     member.get('destiny_id')[0]
@@ -688,8 +1082,9 @@ class Clan(commands.Cog):
 
         elif method == 'Deny':
             try:
-                BNET.deny_request_to_join_group(
-                    admin.get('access_token')[0], 
+                ADMINS.call(
+                    admin_id,
+                    BNET.deny_request_to_join_group,
                     group_id, 
                     member.get('destiny_mtype')[0],  
                     member.get('destiny_id')[0]
@@ -746,7 +1141,7 @@ class Clan(commands.Cog):
         # Identify the clan based on the role mentioned.
         # Pull the group administrator and credentials.
         if clan:
-            group = get_clan_in_guild(DATABASE, str(ctx.guild.id), 'role_id', str(clan.id))
+            group = CLANS.get_clan(str(ctx.guild.id), 'role_id', str(clan.id))
             if not group:
                 await ctx.respond(f"There is no clan associated with {clan.mention}.")
                 await routine_after(ctx, AuditRecordType.FAILED_CONTEXT)
@@ -791,7 +1186,7 @@ class Clan(commands.Cog):
                 user_membership_type = destiny_info.get('membershipType')
 
                 # Pull the group administrator and credentials.
-                clan = get_clan_in_guild(DATABASE, str(ctx.guild.id), 'clan_id', group_id)
+                clan = CLANS.get_clan(str(ctx.guild.id), 'clan_id', group_id)
                 if not clan:
                     continue
 
@@ -839,15 +1234,16 @@ class Clan(commands.Cog):
             for kickable in to_kick:
 
                 # This hopefully(?) always exists in the database.
-                # TODO: Needs a retry block in case of background token refresh causing a race condition. 
-                admin = get_admin_by_id(DATABASE, kickable.get('admin_id'))
+                # Credentials are cached and calls are retried once if the token was rotated underneath us.
+                admin_id = kickable.get('admin_id')
 
                 # Now we can kick the user directly.
                 group_id = kickable.get('group_id')
                 group_name = kickable.get('group_name')
                 try:
-                    BNET.kick_member_from_group(
-                        admin.get('access_token')[0],
+                    ADMINS.call(
+                        admin_id,
+                        BNET.kick_member_from_group,
                         kickable.get('group_id'),
                         kickable.get('membership_type'),
                         kickable.get('membership_id')
@@ -885,12 +1281,12 @@ class Clan(commands.Cog):
             group_id = group.get('clan_id')[0]
             group_name = group.get('clan_name')[0]
             
-            # Query administrator information for this clan.
-            admin = get_admin_by_id(DATABASE, group.get('admin_id')[0])
+            # Administrator credentials for this clan are resolved on each call.
+            admin_id = group.get('admin_id')[0]
 
             # Try and obtain group information.
             try:
-                invited = BNET.get_invited_individuals(admin.get('access_token')[0], group_id)
+                invited = ADMINS.call(admin_id, BNET.get_invited_individuals, group_id)
             except BungieInterfaceError:
                 # Data retrieval failed. Throw a simple error.
                 await ctx.respond(f"Failed to obtain information for {clan.mention}.")
@@ -917,8 +1313,9 @@ class Clan(commands.Cog):
             # Attempt to cancel invite.
             mid, mtype = invite_map.get(user)
             try:
-                BNET.cancel_invite_to_group(
-                    admin.get('access_token')[0], 
+                ADMINS.call(
+                    admin_id,
+                    BNET.cancel_invite_to_group,
                     group_id, 
                     mtype,  
                     mid
@@ -966,7 +1363,7 @@ class Clan(commands.Cog):
         await ctx.defer(ephemeral=True)
 
         # Get the member record for this user.
-        member = get_member_by_id(DATABASE, 'discord_id', str(ctx.author.id))
+        member = MEMBERS.get_member(str(ctx.author.id))
         if not member:
             await ctx.respond(f"You are not registered with Ecumene. Please register to gain access to this service.")
             await routine_after(ctx, AuditRecordType.FAILED_CONTEXT)
@@ -974,7 +1371,7 @@ class Clan(commands.Cog):
 
         # Identify the clan based on the role mentioned.
         # Pull the group administrator and credentials.
-        group = get_clan_in_guild(DATABASE, str(ctx.guild.id), 'role_id', str(clan.id))
+        group = CLANS.get_clan(str(ctx.guild.id), 'role_id', str(clan.id))
         if not group:
             await ctx.respond(f"There is no clan associated with {clan.mention}.")
             await routine_after(ctx, AuditRecordType.FAILED_CONTEXT)
@@ -982,32 +1379,45 @@ class Clan(commands.Cog):
         group_id = group.get('clan_id')[0]
         group_name = group.get('clan_name')[0]
 
-        # TODO: Needs a retry block in case of background token refresh causing a race condition. 
-        admin = get_admin_by_id(DATABASE, group.get('admin_id')[0])
+        # Credentials are cached and calls are retried once if the token was rotated underneath us.
+        admin_id = group.get('admin_id')[0]
 
-        # Try and send the invite.
+        # Queue the invite so bursts of requests are sent one at a time per clan.
         # There is a potential this will send an invite to the wrong platform.
         # That depends on what membership type value is cached.
+        ahead = INVITES.pending(group_id)
+        sent = INVITES.enqueue(
+            admin_id,
+            group_id,
+            member.get('destiny_mtype')[0],
+            member.get('destiny_id')[0]
+        )
+        await ctx.respond(f"Your request to join **{group_name}#{group_id}** is queued with {ahead} ahead of you. You will be told here once the invite is sent.")
+
+        # Wait for the queue to get to us.
         try:
-            BNET.invite_user_to_group(
-                admin.get('access_token')[0],
-                group_id,
-                member.get('destiny_mtype')[0],
-                member.get('destiny_id')[0]
-            )
+            await sent
+        except EcumeneClanFullError:
+            # Capacity check failed - no point trying.
+            await ctx.respond(f"**{group_name}#{group_id}** is full. Contact your nearest admin.", ephemeral=True)
+            await routine_after(ctx, AuditRecordType.FAILED_CONTEXT)
+            return
         except BungieInterfaceError:
-            # Sending invite failed - close out nicely.
-            await ctx.respond(f"Could not send a request to join {clan.mention}. The clan might be full. Contact your nearest admin.")
+            # Sending invite failed even after retrying - close out nicely.
+            await ctx.respond(f"Could not send a request to join {clan.mention}. Contact your nearest admin.", ephemeral=True)
             await routine_after(ctx, AuditRecordType.FAILED_ERROR)
             return
 
         # Format success message and send.
-        await ctx.respond(f"Invite to join **{group_name}#{group_id}** has been sent.")
+        await ctx.respond(f"Invite to join **{group_name}#{group_id}** has been sent.", ephemeral=True)
         await routine_after(ctx, AuditRecordType.SUCCESS)
 
     @members.before_invoke
+    @changes.before_invoke
     @kick.before_invoke
+    @purge.before_invoke
     @rank.before_invoke
+    @ranks.before_invoke
     @status.before_invoke
     @invite.before_invoke
     @request.before_invoke
@@ -1017,8 +1427,11 @@ class Clan(commands.Cog):
         await routine_before(ctx, self.log)
 
     @members.error
+    @changes.error
     @kick.error
+    @purge.error
     @rank.error
+    @ranks.error
     @status.error
     @invite.error
     @request.error
@@ -5,9 +5,10 @@ from discord.ext import commands
 
 from bot.core.checks import EcumeneCheck, get_lineage_paths
 from bot.core.routines import routine_before, routine_after, routine_error
-from bot.core.shared import DATABASE, DICT_OF_ALL_GRANTABLE_COMMANDS, DICT_OF_ALL_GRANTABLE_PERMISSIONS, NOTIFICATION_TYPES
+from bot.core.shared import DATABASE, PERMISSIONS, BLACKLIST, DICT_OF_ALL_GRANTABLE_COMMANDS, DICT_OF_ALL_GRANTABLE_PERMISSIONS, NOTIFICATION_TYPES, AUTOMATION_TYPES
 from db.query.members import check_blacklist, add_user_to_blacklist, remove_user_from_blacklist
 from db.query.channels import insert_or_update_channel, select_channel, delete_channel, get_channel_configuration
+from db.query.automations import enable_automation, disable_automation, get_guild_automations
 from db.query.permissions import \
     select_permission, \
     insert_permission, \
@@ -37,6 +38,7 @@ class Guild(commands.Cog):
       - /guild command <roles> (list commands able to be run by a specific role)
       - /guild block <user> (add user to guild blacklist)
       - /guild unblock <user> (remove user from guild blacklist)
+      - /guild automate <feature> <state> (opt in or out of automated features)
     """
     def __init__(self, log):
         self.log = log
@@ -86,6 +88,7 @@ class Guild(commands.Cog):
 
         # Create the permission.
         insert_permission(DATABASE, str(ctx.guild.id), str(role.id), identifier)
+        PERMISSIONS.invalidate(str(ctx.guild.id))
         await ctx.respond(f'Granted access to `{command}` to {role.mention}.')
         await routine_after(ctx, AuditRecordType.SUCCESS)
 
@@ -122,6 +125,7 @@ class Guild(commands.Cog):
 
         # Create the permission.
         delete_permission(DATABASE, str(ctx.guild.id), str(role.id), identifier)
+        PERMISSIONS.invalidate(str(ctx.guild.id))
         await ctx.respond(f'Revoked access to `{command}` from {role.mention}.')
         await routine_after(ctx, AuditRecordType.SUCCESS)
 
@@ -142,6 +146,7 @@ class Guild(commands.Cog):
 
         # Clear by role.
         clear_permissions_by_role(DATABASE, str(ctx.guild.id), str(role.id))
+        PERMISSIONS.invalidate(str(ctx.guild.id))
         await ctx.respond(f'Cleared all permissions for {role.mention}.')
         await routine_after(ctx, AuditRecordType.SUCCESS)
 
@@ -163,6 +168,7 @@ class Guild(commands.Cog):
         # Get command and clear.
         identifier = DICT_OF_ALL_GRANTABLE_COMMANDS.get(command)
         clear_permissions_by_command(DATABASE, str(ctx.guild.id), identifier)
+        PERMISSIONS.invalidate(str(ctx.guild.id))
         await ctx.respond(f'Cleared all permissions for `{command}`.')
         await routine_after(ctx, AuditRecordType.SUCCESS)
 
@@ -180,6 +186,7 @@ class Guild(commands.Cog):
 
         # Create the permission.
         nuke_permissions(DATABASE, str(ctx.guild.id))
+        PERMISSIONS.invalidate(str(ctx.guild.id))
         await ctx.respond(f'All permissions on server have been nuked.')
         await routine_after(ctx, AuditRecordType.SUCCESS)
 
@@ -294,6 +301,7 @@ class Guild(commands.Cog):
 
         # Add user to blacklist.
         add_user_to_blacklist(DATABASE, str(ctx.guild.id), str(user.id))
+        BLACKLIST.add(str(ctx.guild.id), str(user.id))
         await ctx.respond(f"User {user.mention} added to server block list.")
         await routine_after(ctx, AuditRecordType.SUCCESS)
 
@@ -321,6 +329,7 @@ class Guild(commands.Cog):
 
         # Add user to blacklist.
         remove_user_from_blacklist(DATABASE, str(ctx.guild.id), str(user.id))
+        BLACKLIST.remove(str(ctx.guild.id), str(user.id))
         await ctx.respond(f"User {user.mention} removed from server block list.")
         await routine_after(ctx, AuditRecordType.SUCCESS)
 
@@ -428,6 +437,42 @@ class Guild(commands.Cog):
         await ctx.respond(f"Notification configuration for this server: {list_separator}{list_separator.join(c_outputs)}")
         await routine_after(ctx, AuditRecordType.SUCCESS)
 
+    # Opt in or out of automated features run by the task process.
+    @guild.command(
+        name='automate',
+        description='Turn automated features on or off for this server.',
+        options=[
+            discord.Option(str, name='feature', description='Feature to configure.', choices=sorted(AUTOMATION_TYPES.keys())),
+            discord.Option(str, name='state', description='Whether the feature should run.', choices=['On', 'Off'])
+        ]
+    )
+    @commands.check(CHECKS.guild_is_not_blacklisted)
+    @commands.check(CHECKS.user_has_privilege)
+    async def automate(self, ctx: discord.ApplicationContext, feature: str, state: str):
+
+        # Defer response until processing is done.
+        await ctx.defer(ephemeral=True)
+
+        # Store or remove the opt-in for this guild.
+        if state == 'On':
+            enable_automation(DATABASE, str(ctx.guild.id), AUTOMATION_TYPES.get(feature))
+        else:
+            disable_automation(DATABASE, str(ctx.guild.id), AUTOMATION_TYPES.get(feature))
+
+        # List all automations enabled in this server.
+        result = get_guild_automations(DATABASE, str(ctx.guild.id))
+        if not result:
+            await ctx.respond(f"There are no automated features enabled for this server.")
+            await routine_after(ctx, AuditRecordType.SUCCESS)
+            return
+
+        # Respond to request.
+        names = {value: name for name, value in AUTOMATION_TYPES.items()}
+        a_outputs = [f"`{names.get(a_feature, a_feature)}`" for a_feature in sorted(result.get('feature'))]
+        list_separator = "\n • "
+        await ctx.respond(f"Automated features enabled for this server: {list_separator}{list_separator.join(a_outputs)}")
+        await routine_after(ctx, AuditRecordType.SUCCESS)
+
     @grant.before_invoke
     @revoke.before_invoke
     @reset.before_invoke
@@ -439,6 +484,7 @@ class Guild(commands.Cog):
     @unblock.before_invoke
     @notify.before_invoke
     @silence.before_invoke
+    @automate.before_invoke
     async def guild_before(self, ctx: discord.ApplicationContext):
         await routine_before(ctx, self.log)
 
@@ -453,5 +499,6 @@ class Guild(commands.Cog):
     @unblock.error
     @notify.error
     @silence.error
+    @automate.error
     async def guild_error(self, ctx: discord.ApplicationContext, error):
         await routine_error(ctx, self.log, error)
\ No newline at end of file
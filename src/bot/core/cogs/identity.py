@@ -6,16 +6,18 @@ from discord.ext import commands
 from bot.core.checks import EcumeneCheck
 from bot.core.interactions import EcumenePlatformDropdown, EcumeneSelectPlatform
 from bot.core.routines import routine_before, routine_after, routine_error
-from bot.core.shared import DATABASE, BNET, PLATFORMS, LEVELS, EMOJIS
+from bot.core.shared import DATABASE, CLANS, MEMBERS, BNET, PLATFORMS, LEVELS, EMOJIS
 from web.core.shared import WEB_RESOURCES
-from db.query.clans import get_all_clans_in_guild
-from db.query.members import get_member_by_id, update_member_details
+from db.query.members import update_member_details
+from db.query.rosters import get_roster_memberships
 from db.query.transactions import update_transaction
+from util.concurrency import gather_bounded, run_blocking
 from util.encrypt import generate_state
 from util.enum import TransactionType, AuditRecordType
 from util.time import get_current_time, epoch_to_time, bnet_to_time, time_to_discord, get_timedelta, humanize_timedelta
 
 DT_FMT = '{dt.day} {dt:%B} {dt.year} {dt:%H}:{dt:%M}:{dt:%S}'
+INSPECT_CONCURRENCY = 3 # Bungie requests in flight at once for a single inspection.
 CHECKS = EcumeneCheck()
 
 class Identity(commands.Cog):
@@ -125,10 +127,10 @@ class Identity(commands.Cog):
         
         # Get the author's identity.
         id = str(user.id)
-        result = get_member_by_id(DATABASE, 'discord_id', id)
+        result = MEMBERS.get_member(id)
 
         # Get clans we manage for this guild.
-        managed = get_all_clans_in_guild(DATABASE, str(ctx.guild.id))
+        managed = CLANS.get_all_clans(str(ctx.guild.id))
 
         # If no result, then the user is not registered.
         if not result:
@@ -161,7 +163,7 @@ class Identity(commands.Cog):
             return
 
         # Get information about the user from Bungie.
-        content = BNET.get_linked_profiles(result.get('destiny_mtype')[0], result.get('destiny_id')[0])
+        content = await run_blocking(BNET.get_linked_profiles, result.get('destiny_mtype')[0], result.get('destiny_id')[0])
         bnet_info = content.get('bnetMembership')
         profile_info = content.get('profiles')
         legacy_info = content.get('profilesWithErrors')
@@ -171,24 +173,33 @@ class Identity(commands.Cog):
         if not profile_info:
             backup_name = bnet_info.get('bungieGlobalDisplayName')
             backup_code = bnet_info.get('bungieGlobalDisplayNameCodes')
-            profile_info = BNET.find_destiny_player(backup_name, backup_code)
+            profile_info = await run_blocking(BNET.find_destiny_player, backup_name, backup_code)
 
         # Sometimes we are missing Bungie information as well!
         if not bnet_info:
-            alt_content = BNET.get_linked_profiles(result.get('bnet_mtype')[0], result.get('bnet_id')[0])
+            alt_content = await run_blocking(BNET.get_linked_profiles, result.get('bnet_mtype')[0], result.get('bnet_id')[0])
             bnet_info = alt_content.get('bnetMembership')
 
         # Now we need to get clan membership information for all active profiles.
+        # Every profile is looked up at once so this costs about one round trip however many there are.
+        group_results = await gather_bounded(
+            [run_blocking(BNET.get_groups_for_user, profile.get('membershipType'), profile.get('membershipId')) for profile in profile_info],
+            INSPECT_CONCURRENCY,
+            return_exceptions=False
+        )
         clans = list()
-        for profile in profile_info:
-            group_results = BNET.get_groups_for_user(profile.get('membershipType'), profile.get('membershipId'))
-            for entry in group_results:
+        for profile, results in zip(profile_info, group_results):
+            for entry in results:
                 group = entry.get('group')
+                # Each group comes with the user's own membership so rank and join date are usually here already.
+                member = entry.get('member') or dict()
                 clan_header = {
                     'group_id': group.get('groupId'),
                     'group_name': group.get('name'),
                     'member_type': profile.get('membershipType'),
-                    'member_id': profile.get('membershipId')
+                    'member_id': profile.get('membershipId'),
+                    'member_level': LEVELS.get(member.get('memberType')),
+                    'member_since': member.get('joinDate')
                 }
                 clans.append(clan_header)
         
@@ -200,18 +211,39 @@ class Identity(commands.Cog):
         sorted_clans = list()
         for clan_id in sorted_ids:
             sorted_clans.append(clan_dict[clan_id])
-            
-        # Information about when a user actually joined a group is not available from the GetUserGroups API - really, why?
-        # Instead, we have to loop through each clan and hit the members API and parse that.
+
+        # Flag if the clan is managed by ecumene while we're at it.
         for clan in sorted_clans:
-            
-            # Flag is the clan is managed by ecumene while we're at it.
             if managed:
                 if clan.get('group_id') in managed.get('clan_id'):
                     clan['ecumene_managed'] = True
 
-            # Hit and parse members API - we are only doing this for active profiles.
-            members = BNET.get_members_in_group(clan.get('group_id'))
+        # Anything missing membership details is looked up in roster snapshots for just this user.
+        missing = [clan for clan in sorted_clans if not clan.get('member_since')]
+        if missing:
+            snapshots = await run_blocking(get_roster_memberships, DATABASE, list(set(str(clan.get('member_id')) for clan in missing)))
+            snapshot_dict = {
+                (clan_id, destiny_id): (member_type, join_date) for clan_id, destiny_id, member_type, join_date in zip(
+                    snapshots.get('clan_id', list()),
+                    snapshots.get('destiny_id', list()),
+                    snapshots.get('member_type', list()),
+                    snapshots.get('join_date', list())
+                )
+            }
+            for clan in missing:
+                snapshot = snapshot_dict.get((str(clan.get('group_id')), str(clan.get('member_id'))))
+                if snapshot and snapshot[1]:
+                    clan['member_level'] = LEVELS.get(int(snapshot[0])) if snapshot[0] is not None else None
+                    clan['member_since'] = snapshot[1]
+
+        # As a last resort hit the members API for whatever is left, all at once.
+        missing = [clan for clan in sorted_clans if not clan.get('member_since')]
+        rosters = await gather_bounded(
+            [run_blocking(BNET.get_members_in_group, clan.get('group_id')) for clan in missing],
+            INSPECT_CONCURRENCY,
+            return_exceptions=False
+        )
+        for clan, members in zip(missing, rosters):
             for member in members:
                 destiny_info = member.get('destinyUserInfo')
                 if destiny_info.get('membershipId') == clan.get('member_id'):
@@ -321,7 +353,7 @@ class Identity(commands.Cog):
         await ctx.defer(ephemeral=True)
         
         # Get the member record for this user.
-        member = get_member_by_id(DATABASE, 'discord_id', str(ctx.author.id))
+        member = MEMBERS.get_member(str(ctx.author.id))
         if not member:
             await ctx.respond(f"You are not registered with Ecumene. Please register to gain access to this service.")
             await routine_after(ctx, AuditRecordType.FAILED_UNREGISTERED)
@@ -424,6 +456,7 @@ class Identity(commands.Cog):
             'destiny_mtype': target_mtype
         }
         update_member_details(DATABASE, 'discord_id', data)
+        MEMBERS.refresh(str(ctx.author.id))
 
         # Recreate embed with new information.
         await message.edit(f'Request acknowledged. Primary profile set to **{view.value}**.',  view=None)
@@ -2,6 +2,8 @@ import discord
 
 from bot.core.checks import get_lineage
 from util.enum import AuditRecordType
+from util.metrics import get_counter
+from util.data import truncate_option_value
 from util.time import get_current_time
 
 class AuditRecord():
@@ -9,7 +11,7 @@ class AuditRecord():
     def __init__(
         self, record_id, 
         command_id, invoked_at, guild_id, discord_id, 
-        options, status
+        options, status, parsed_options=None, metrics=None
     ):
         # Basically just store these as object properties.
         self.id = record_id
@@ -19,6 +21,8 @@ class AuditRecord():
         self.discord_id = discord_id
         self.options = options
         self.status = status
+        self.parsed_options = parsed_options or list()
+        self.metrics = metrics or dict()
 
     def as_data(self, non_null_only=True):
         """
@@ -33,7 +37,12 @@ class AuditRecord():
             'guild_id': self.guild_id,
             'discord_id': self.discord_id,
             'command_options': self.options,
-            'status': self.status
+            'status': self.status,
+            'completed_at': self.metrics.get('completed_at'),
+            'duration_ms': self.metrics.get('duration_ms'),
+            'bnet_calls': self.metrics.get('bnet_calls'),
+            'discord_calls': self.metrics.get('discord_calls'),
+            'db_calls': self.metrics.get('db_calls')
         }
         if not non_null_only:
             return all_data
@@ -45,33 +54,73 @@ class AuditRecord():
                 data[key] = value
         return data
 
-def format_command_options(ctx: discord.ApplicationContext):
+    def options_as_data(self):
+        """Return parsed options as rows for the normalised options table."""
+        return [
+            {
+                'record_id': self.id,
+                'option_name': name,
+                'option_value': truncate_option_value(value)
+            } for name, value in self.parsed_options
+        ]
+
+def parse_command_options(ctx: discord.ApplicationContext):
     """
-    Unpack and format command options.
-    This returns a string we can push into a database.
+    Unpack command options into (name, value) pairs.
+    List values are split so that each element can be matched on its own.
     """
     if not ctx.selected_options:
-        return None
+        return list()
 
-    options = list()
+    pairs = list()
     for option in ctx.selected_options:
         # Record the name of the variable and the value.
         name = option.get('name')
         value = option.get('value')
         # Can't really foresee a case where this isn't a primitive or a list of primitives.
-        value_str = 'None',
         if isinstance(value, list):
-            value_str = ','.join(map(str, value))
+            pairs += [(name, str(element)) for element in value]
         elif value:
-            value_str = str(value)
-        option_str = f'{name}={value_str}'
-        options.append(option_str)
+            pairs.append((name, str(value)))
+        else:
+            pairs.append((name, 'None'))
+    return pairs
+
+def format_command_options(pairs):
+    """
+    Format parsed command options.
+    This returns a string we can push into a database.
+    """
+    if not pairs:
+        return None
+
+    # Re-group list elements under their option name to retain the original format.
+    grouped = dict()
+    for name, value in pairs:
+        grouped.setdefault(name, list()).append(value)
+    options = [f"{name}={','.join(values)}" for name, values in grouped.items()]
     
     formatted_options = ';'.join(options)
     return formatted_options
 
-def generate_command_record(ctx: discord.ApplicationContext, status=AuditRecordType.PENDING, stub=False):
-    """Generates auditable command record."""
+def get_command_identifiers(bot: discord.Bot, root):
+    """Expand a top-level command into the identifiers of every command beneath it."""
+    identifiers = list()
+    for cmd in bot.walk_application_commands():
+        # Groups are never invoked directly so they have no audit records.
+        if isinstance(cmd, discord.SlashCommandGroup):
+            continue
+        lineage = list()
+        lineage = get_lineage(cmd, lineage)
+        if lineage[-1] == root:
+            identifiers.append('.'.join(reversed(lineage)))
+    return identifiers
+
+def generate_command_record(ctx: discord.ApplicationContext, status=AuditRecordType.PENDING, stub=False, complete=False):
+    """
+    Generates auditable command record.
+    Completed records carry the duration and call counts gathered since the command began.
+    """
     
     invoked_at = None
     if not stub:
@@ -83,9 +132,17 @@ def generate_command_record(ctx: discord.ApplicationContext, status=AuditRecordT
     command_id = '.'.join(reversed(lineage))
     
     # Formatted commands (if they exist).
+    parsed_options = None
     formatted_options = None
     if not stub:
-        formatted_options = format_command_options(ctx)
+        parsed_options = parse_command_options(ctx)
+        formatted_options = format_command_options(parsed_options)
+
+    # Counting starts when the command is invoked so may be missing if it never began.
+    metrics = None
+    counter = get_counter()
+    if complete and counter:
+        metrics = counter.as_data()
 
     record = AuditRecord(
         str(ctx.interaction.id), 
@@ -94,7 +151,20 @@ def generate_command_record(ctx: discord.ApplicationContext, status=AuditRecordT
         str(ctx.guild_id), 
         str(ctx.author.id), 
         formatted_options, 
-        status.value
+        status.value,
+        parsed_options=parsed_options,
+        metrics=metrics
     )
 
+    return record
+
+def generate_member_record(ctx: discord.ApplicationContext, index, pairs, status):
+    """
+    Generates an auditable record for one member affected by a bulk command.
+    Records share the command invocation but carry their own identifier and the member's options.
+    """
+    record = generate_command_record(ctx, status=status)
+    record.id = f"{record.id}.{index}"
+    record.parsed_options = record.parsed_options + list(pairs)
+    record.options = format_command_options(record.parsed_options)
     return record
\ No newline at end of file
@@ -1,6 +1,8 @@
 import logging
 import discord
 
+from web.core.shared import WEB_RESOURCES
+
 # Defines a confirmation dialog.
 class EcumeneConfirm(discord.ui.View):
 
@@ -83,4 +85,108 @@ class EcumeneSelectPlatform(discord.ui.View):
     def __init__(self, dropdown):
         super().__init__()
         self.add_item(dropdown)
-        self.value = None
\ No newline at end of file
+        self.value = None
+
+# Defines a paginated view over a clan roster.
+# Only the page being shown is ever rendered, so large rosters respond as quickly as small ones.
+ROSTER_PAGE_SIZE = 15
+ROSTER_SORTS = {
+    'Clan': ['clan_name', 'bungie_name'],
+    'Name': ['bungie_name'],
+    'Last Online': ['last_online_str']
+}
+ROSTER_STATUSES = ['All', 'Active', 'Inactive']
+
+class EcumeneRosterView(discord.ui.View):
+
+    def __init__(self, roster, title, export, footer=None):
+        super().__init__()
+        self.roster = roster
+        self.title = title
+        self.export = export
+        self.footer = footer
+        self.message = None
+        self.page = 0
+        self.sort = 0
+        self.status = 0
+        self.rows = None
+        self._update_buttons_()
+
+    def _current_rows_(self):
+        """Filter and sort the roster for the current settings, reusing the result until they change."""
+        if self.rows is None:
+            rows = self.roster
+            status = ROSTER_STATUSES[self.status]
+            if status != 'All':
+                rows = rows.loc[rows['status'] == status]
+            self.rows = rows.sort_values(by=list(ROSTER_SORTS.values())[self.sort], na_position='last')
+        return self.rows
+
+    def _page_count_(self):
+        return max(1, -(-len(self._current_rows_()) // ROSTER_PAGE_SIZE))
+
+    def _update_buttons_(self):
+        self.previous.disabled = self.page == 0
+        self.next.disabled = self.page >= self._page_count_() - 1
+        self.sort_by.label = f"Sort: {list(ROSTER_SORTS.keys())[self.sort]}"
+        self.filter_by.label = f"Status: {ROSTER_STATUSES[self.status]}"
+
+    def render(self):
+        """Build the embed for the current page only."""
+        rows = self._current_rows_()
+        page = rows.iloc[self.page * ROSTER_PAGE_SIZE:(self.page + 1) * ROSTER_PAGE_SIZE]
+        lines = list()
+        for row in page.itertuples():
+            # Missing values come through as blanks or NaN so only trust non-empty strings.
+            name = row.bungie_name if isinstance(row.bungie_name, str) and row.bungie_name else row.destiny_id
+            discord_text = f"<@{row.discord_id}>" if isinstance(row.discord_id, str) and row.discord_id else "Unregistered"
+            lines.append(f"**{name}** · {row.clan_name} · {discord_text}\n{row.status}, last online {row.last_online_rel_str}")
+        embed = discord.Embed(
+            title=self.title,
+            description='\n'.join(lines) or 'There are no clan members matching this filter.'
+        )
+        footer = f"Page {self.page + 1} of {self._page_count_()} · {len(rows)} member(s)"
+        if self.footer:
+            footer = f"{footer} · {self.footer}"
+        embed.set_footer(text=footer, icon_url=WEB_RESOURCES.logo)
+        return embed
+
+    async def _refresh_(self, interaction: discord.Interaction):
+        self._update_buttons_()
+        await interaction.response.edit_message(embed=self.render(), view=self)
+
+    @discord.ui.button(label="Previous", style=discord.ButtonStyle.grey, row=0)
+    async def previous(self, button: discord.ui.Button, interaction: discord.Interaction):
+        self.page = max(0, self.page - 1)
+        await self._refresh_(interaction)
+
+    @discord.ui.button(label="Next", style=discord.ButtonStyle.grey, row=0)
+    async def next(self, button: discord.ui.Button, interaction: discord.Interaction):
+        self.page = min(self._page_count_() - 1, self.page + 1)
+        await self._refresh_(interaction)
+
+    # Changing sort or filter starts again from the first page.
+    @discord.ui.button(label="Sort", style=discord.ButtonStyle.blurple, row=1)
+    async def sort_by(self, button: discord.ui.Button, interaction: discord.Interaction):
+        self.sort = (self.sort + 1) % len(ROSTER_SORTS)
+        self.page = 0
+        self.rows = None
+        await self._refresh_(interaction)
+
+    @discord.ui.button(label="Status", style=discord.ButtonStyle.blurple, row=1)
+    async def filter_by(self, button: discord.ui.Button, interaction: discord.Interaction):
+        self.status = (self.status + 1) % len(ROSTER_STATUSES)
+        self.page = 0
+        self.rows = None
+        await self._refresh_(interaction)
+
+    # The full export is only written when someone actually asks for it.
+    @discord.ui.button(label="Export", style=discord.ButtonStyle.green, row=1)
+    async def export_all(self, button: discord.ui.Button, interaction: discord.Interaction):
+        await interaction.response.defer()
+        await self.export(interaction, self._current_rows_())
+
+    async def on_timeout(self):
+        if self.message:
+            self.disable_all_items()
+            await self.message.edit(view=self)
\ No newline at end of file
@@ -0,0 +1,157 @@
+import asyncio
+import contextvars
+import functools
+import logging
+
+from collections import deque
+
+from bnet.client import BungieInterface, BungieInterfaceError
+from bot.core.cache import EcumeneAdminCache
+from util.time import get_current_time
+
+INVITE_INTERVAL = 1 # Seconds between invites sent for the same clan.
+INVITE_RETRIES = 3 # Further attempts made for an invite that was throttled.
+INVITE_RETRY_BACKOFF = 5 # Seconds waited before a retry, multiplied by the attempt number.
+GROUP_CACHE_TTL = 60 # Seconds clan details are trusted for capacity checks.
+INVITE_RETRY_ERRORS = [
+    None,
+    'RequestException',
+    'ThrottleLimitExceeded',
+    'ThrottleLimitExceededMinutes',
+    'ThrottleLimitExceededMomentarily',
+    'ThrottleLimitExceededSeconds',
+    'PerEndpointRequestThrottleExceeded',
+    'PerApplicationThrottleExceeded',
+    'PerUserThrottleExceeded'
+]
+INVITE_FULL_ERRORS = [
+    'ClanMaximumMembershipReached'
+]
+
+class EcumeneClanFullError(Exception):
+    pass
+
+class EcumeneInviteQueue():
+    """
+    Sends clan invites through a queue per clan so bursts of requests share one admin token politely.
+    Each clan is worked through one invite at a time with a pause in between and throttled invites are retried.
+    Capacity is checked against briefly cached clan details, which are dropped whenever the clan looks full.
+    """
+
+    def __init__(self, bnet: BungieInterface, admins: EcumeneAdminCache, interval=INVITE_INTERVAL, retries=INVITE_RETRIES, backoff=INVITE_RETRY_BACKOFF, ttl=GROUP_CACHE_TTL):
+        self.log = logging.getLogger(f'{self.__module__}.{self.__class__.__name__}')
+        self.bnet = bnet
+        self.admins = admins
+        self.interval = interval
+        self.retries = retries
+        self.backoff = backoff
+        self.ttl = ttl
+        self.queues = dict()
+        self.workers = dict()
+        self.jobs = dict()
+        self.groups = dict()
+
+    def pending(self, clan_id):
+        """Number of invites waiting to be sent for a clan."""
+        return len(self.queues.get(clan_id, list()))
+
+    def enqueue(self, admin_id, clan_id, membership_type, membership_id):
+        """
+        Queue an invite and return a future resolved once it has been sent.
+        Asking again while an invite is still queued shares the original future.
+        """
+        key = (clan_id, membership_id)
+        if key in self.jobs:
+            return self.jobs[key].get('future')
+
+        # Calls are made in the context of whoever queued the invite so they are counted against their command.
+        job = {
+            'admin_id': admin_id,
+            'clan_id': clan_id,
+            'membership_type': membership_type,
+            'membership_id': membership_id,
+            'context': contextvars.copy_context(),
+            'future': asyncio.get_event_loop().create_future()
+        }
+        self.jobs[key] = job
+        self.queues.setdefault(clan_id, deque()).append(job)
+
+        # Start working through this clan's queue unless that is already happening.
+        worker = self.workers.get(clan_id)
+        if not worker or worker.done():
+            self.workers[clan_id] = asyncio.get_event_loop().create_task(self._run_(clan_id))
+        return job.get('future')
+
+    async def _run_(self, clan_id):
+        queue = self.queues.get(clan_id)
+        try:
+            while queue:
+                job = queue.popleft()
+                try:
+                    await self._send_(job)
+                finally:
+                    self.jobs.pop((clan_id, job.get('membership_id')), None)
+                await asyncio.sleep(self.interval)
+        finally:
+            # Nothing can be queued between the last check and here so the queue is safe to drop.
+            if not queue:
+                self.queues.pop(clan_id, None)
+                self.workers.pop(clan_id, None)
+
+    async def _call_(self, job, func, *args):
+        call = functools.partial(job.get('context').run, func, *args)
+        return await asyncio.get_event_loop().run_in_executor(None, call)
+
+    async def _get_group_(self, job):
+        """Get clan details, only asking Bungie when the cached copy is stale."""
+        clan_id = job.get('clan_id')
+        cached = self.groups.get(clan_id)
+        if cached and get_current_time() - cached[0] < 1000 * self.ttl:
+            return cached[1]
+        detail = await self._call_(job, self.bnet.get_group_by_id, clan_id)
+        self.groups[clan_id] = (get_current_time(), detail)
+        return detail
+
+    async def _send_(self, job):
+        future = job.get('future')
+        for attempt in range(self.retries + 1):
+            try:
+                detail = await self._get_group_(job)
+                if detail.get('memberCount') >= detail.get('features').get('maximumMembers'):
+                    # Check again next time in case someone has left since.
+                    self.invalidate(job.get('clan_id'))
+                    raise EcumeneClanFullError(job.get('clan_id'))
+                await self._call_(
+                    job,
+                    self.admins.call,
+                    job.get('admin_id'),
+                    self.bnet.invite_user_to_group,
+                    job.get('clan_id'),
+                    job.get('membership_type'),
+                    job.get('membership_id')
+                )
+                if not future.done():
+                    future.set_result(True)
+                return
+            except BungieInterfaceError as e:
+                if e.status in INVITE_FULL_ERRORS:
+                    # Bungie knows better than our cached details.
+                    self.invalidate(job.get('clan_id'))
+                    if not future.done():
+                        future.set_exception(EcumeneClanFullError(job.get('clan_id')))
+                    return
+                if e.status not in INVITE_RETRY_ERRORS or attempt == self.retries:
+                    self.log.info(f"Failed to invite {job.get('membership_id')} to {job.get('clan_id')}: {e.status}")
+                    if not future.done():
+                        future.set_exception(e)
+                    return
+                self.log.info(f"Invite to {job.get('clan_id')} was throttled. Retrying in {self.backoff * (attempt + 1)} second(s)")
+                await asyncio.sleep(self.backoff * (attempt + 1))
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(e)
+                return
+
+    def invalidate(self, clan_id):
+        """Drop cached clan details so capacity is checked against fresh data."""
+        self.groups.pop(clan_id, None)
\ No newline at end of file
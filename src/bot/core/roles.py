@@ -0,0 +1,249 @@
+import asyncio
+import discord
+import logging
+
+from bot.core.shared import DATABASE, MEMBERS
+from db.query.channels import get_guild_channels_by_purpose
+from db.query.headers import get_guilds, get_guild_system_role
+from db.query.members import get_members_matching
+from db.query.proliferations import \
+    start_proliferation, \
+    update_proliferation_progress, \
+    complete_proliferation, \
+    get_incomplete_proliferations, \
+    delete_proliferation
+from util.concurrency import gather_bounded, run_blocking
+from util.data import chunks
+from web.core.shared import WEB_RESOURCES
+
+JOIN_BUFFER_WINDOW = 2 # Seconds to collect joins for a guild before processing them together.
+ROLE_CONCURRENCY = 5 # Role changes in flight at once per batch. Discord queues anything over its limits.
+PROLIFERATION_BATCH = 100 # Members processed between saving progress.
+RECONCILE_SCHEDULE = 6*60*60 # Seconds between reconciling system role holders with registrations.
+RECONCILE_BATCH_PAUSE = 1 # Seconds between batches of role changes during reconciliation.
+
+class EcumeneRoleManager():
+    """
+    Applies the guild system role to registered members.
+    Joins are buffered per guild for a short window so bursts resolve with one lookup and bounded role calls.
+    Proliferating the role across a whole guild runs in the background and saves progress so it can resume.
+    Role holders are periodically reconciled against registrations to repair any drift.
+    """
+
+    def __init__(self, client: discord.Bot, window=JOIN_BUFFER_WINDOW, concurrency=ROLE_CONCURRENCY):
+        self.log = logging.getLogger(f'{self.__module__}.{self.__class__.__name__}')
+        self.client = client
+        self.window = window
+        self.concurrency = concurrency
+        self.joins = dict()
+        self.flushes = dict()
+        self.proliferations = dict()
+        self.reconciler = None
+
+    def get_system_role(self, guild: discord.Guild):
+        """Get the system role object for a guild if one is configured."""
+        results = get_guild_system_role(DATABASE, str(guild.id))
+        if not results:
+            return None
+        return guild.get_role(int(results.get('role_id')[0]))
+
+    async def add_role(self, members, role):
+        """Add a role to many members with bounded concurrency. Returns how many succeeded."""
+        results = await gather_bounded([member.add_roles(role) for member in members], self.concurrency)
+        failed = [result for result in results if isinstance(result, Exception)]
+        for error in failed:
+            self.log.error(f'Failed to add role {role.id}: {error}')
+        return len(results) - len(failed)
+
+    async def remove_role(self, members, role):
+        """Remove a role from many members with bounded concurrency. Returns how many succeeded."""
+        results = await gather_bounded([member.remove_roles(role) for member in members], self.concurrency)
+        failed = [result for result in results if isinstance(result, Exception)]
+        for error in failed:
+            self.log.error(f'Failed to remove role {role.id}: {error}')
+        return len(results) - len(failed)
+
+    async def report(self, guild: discord.Guild, description, payload):
+        """Post a notification into the automation channels of a guild."""
+        channels = get_guild_channels_by_purpose(DATABASE, str(guild.id), 'automation')
+        for channel_id in channels.get('channel_id', list()):
+            channel = guild.get_channel(int(channel_id))
+            if not channel:
+                continue
+            embed = discord.Embed(
+                title='Ecumene Automation — Notify',
+                description=description
+            )
+            embed.add_field(
+                name='Payload',
+                value=payload,
+                inline=False
+            )
+            embed.set_thumbnail(url=WEB_RESOURCES.logo)
+            embed.set_footer(text=f"ecumene.cc", icon_url=WEB_RESOURCES.logo)
+            try:
+                await channel.send(embed=embed)
+            except discord.HTTPException as e:
+                self.log.warning(f'Notification to "channel={channel_id}" unsuccessful: {e}')
+
+    def queue_join(self, member: discord.Member):
+        """Buffer a member join and schedule a flush for their guild."""
+        guild_id = member.guild.id
+        self.joins.setdefault(guild_id, dict())[member.id] = member
+        if guild_id not in self.flushes:
+            self.flushes[guild_id] = asyncio.get_event_loop().create_task(self._flush_joins_(member.guild))
+
+    async def _flush_joins_(self, guild: discord.Guild):
+        await asyncio.sleep(self.window)
+
+        # Swap out the batch so joins arriving from here on start a new window.
+        self.flushes.pop(guild.id, None)
+        joined = self.joins.pop(guild.id, dict())
+        if not joined:
+            return
+
+        try:
+            role = self.get_system_role(guild)
+            if not role:
+                return
+            registered = MEMBERS.filter_registered(joined.keys())
+            members = [member for member_id, member in joined.items() if str(member_id) in registered]
+            if not members:
+                return
+            added = await self.add_role(members, role)
+            self.log.info(f'Granted system role to {added}/{len(joined)} joining member(s) in guild {guild.id}')
+        except Exception as e:
+            self.log.error(f'Failed to process joins for guild {guild.id}: {e}')
+
+    def proliferate(self, guild: discord.Guild, role: discord.Role):
+        """Begin granting the system role to every registered member of a guild."""
+        start_proliferation(DATABASE, str(guild.id), str(role.id))
+        self._spawn_proliferation_(guild, role, None, 0)
+
+    def resume_proliferations(self):
+        """Pick up any proliferation interrupted by a restart or disconnect."""
+        pending = get_incomplete_proliferations(DATABASE)
+        for guild_id, role_id, cursor, granted in zip(
+            pending.get('guild_id', list()), 
+            pending.get('role_id', list()), 
+            pending.get('member_cursor', list()), 
+            pending.get('granted', list())
+        ):
+            guild = self.client.get_guild(int(guild_id))
+            role = guild.get_role(int(role_id)) if guild else None
+            if not role:
+                # We have left the guild or the role is gone, so there is nothing to finish.
+                delete_proliferation(DATABASE, guild_id)
+                continue
+            self.log.info(f'Resuming proliferation in guild {guild_id} after member {cursor}')
+            self._spawn_proliferation_(guild, role, cursor, granted or 0)
+
+    def cancel_proliferation(self, guild_id):
+        """Stop and forget any proliferation for a guild."""
+        task = self.proliferations.pop(guild_id, None)
+        if task:
+            task.cancel()
+        delete_proliferation(DATABASE, str(guild_id))
+
+    def _spawn_proliferation_(self, guild, role, cursor, granted):
+        task = self.proliferations.get(guild.id)
+        if task and not task.done():
+            return
+        self.proliferations[guild.id] = asyncio.get_event_loop().create_task(
+            self._proliferate_(guild, role, cursor, granted)
+        )
+
+    async def _proliferate_(self, guild: discord.Guild, role: discord.Role, cursor, granted):
+        try:
+            # Walk members in identifier order so progress can be saved as a single cursor.
+            members = sorted(guild.members, key=lambda member: member.id)
+            if cursor:
+                members = [member for member in members if member.id > int(cursor)]
+            self.log.info(f'Proliferating system role to {len(members)} member(s) in guild {guild.id}')
+
+            for batch in chunks(members, PROLIFERATION_BATCH):
+                registered = MEMBERS.filter_registered([member.id for member in batch])
+                to_grant = [member for member in batch if str(member.id) in registered and role not in member.roles]
+                granted += await self.add_role(to_grant, role)
+                update_proliferation_progress(DATABASE, str(guild.id), str(batch[-1].id), granted)
+
+            complete_proliferation(DATABASE, str(guild.id))
+            self.log.info(f'Proliferated system role to {granted} member(s) in guild {guild.id}')
+            await self.report(
+                guild,
+                'Routine transmission. System role setup is complete.',
+                f'Granted {role.mention} to {granted} registered member(s).'
+            )
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Progress is saved so this will carry on from the last batch when the bot is next ready.
+            self.log.error(f'Proliferation in guild {guild.id} stopped: {e}')
+        finally:
+            self.proliferations.pop(guild.id, None)
+
+    def start_reconciliation(self):
+        """Begin periodic role reconciliation on the running event loop. Safe to call more than once."""
+        if self.reconciler and not self.reconciler.done():
+            return
+        self.reconciler = asyncio.get_event_loop().create_task(self._run_reconciliation_())
+
+    async def _run_reconciliation_(self):
+        while True:
+            await asyncio.sleep(RECONCILE_SCHEDULE)
+            try:
+                await self.reconcile_all()
+            except Exception as e:
+                self.log.error(f'Role reconciliation failed: {e}')
+
+    async def reconcile_all(self):
+        """Reconcile the system role in every guild with a configured role."""
+        headers = get_guilds(DATABASE)
+        for guild_id, role_id in zip(headers.get('guild_id', list()), headers.get('role_id', list())):
+            guild = self.client.get_guild(int(guild_id))
+            if not guild:
+                continue
+            if guild.id in self.proliferations:
+                # Proliferation is still granting roles here so leave it be.
+                continue
+            role = guild.get_role(int(role_id))
+            if not role:
+                continue
+            try:
+                await self.reconcile(guild, role)
+            except Exception as e:
+                self.log.error(f'Role reconciliation in guild {guild.id} failed: {e}')
+
+    async def reconcile(self, guild: discord.Guild, role: discord.Role):
+        """Add or remove the system role so holders match registered members in the guild."""
+        # Membership comes from the gateway cache, so only registrations need a lookup.
+        registered = MEMBERS.filter_registered([member.id for member in guild.members])
+        to_add = [member for member in guild.members if str(member.id) in registered and role not in member.roles]
+        to_remove = [member for member in role.members if str(member.id) not in registered]
+
+        # The registered set can lag behind a missed signal so never remove a role without asking the database first.
+        if to_remove:
+            confirmed = set()
+            for chunk in chunks([str(member.id) for member in to_remove], 1000):
+                matched = await run_blocking(get_members_matching, DATABASE, 'discord_id', chunk)
+                confirmed |= set(matched.get('discord_id', list()))
+            to_remove = [member for member in to_remove if str(member.id) not in confirmed]
+        if not (to_add or to_remove):
+            return
+
+        # Apply only the difference in batches, pausing in between to leave room for commands.
+        added = 0
+        for batch in chunks(to_add, PROLIFERATION_BATCH):
+            added += await self.add_role(batch, role)
+            await asyncio.sleep(RECONCILE_BATCH_PAUSE)
+        removed = 0
+        for batch in chunks(to_remove, PROLIFERATION_BATCH):
+            removed += await self.remove_role(batch, role)
+            await asyncio.sleep(RECONCILE_BATCH_PAUSE)
+
+        self.log.info(f'Reconciled system role in guild {guild.id}: {added} added, {removed} removed')
+        await self.report(
+            guild,
+            'Routine transmission. System role holders have been reconciled with registrations.',
+            f'Granted {role.mention} to {added} member(s) and removed it from {removed} member(s).'
+        )
\ No newline at end of file
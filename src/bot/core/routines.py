@@ -1,20 +1,23 @@
 import discord
 
 from bot.core.history import generate_command_record
-from bot.core.shared import DATABASE
-from db.query.audit import insert_audit_record, update_audit_record
+from bot.core.shared import AUDIT
 from util.enum import AuditRecordType
+from util.metrics import start_counter
 
 async def routine_before(ctx: discord.ApplicationContext, log):
+    start_counter()
     record = generate_command_record(ctx)
-    insert_audit_record(DATABASE, record.as_data())
+    await AUDIT.insert(record.as_data(non_null_only=False), record.options_as_data())
     log.info(f'Command "{record.command_id}" was invoked')
 
 async def routine_after(ctx: discord.ApplicationContext, status):
     # Deliberately call such that the record is stubbed (i.e. some values are not calculated).
     # We only need to update status really so only core values need to be present here.
-    record = generate_command_record(ctx, status=status, stub=True)
-    update_audit_record(DATABASE, 'record_id', record.as_data())
+    # This is buffered and will merge into the pending insert if it has not been written yet.
+    # Completion time, duration and call counts are captured alongside the final status.
+    record = generate_command_record(ctx, status=status, stub=True, complete=True)
+    await AUDIT.update(record.as_data())
 
 async def routine_error(ctx: discord.ApplicationContext, log, error):
     log.info(error)
@@ -22,8 +25,10 @@ async def routine_error(ctx: discord.ApplicationContext, log, error):
         # This error will be reached before the @before_invoke routine is called.
         # As a result, it will not have an existing record.
         # Generate and insert a failure record here directly instead.
-        record = generate_command_record(ctx, status=AuditRecordType.FAILED_CHECK)
-        insert_audit_record(DATABASE, record.as_data())
+        # Counting starts here so the checks themselves are not included in the duration.
+        start_counter()
+        record = generate_command_record(ctx, status=AuditRecordType.FAILED_CHECK, complete=True)
+        await AUDIT.insert(record.as_data(non_null_only=False), record.options_as_data())
         await ctx.respond('Insufficient privileges to perform this action.', ephemeral=True)
         return
     # Handle all other unhandled exceptions here.
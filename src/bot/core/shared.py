@@ -2,29 +2,46 @@ from types import SimpleNamespace
 
 from db.client import DatabaseService
 from bnet.client import BungieInterface
+from bot.core.buffer import EcumeneAuditBuffer
+from bot.core.cache import EcumenePermissionCache, EcumeneBlacklistCache, EcumeneClanDirectory, EcumeneAdminCache, EcumeneMemberCache
+from bot.core.signals import EcumeneSignalListener
+from bot.core.invites import EcumeneInviteQueue
+from util.enum import AutomationType
 
 # Get access to dependencies here.
 # Some of these cannot be passed into the Cog as they are un-pickleable.
 DATABASE = DatabaseService()
 BNET = BungieInterface()
+AUDIT = EcumeneAuditBuffer(DATABASE)
+PERMISSIONS = EcumenePermissionCache(DATABASE)
+BLACKLIST = EcumeneBlacklistCache(DATABASE)
+CLANS = EcumeneClanDirectory(DATABASE)
+ADMINS = EcumeneAdminCache(DATABASE)
+MEMBERS = EcumeneMemberCache(DATABASE)
+SIGNALS = EcumeneSignalListener(DATABASE)
+INVITES = EcumeneInviteQueue(BNET, ADMINS)
 
-# All command groups map
+# All command groups map.
+# Values are top-level command names and are expanded into concrete identifiers when queried.
 DICT_OF_ALL_COMMAND_GROUPS = {
     '/register': 'register',
     '/profile': 'profile',
     '/inspect': 'inspect',
-    '/admin': 'admin.%',
-    '/audit': 'audit.%',
-    '/clan': 'clan.%',
-    '/guild': 'guild.%',
+    '/admin': 'admin',
+    '/audit': 'audit',
+    '/clan': 'clan',
+    '/guild': 'guild',
 }
 
 # All grantable commands map.
 DICT_OF_ALL_GRANTABLE_COMMANDS = {
     '/clan': 'clan.*',
     '/clan list': 'clan.list',
+    '/clan changes': 'clan.changes',
     '/clan kick': 'clan.kick',
+    '/clan purge': 'clan.purge',
     '/clan rank': 'clan.rank',
+    '/clan ranks': 'clan.ranks',
     '/clan join': 'clan.join',
     '/clan action': 'clan.action',
     '/clan status': 'clan.status',
@@ -40,6 +57,12 @@ NOTIFICATION_TYPES = [
     'automation'
 ]
 
+# Automated features a guild can opt in to.
+# Keys are shown to users and values are stored.
+AUTOMATION_TYPES = {
+    'Approve registered requests': AutomationType.APPROVE.value
+}
+
 # Emoji information we want the bot to use.
 # These unforunately have to be hardcoded.
 EMOJIS = SimpleNamespace(**{
@@ -0,0 +1,70 @@
+import asyncio
+import logging
+
+from db.client import DatabaseService
+from db.query.signals import get_signals_since
+from util.time import get_current_time
+
+SIGNAL_POLL_INTERVAL = 10 # Seconds between polling for new signals.
+SIGNAL_POLL_OVERLAP = 5 # Seconds to look back past the last poll in case of clock drift between processes.
+
+class EcumeneSignalListener():
+    """
+    Polls the signals table for changes published by other processes.
+    Handlers are invoked with the signal key and must be safe to call more than once.
+    """
+
+    def __init__(self, db: DatabaseService, interval=SIGNAL_POLL_INTERVAL):
+        self.log = logging.getLogger(f'{self.__module__}.{self.__class__.__name__}')
+        self.db = db
+        self.interval = interval
+        self.handlers = dict()
+        self.since = None
+        self.task = None
+
+    def subscribe(self, topic, handler):
+        """Call handler with the key of every signal published under the topic."""
+        self.handlers.setdefault(topic, list()).append(handler)
+
+    def start(self):
+        """Begin polling on the running event loop. Safe to call more than once."""
+        if self.task and not self.task.done():
+            return
+        # Anything published before we started is already reflected in freshly loaded caches.
+        self.since = get_current_time()
+        self.task = asyncio.get_event_loop().create_task(self._run_())
+
+    async def _run_(self):
+        loop = asyncio.get_event_loop()
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await loop.run_in_executor(None, self.poll)
+            except Exception as e:
+                self.log.error(f'Failed to poll signals: {e}')
+
+    def poll(self):
+        """Dispatch every signal published since the last poll."""
+        polled_at = get_current_time()
+        signals = get_signals_since(self.db, self.since - (1000 * SIGNAL_POLL_OVERLAP))
+        if not signals:
+            self.since = polled_at
+            return
+
+        # One failing handler should not stop the rest of the batch being applied.
+        failed = 0
+        for topic, key in zip(signals.get('topic'), signals.get('signal_key')):
+            for handler in self.handlers.get(topic, list()):
+                try:
+                    handler(key)
+                except Exception as e:
+                    failed += 1
+                    self.log.error(f'Failed to handle signal "{topic}" for "{key}": {e}')
+
+        # Only move on once everything was handled. Handlers are idempotent so the batch is simply redelivered.
+        # Signals are cleaned up after an hour so a persistent failure cannot hold us back forever.
+        if failed:
+            self.log.warning(f"Failed {failed} signal handler(s), retrying on the next poll")
+        else:
+            self.since = polled_at
+        self.log.info(f"Dispatched {len(signals.get('topic'))} signal(s)")
\ No newline at end of file
@@ -0,0 +1,91 @@
+import os
+import glob
+import pandas as pd
+
+from util.enum import AuditRecordType
+from util.local import archive_path
+from util.time import epoch_to_month
+
+# Archived tables are stored as one compressed columnar file per month.
+# Month keys are zero-padded so they sort in time order as plain strings.
+HISTORY = 'history'
+HISTORY_OPTIONS = 'history_options'
+ARCHIVE_EXT = '.parquet'
+ARCHIVE_COMPRESSION = 'gzip'
+DAY_MS = 24*60*60*1000
+
+def write_archive(table, month, data):
+    """Merge rows into the archive file for a table and month."""
+    path = archive_path(table, f'{month}{ARCHIVE_EXT}')
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    df = pd.DataFrame(data)
+    if os.path.exists(path):
+        # A month can be archived across several runs so merge with what is already there.
+        # Dropping duplicates makes re-archiving rows that failed to delete harmless.
+        df = pd.concat([pd.read_parquet(path), df], ignore_index=True).drop_duplicates()
+
+    # Write to the side and swap so readers never see a partial file.
+    tmp_path = f'{path}.tmp'
+    df.to_parquet(tmp_path, compression=ARCHIVE_COMPRESSION, index=False)
+    os.replace(tmp_path, path)
+    return df.shape[0]
+
+def read_archive(table, min_time):
+    """Read every archived month for a table from the month of the minimum time onwards."""
+    min_month = epoch_to_month(min_time)
+    frames = list()
+    for path in sorted(glob.glob(archive_path(table, f'*{ARCHIVE_EXT}'))):
+        month = os.path.basename(path)[:-len(ARCHIVE_EXT)]
+        if month < min_month:
+            continue
+        frames.append(pd.read_parquet(path))
+    if not frames:
+        return pd.DataFrame()
+    return pd.concat(frames, ignore_index=True)
+
+def read_audit_archive(min_time, guild_id, command_ids=None, discord_id=None, target_id=None):
+    """
+    Read archived audit records using the same filters as the database queries.
+    Returns the same structure as DatabaseService.select() so results can be combined.
+    """
+    df = read_archive(HISTORY, min_time)
+    if df.empty:
+        return dict()
+
+    # This is an "and" operator on all conditions.
+    mask = (df['guild_id'] == guild_id) & (df['invoked_at'] >= min_time) & (df['status'] != AuditRecordType.PENDING.value)
+    if command_ids is not None:
+        mask &= df['command_id'].isin(command_ids)
+    if discord_id is not None:
+        mask &= df['discord_id'] == discord_id
+    if target_id is not None:
+        options = read_archive(HISTORY_OPTIONS, min_time)
+        matched = list()
+        if not options.empty:
+            matched = options.loc[options['option_value'] == target_id, 'record_id']
+        mask &= df['record_id'].isin(matched)
+    df = df.loc[mask]
+    if df.empty:
+        return dict()
+
+    # Missing values come back as NaN so convert those to None like the database would.
+    df = df.astype(object).where(df.notnull(), None)
+    return df.to_dict('list')
+
+def summarise_audit_archive(min_time, guild_id, keys):
+    """
+    Aggregate archived audit records by each key in the same shape as the summary queries.
+    The "day" key is derived from the invocation time as whole days since epoch.
+    """
+    data = read_audit_archive(min_time, guild_id)
+    if not data:
+        return dict()
+
+    df = pd.DataFrame(data)
+    df['day'] = df['invoked_at'] // DAY_MS
+    df['failed'] = df['status'].str.startswith('failed').astype(int)
+    summary = dict()
+    for key in keys:
+        grouped = df.groupby(key).agg(total=('record_id', 'count'), failed=('failed', 'sum')).reset_index()
+        summary[key] = grouped.astype(object).to_dict('list')
+    return summary
\ No newline at end of file
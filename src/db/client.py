@@ -3,10 +3,11 @@ import logging
 
 from sqlalchemy import MetaData, Table, Column
 from sqlalchemy import Integer, String, Text, Float
-from sqlalchemy import UniqueConstraint, ForeignKeyConstraint
-from sqlalchemy import create_engine, inspect, insert
+from sqlalchemy import UniqueConstraint, ForeignKeyConstraint, Index
+from sqlalchemy import create_engine, inspect, insert, text
 
 from util.local import get_models
+from util.metrics import CALL_DB, count_call
 
 COLUMN_JTYPE_TO_DTYPE = {
     'float': Float,
@@ -17,7 +18,8 @@ COLUMN_JTYPE_TO_DTYPE = {
 }
 CONSTRAINT_JTYPE_TO_DTYPE = {
     'unique': UniqueConstraint,
-    'foreign': ForeignKeyConstraint
+    'foreign': ForeignKeyConstraint,
+    'index': Index # Not strictly a constraint but it is attached to the table in the same way.
 }
 
 class DatabaseService():
@@ -87,6 +89,12 @@ class DatabaseService():
                 ref_cols,
                 name=constraint.get('name')
             )
+        elif ctype is Index:
+            # Index takes the name first and then an unpacked column sequence.
+            return ctype(
+                constraint.get('name'),
+                *constraint.get('columns')
+            )
         return
 
     def _build_models_from_json_(self, models):
@@ -140,10 +148,36 @@ class DatabaseService():
         for table in self.models:
             if self._has_table_(table.name):
                 self.log.info(f'Table "{table}" already exists!')
+                self._enforce_columns_(table)
+                self._enforce_indexes_(table)
                 continue
             self.log.info(f'Creating "{table}" from model')
             table.create(self.engine)
 
+    def _enforce_columns_(self, table):
+        """Add any modelled columns that are missing from an existing table."""
+        existing = set(
+            column.get('name').lower() for column in inspect(self.engine).get_columns(table.name, schema=self.user)
+        )
+        for column in table.columns:
+            if column.name.lower() in existing:
+                continue
+            # New columns are always added as nullable so existing rows remain valid.
+            dtype = column.type.compile(dialect=self.engine.dialect)
+            self.log.info(f'Adding column "{column.name}" to "{table}"')
+            self.execute(text(f'ALTER TABLE {table.fullname} ADD ({column.name} {dtype})'))
+
+    def _enforce_indexes_(self, table):
+        """Create any modelled indexes that are missing from an existing table."""
+        existing = set(
+            index.get('name') for index in inspect(self.engine).get_indexes(table.name, schema=self.user)
+        )
+        for index in table.indexes:
+            if index.name in existing:
+                continue
+            self.log.info(f'Creating index "{index.name}" on "{table}"')
+            index.create(self.engine)
+
     def retrieve_model(self, table):
         for model in self.models:
             if model.name == table:
@@ -151,10 +185,28 @@ class DatabaseService():
 
     def execute(self, qry):
         """Execute query and fetch return from cursor."""
+        count_call(CALL_DB)
         with self.engine.begin() as connection:
             result = connection.execute(qry)
         return result
 
+    def execute_many(self, qry, params):
+        """Execute query once per parameter set within a single round trip."""
+        count_call(CALL_DB)
+        with self.engine.begin() as connection:
+            result = connection.execute(qry, params)
+        return result
+
+    def execute_all(self, statements):
+        """Execute several statements within a single transaction. Each is a query and its parameters, which may be None."""
+        with self.engine.begin() as connection:
+            for qry, params in statements:
+                count_call(CALL_DB)
+                if params is None:
+                    connection.execute(qry)
+                else:
+                    connection.execute(qry, params)
+
     # Only implement insert directly.
     # All other basic commands will have to act on query.
     def insert(self, table_name, values):
@@ -167,6 +219,12 @@ class DatabaseService():
         result = self.execute(qry)
         return result
 
+    def insert_many(self, table_name, values):
+        """Insert a list of rows into table model with a single round trip."""
+        table = self.retrieve_model(table_name)
+        result = self.execute_many(insert(table), values)
+        return result
+
     # Implement select to rapidly return result.
     # The table will need to be passed in here to obtain columns.
     def select(self, qry):
@@ -1,12 +1,43 @@
-from sqlalchemy import select, update
+from sqlalchemy import select, insert, update, delete, bindparam, func, case, literal_column
 
+from db.archive import read_audit_archive, summarise_audit_archive
 from db.client import DatabaseService
+from util.data import chunks
 from util.enum import AuditRecordType
 from util.time import get_current_time
 
+# Oracle limits the number of expressions in a single IN list.
+IN_LIMIT = 1000
+DAY_MS = 24*60*60*1000
+
+def _with_archive_(result, archived):
+    """Append archived records onto a database result of the same structure."""
+    if not archived:
+        return result
+    if not result:
+        return archived
+    # Archives written before a column was added will not carry it.
+    count = len(archived.get('record_id'))
+    return {
+        key: values + archived.get(key, [None] * count) for key, values in result.items()
+    }
+
 def insert_audit_record(service: DatabaseService, data):
     return service.insert('history', data)
 
+def insert_audit_options(service: DatabaseService, rows):
+    """Insert normalised option rows for an audit record."""
+    if not rows:
+        return None
+    return service.insert_many('history_options', rows)
+
+def insert_audit_records_with_options(service: DatabaseService, rows, option_rows):
+    """Insert many audit records and their option rows in a single transaction."""
+    statements = [(insert(service.retrieve_model('history')), rows)]
+    if option_rows:
+        statements.append((insert(service.retrieve_model('history_options')), option_rows))
+    return service.execute_all(statements)
+
 def update_audit_record(service: DatabaseService, on, data):
     """Update audit details based 'on' column."""
     # Retain match identifier separately.
@@ -22,6 +53,26 @@ def update_audit_record(service: DatabaseService, on, data):
     result = service.execute(qry)
     return result
 
+def update_audit_records(service: DatabaseService, on, rows):
+    """
+    Update many audit records based 'on' column in a single round trip.
+    Every row must carry the same set of keys to be executed together.
+    """
+    if not rows:
+        return None
+    # Bound parameter names cannot clash with column names in the SET clause.
+    # Prefix them and rename the payload accordingly.
+    keys = [key for key in rows[0].keys() if key != on]
+    table = service.retrieve_model('history')
+    qry = (
+        update(table).
+            where(getattr(table.c, on) == bindparam(f'b_{on}')).
+            values({key: bindparam(f'b_{key}') for key in keys})
+    )
+    params = [{f'b_{key}': value for key, value in row.items()} for row in rows]
+    result = service.execute_many(qry, params)
+    return result
+
 def get_audit_records_with_period(service: DatabaseService, guild_id, lookback):
     """Get all records with some lookback period."""
     table = service.retrieve_model('history')
@@ -36,10 +87,11 @@ def get_audit_records_with_period(service: DatabaseService, guild_id, lookback):
             )
     )
     result = service.select(qry)
-    return result
+    archived = read_audit_archive(min_time, guild_id)
+    return _with_archive_(result, archived)
 
-def get_audit_records_with_command_and_period(service: DatabaseService, guild_id, lookback, command_id):
-    """Get all records with some command identifier and lookback period."""
+def get_audit_records_with_command_and_period(service: DatabaseService, guild_id, lookback, command_ids):
+    """Get all records with any of the command identifiers and lookback period."""
     table = service.retrieve_model('history')
     min_time = get_current_time() - (1000 * lookback) # Subtract lookback from current.
     qry = (
@@ -47,13 +99,14 @@ def get_audit_records_with_command_and_period(service: DatabaseService, guild_id
             filter(
                 # This is an "and" operator on both conditions.
                 table.c.guild_id == guild_id,
-                table.c.command_id.like(command_id),
+                table.c.command_id.in_(command_ids),
                 table.c.invoked_at >= min_time,
                 table.c.status != AuditRecordType.PENDING.value
             )
     )
     result = service.select(qry)
-    return result
+    archived = read_audit_archive(min_time, guild_id, command_ids=command_ids)
+    return _with_archive_(result, archived)
 
 def get_audit_records_with_user_and_period(service: DatabaseService, guild_id, lookback, discord_id):
     """Get all records with some user identifier and lookback period."""
@@ -70,23 +123,96 @@ def get_audit_records_with_user_and_period(service: DatabaseService, guild_id, l
             )
     )
     result = service.select(qry)
-    return result
+    archived = read_audit_archive(min_time, guild_id, discord_id=discord_id)
+    return _with_archive_(result, archived)
 
 def get_audit_records_with_target_and_period(service: DatabaseService, guild_id, lookback, target_id):
     """Get all records with some specific target and lookback period."""
     table = service.retrieve_model('history')
+    options = service.retrieve_model('history_options')
     min_time = get_current_time() - (1000 * lookback) # Subtract lookback from current.
+    subqry = (
+        select(options.c.record_id). # Equality lookup against the indexed option values.
+            where(options.c.option_value == target_id)
+    )
     qry = (
         select(table).
             filter(
                 # This is an "and" operator on both conditions.
                 table.c.guild_id == guild_id,
-                table.c.command_options.like(f"%={target_id}%"),
+                table.c.record_id.in_(subqry),
                 table.c.invoked_at >= min_time,
                 table.c.status != AuditRecordType.PENDING.value
             )
     )
     result = service.select(qry)
+    archived = read_audit_archive(min_time, guild_id, target_id=target_id)
+    return _with_archive_(result, archived)
+
+def get_audit_summary_with_period(service: DatabaseService, guild_id, lookback):
+    """
+    Get aggregate audit counts with some lookback period.
+    Counts are grouped by command, user, status and day in the database so only summary rows are returned.
+    """
+    table = service.retrieve_model('history')
+    min_time = get_current_time() - (1000 * lookback) # Subtract lookback from current.
+    conditions = [
+        # This is an "and" operator on all conditions.
+        table.c.guild_id == guild_id,
+        table.c.invoked_at >= min_time,
+        table.c.status != AuditRecordType.PENDING.value
+    ]
+    total = func.count().label('total')
+    failed = func.sum(case((table.c.status.like('failed%'), 1), else_=0)).label('failed')
+    # Inline the divisor as Oracle will not match bound parameters between the select and group by.
+    day = func.floor(table.c.invoked_at / literal_column(str(DAY_MS))).label('day')
+    groups = {
+        'command_id': table.c.command_id,
+        'discord_id': table.c.discord_id,
+        'status': table.c.status,
+        'day': day
+    }
+    archived = summarise_audit_archive(min_time, guild_id, list(groups.keys()))
+    summary = dict()
+    for key, column in groups.items():
+        qry = (
+            select(column, total, failed).
+                filter(*conditions).
+                group_by(column)
+        )
+        result = service.select(qry)
+        summary[key] = _with_archive_(result, archived.get(key))
+    return summary
+
+def get_audit_latency_with_period(service: DatabaseService, guild_id, lookback):
+    """
+    Get latency percentiles and average call counts per command with some lookback period.
+    Only records still held in the database are considered as archives are not ranked.
+    Failed checks never run the command so they are left out rather than dragging percentiles towards zero.
+    """
+    table = service.retrieve_model('history')
+    min_time = get_current_time() - (1000 * lookback) # Subtract lookback from current.
+    qry = (
+        select(
+            table.c.command_id,
+            func.count().label('total'),
+            func.percentile_cont(0.5).within_group(table.c.duration_ms).label('p50'),
+            func.percentile_cont(0.95).within_group(table.c.duration_ms).label('p95'),
+            func.percentile_cont(0.99).within_group(table.c.duration_ms).label('p99'),
+            func.avg(table.c.bnet_calls).label('bnet_calls'),
+            func.avg(table.c.discord_calls).label('discord_calls'),
+            func.avg(table.c.db_calls).label('db_calls')
+        ).
+            filter(
+                # This is an "and" operator on all conditions.
+                table.c.guild_id == guild_id,
+                table.c.invoked_at >= min_time,
+                table.c.duration_ms.is_not(None),
+                table.c.status != AuditRecordType.FAILED_CHECK.value
+            ).
+            group_by(table.c.command_id)
+    )
+    result = service.select(qry)
     return result
 
 def get_expired_records(service: DatabaseService, process_buffer):
@@ -118,4 +244,74 @@ def clean_expired_records(service: DatabaseService, process_buffer):
             values(data)
     )
     result = service.execute(qry)
-    return result
\ No newline at end of file
+    return result
+
+def get_records_without_options(service: DatabaseService):
+    """Get all records with options that have not been normalised."""
+    table = service.retrieve_model('history')
+    options = service.retrieve_model('history_options')
+    subqry = (
+        select(options.c.record_id)
+    )
+    qry = (
+        select(table.c.record_id, table.c.command_options).
+            filter(
+                table.c.command_options.is_not(None),
+                table.c.record_id.not_in(subqry)
+            )
+    )
+    result = service.select(qry)
+    return result
+
+def get_oldest_record_time(service: DatabaseService, before):
+    """Get the earliest invocation time of any record before some time."""
+    table = service.retrieve_model('history')
+    qry = (
+        select(func.min(table.c.invoked_at).label('invoked_at')).
+            where(table.c.invoked_at < before)
+    )
+    result = service.select(qry)
+    return result.get('invoked_at', [None])[0]
+
+def get_records_in_range(service: DatabaseService, min_time, max_time):
+    """Get all records invoked within [min_time, max_time)."""
+    table = service.retrieve_model('history')
+    qry = (
+        select(table).
+            filter(
+                # This is an "and" operator on both conditions.
+                table.c.invoked_at >= min_time,
+                table.c.invoked_at < max_time
+            )
+    )
+    result = service.select(qry)
+    return result
+
+def get_options_for_records(service: DatabaseService, record_ids):
+    """Get all normalised option rows for the given records."""
+    table = service.retrieve_model('history_options')
+    result = dict()
+    for chunk in chunks(record_ids, IN_LIMIT):
+        qry = (
+            select(table).
+                where(table.c.record_id.in_(chunk))
+        )
+        matched = service.select(qry)
+        for key, values in matched.items():
+            result[key] = result.get(key, list()) + values
+    return result
+
+def delete_records(service: DatabaseService, record_ids):
+    """Delete records and their option rows."""
+    table = service.retrieve_model('history')
+    options = service.retrieve_model('history_options')
+    for chunk in chunks(record_ids, IN_LIMIT):
+        service.execute(
+            delete(options).
+                where(options.c.record_id.in_(chunk))
+        )
+        service.execute(
+            delete(table).
+                where(table.c.record_id.in_(chunk))
+        )
+    return len(record_ids)
\ No newline at end of file
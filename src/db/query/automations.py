@@ -0,0 +1,72 @@
+from sqlalchemy import select, delete
+
+from db.client import DatabaseService
+from util.time import get_current_time
+
+def select_automation(service: DatabaseService, guild_id, feature):
+    table = service.retrieve_model('automations')
+    qry = (
+        select(table).
+            filter(
+                # This is an "and" operator on both conditions.
+                table.c.guild_id == guild_id,
+                table.c.feature == feature
+            )
+    )
+    result = service.select(qry)
+    return result
+
+def enable_automation(service: DatabaseService, guild_id, feature):
+    """Opt a guild in to an automated feature. Enabling twice is harmless."""
+    entry = select_automation(service, guild_id, feature)
+    if entry:
+        return entry
+    data = {
+        'guild_id': guild_id,
+        'feature': feature,
+        'enabled_at': get_current_time()
+    }
+    return service.insert('automations', data)
+
+def disable_automation(service: DatabaseService, guild_id, feature):
+    table = service.retrieve_model('automations')
+    qry = (
+        delete(table).
+            filter(
+                # This is an "and" operator on both conditions.
+                table.c.guild_id == guild_id,
+                table.c.feature == feature
+            )
+    )
+    result = service.execute(qry)
+    return result
+
+def get_guild_automations(service: DatabaseService, guild_id):
+    table = service.retrieve_model('automations')
+    qry = (
+        select(table).
+            where(table.c.guild_id == guild_id)
+    )
+    result = service.select(qry)
+    return result
+
+def get_clans_with_automation(service: DatabaseService, feature):
+    """Get every clan registered in a guild that has opted in to a feature."""
+    clans = service.retrieve_model('clans')
+    automations = service.retrieve_model('automations')
+    qry = (
+        select(clans).
+            join(automations, clans.c.guild_id == automations.c.guild_id).
+            where(automations.c.feature == feature)
+    )
+    result = service.select(qry)
+    return result
+
+def delete_guild_automations(service: DatabaseService, guild_id):
+    table = service.retrieve_model('automations')
+    qry = (
+        delete(table).
+            where(table.c.guild_id == guild_id)
+    )
+    result = service.execute(qry)
+    return result
\ No newline at end of file
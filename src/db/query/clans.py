@@ -2,6 +2,15 @@ from sqlalchemy import select, update, delete
 
 from db.client import DatabaseService
 
+def get_all_clans(service: DatabaseService):
+    """Get every clan registered across all guilds."""
+    table = service.retrieve_model('clans')
+    qry = (
+        select(table)
+    )
+    result = service.select(qry)
+    return result
+
 def get_all_clans_in_guild(service: DatabaseService, guild_id):
     table = service.retrieve_model('clans')
     qry = (
@@ -21,6 +30,16 @@ def get_clan_in_guild(service: DatabaseService, guild_id, target_column, clan_id
     result = service.select(qry)
     return result
 
+def get_clan_registrations(service: DatabaseService, clan_id):
+    """Get every guild registration of a clan."""
+    table = service.retrieve_model('clans')
+    qry = (
+        select(table).
+            where(table.c.clan_id == clan_id)
+    )
+    result = service.select(qry)
+    return result
+
 def get_clans_from_admins(service: DatabaseService, admin_ids):
     table = service.retrieve_model('clans')
     qry = (
@@ -11,6 +11,15 @@ def get_member_by_id(service: DatabaseService, target_column, id):
     result = service.select(qry)
     return result
 
+def get_registered_discord_ids(service: DatabaseService):
+    """Get only the Discord identifiers of every registered member."""
+    table = service.retrieve_model('members')
+    qry = (
+        select(table.c.discord_id)
+    )
+    result = service.select(qry)
+    return result
+
 def delete_member_by_id(service: DatabaseService, target_column, id):
     table = service.retrieve_model('members')
     qry = (
@@ -97,6 +106,15 @@ def check_blacklist(service: DatabaseService, guild_id, user_id):
     result = service.select(qry)
     return result
 
+def get_blacklist(service: DatabaseService):
+    """Get every blacklist entry across all guilds."""
+    table = service.retrieve_model('blacklist')
+    qry = (
+        select(table)
+    )
+    result = service.select(qry)
+    return result
+
 def add_user_to_blacklist(service: DatabaseService, guild_id, user_id):
     data = {
         'guild_id': guild_id,
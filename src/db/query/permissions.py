@@ -53,6 +53,16 @@ def get_role_permissions(service: DatabaseService, role_id):
     result = service.select(qry)
     return result
 
+def get_permissions_in_guild(service: DatabaseService, guild_id):
+    """For a guild - get every role and the commands it is able to run."""
+    table = service.retrieve_model('permissions')
+    qry = (
+        select(table).
+            where(table.c.guild_id == guild_id)
+    )
+    result = service.select(qry)
+    return result
+
 def get_permitted_roles_bulk(service: DatabaseService, guild_id, permission_ids):
     """For a list of command identifiers - get all permitted roles."""
     table = service.retrieve_model('permissions')
@@ -0,0 +1,56 @@
+from sqlalchemy import select, update, delete
+
+from db.client import DatabaseService
+from util.time import get_current_time
+
+def start_proliferation(service: DatabaseService, guild_id, role_id):
+    """Record a fresh proliferation for a guild, replacing any previous one."""
+    delete_proliferation(service, guild_id)
+    data = {
+        'guild_id': guild_id,
+        'role_id': role_id,
+        'member_cursor': None,
+        'granted': 0,
+        'started_at': get_current_time(),
+        'completed_at': None
+    }
+    return service.insert('proliferations', data)
+
+def update_proliferation_progress(service: DatabaseService, guild_id, member_cursor, granted):
+    """Persist the last processed member so the job can resume after it."""
+    table = service.retrieve_model('proliferations')
+    qry = (
+        update(table).
+            where(table.c.guild_id == guild_id).
+            values(member_cursor=member_cursor, granted=granted)
+    )
+    result = service.execute(qry)
+    return result
+
+def complete_proliferation(service: DatabaseService, guild_id):
+    table = service.retrieve_model('proliferations')
+    qry = (
+        update(table).
+            where(table.c.guild_id == guild_id).
+            values(completed_at=get_current_time())
+    )
+    result = service.execute(qry)
+    return result
+
+def get_incomplete_proliferations(service: DatabaseService):
+    table = service.retrieve_model('proliferations')
+    qry = (
+        select(table).
+            where(table.c.completed_at.is_(None))
+    )
+    result = service.select(qry)
+    return result
+
+def delete_proliferation(service: DatabaseService, guild_id):
+    table = service.retrieve_model('proliferations')
+    qry = (
+        delete(table).
+            where(table.c.guild_id == guild_id)
+    )
+    result = service.execute(qry)
+    return result
\ No newline at end of file
@@ -0,0 +1,137 @@
+from sqlalchemy import select, insert, update, delete, func
+
+from db.client import DatabaseService
+from util.data import fingerprint_roster, diff_roster_snapshots
+from util.time import get_current_time
+
+def record_roster(service: DatabaseService, clan_id, records):
+    """
+    Store a fresh roster snapshot for a clan, logging what changed since the last one.
+    Rosters matching the stored fingerprint only have their snapshot time moved on.
+    The first snapshot of a clan is a baseline so no changes are logged for it.
+    Returns the number of changes logged.
+    """
+    recorded_at = get_current_time()
+    fingerprint = fingerprint_roster(records)
+    previous = get_roster_fingerprint(service, clan_id)
+    if previous and previous.get('fingerprint')[0] == fingerprint:
+        touch_roster(service, clan_id, recorded_at)
+        return 0
+
+    # Only compare full rosters once the fingerprint says something moved.
+    changes = list()
+    if previous:
+        stored = get_rosters(service, [clan_id])
+        stored_records = [dict(zip(stored.keys(), values)) for values in zip(*stored.values())]
+        changes = diff_roster_snapshots(stored_records, records, clan_id, recorded_at)
+    replace_roster(service, clan_id, records, fingerprint, recorded_at, changes)
+    return len(changes)
+
+def replace_roster(service: DatabaseService, clan_id, records, fingerprint, computed_at, changes=None):
+    """
+    Swap the stored snapshot of a clan's roster and its fingerprint for fresh ones, logging any changes, in a single transaction.
+    The fingerprint is deleted first so a concurrent writer for the same clan waits on its row lock rather than interleaving.
+    """
+    rosters = service.retrieve_model('rosters')
+    fingerprints = service.retrieve_model('roster_fingerprints')
+    statements = [
+        (delete(fingerprints).where(fingerprints.c.clan_id == clan_id), None),
+        (delete(rosters).where(rosters.c.clan_id == clan_id), None),
+        (insert(fingerprints), [{'clan_id': clan_id, 'fingerprint': fingerprint, 'computed_at': computed_at}])
+    ]
+    if records:
+        statements.append((insert(rosters), records))
+    if changes:
+        statements.append((insert(service.retrieve_model('roster_changes')), changes))
+    return service.execute_all(statements)
+
+def touch_roster(service: DatabaseService, clan_id, snapshot_at):
+    """Mark an unchanged roster snapshot as current."""
+    table = service.retrieve_model('rosters')
+    qry = (
+        update(table).
+            where(table.c.clan_id == clan_id).
+            values(snapshot_at=snapshot_at)
+    )
+    result = service.execute(qry)
+    return result
+
+def get_rosters(service: DatabaseService, clan_ids, last_online_before=None):
+    """
+    Get the latest roster snapshot for each clan requested.
+    Optionally only members last online before some epoch time in seconds are returned.
+    """
+    table = service.retrieve_model('rosters')
+    qry = (
+        select(table).
+            where(table.c.clan_id.in_(clan_ids))
+    )
+    if last_online_before is not None:
+        qry = qry.where(table.c.last_online < last_online_before)
+    result = service.select(qry)
+    return result
+
+def get_roster_memberships(service: DatabaseService, destiny_ids):
+    """Get the snapshotted membership of specific members across every clan they are in."""
+    table = service.retrieve_model('rosters')
+    qry = (
+        select(table).
+            where(table.c.destiny_id.in_(destiny_ids))
+    )
+    result = service.select(qry)
+    return result
+
+def get_roster_snapshot_times(service: DatabaseService, clan_ids):
+    """Get when each requested clan with a roster snapshot was last snapshotted."""
+    table = service.retrieve_model('rosters')
+    qry = (
+        select(table.c.clan_id, func.min(table.c.snapshot_at).label('snapshot_at')).
+            where(table.c.clan_id.in_(clan_ids)).
+            group_by(table.c.clan_id)
+    )
+    result = service.select(qry)
+    return result
+
+def delete_roster(service: DatabaseService, clan_id):
+    """
+    Remove the stored snapshot of a clan's roster and its fingerprint in a single transaction.
+    Logged roster changes are left to age out with the rest.
+    """
+    rosters = service.retrieve_model('rosters')
+    fingerprints = service.retrieve_model('roster_fingerprints')
+    statements = [
+        (delete(fingerprints).where(fingerprints.c.clan_id == clan_id), None),
+        (delete(rosters).where(rosters.c.clan_id == clan_id), None)
+    ]
+    return service.execute_all(statements)
+
+def get_roster_fingerprint(service: DatabaseService, clan_id):
+    table = service.retrieve_model('roster_fingerprints')
+    qry = (
+        select(table).
+            where(table.c.clan_id == clan_id)
+    )
+    result = service.select(qry)
+    return result
+
+def delete_roster_changes_before(service: DatabaseService, changed_before):
+    """Remove logged roster changes older than some epoch time in milliseconds."""
+    table = service.retrieve_model('roster_changes')
+    qry = (
+        delete(table).
+            where(table.c.changed_at < changed_before)
+    )
+    result = service.execute(qry)
+    return result
+
+def get_roster_changes_with_period(service: DatabaseService, clan_ids, lookback):
+    """Get logged roster changes for some clans with some lookback period."""
+    table = service.retrieve_model('roster_changes')
+    min_time = get_current_time() - (1000 * lookback) # Subtract lookback from current.
+    qry = (
+        select(table).
+            where(table.c.clan_id.in_(clan_ids)).
+            where(table.c.changed_at >= min_time)
+    )
+    result = service.select(qry)
+    return result
\ No newline at end of file
@@ -0,0 +1,33 @@
+from sqlalchemy import select, delete
+
+from db.client import DatabaseService
+from util.time import get_current_time
+
+def publish_signal(service: DatabaseService, topic, key):
+    """Tell other processes that something under a topic has changed."""
+    data = {
+        'topic': topic,
+        'signal_key': key,
+        'published_at': get_current_time()
+    }
+    return service.insert('signals', data)
+
+def get_signals_since(service: DatabaseService, since):
+    """Get all signals published after some time."""
+    table = service.retrieve_model('signals')
+    qry = (
+        select(table).
+            where(table.c.published_at > since)
+    )
+    result = service.select(qry)
+    return result
+
+def delete_signals_before(service: DatabaseService, before):
+    """Remove signals that every listener has had time to see."""
+    table = service.retrieve_model('signals')
+    qry = (
+        delete(table).
+            where(table.c.published_at < before)
+    )
+    result = service.execute(qry)
+    return result
\ No newline at end of file
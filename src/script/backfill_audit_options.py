@@ -0,0 +1,64 @@
+import re
+
+from db.client import DatabaseService
+from db.query.audit import get_records_without_options, insert_audit_options
+from util.data import chunks, truncate_option_value
+
+DB = DatabaseService(enforce_schema=True) # Ensures the options table and indexes exist first.
+
+# Options were joined with semicolons but free-text values can contain them too.
+# Only treat a semicolon as a separator when the next option's name follows it.
+OPTION_SEPARATOR = re.compile(r';(?=[\w-]+=)')
+OPTION_NAME = re.compile(r'^[\w-]+$')
+IDENTIFIER_LIST = re.compile(r'^\d+(,\d+)+$')
+
+def split_command_options(record_id, formatted_options):
+    """
+    Reverse the formatted options string into normalised option rows.
+    Returns None when the string cannot be parsed so the record can be skipped.
+    """
+    rows = list()
+    for option in OPTION_SEPARATOR.split(formatted_options):
+        name, separator, value_str = option.partition('=')
+        if not separator or not OPTION_NAME.match(name):
+            return None
+        # Older records formatted empty values as a stringified tuple.
+        if value_str == "('None',)":
+            value_str = 'None'
+        # List values were joined with commas, but so can free text be.
+        # Identifiers are the only list values we match on so only split those back out.
+        values = value_str.split(',') if IDENTIFIER_LIST.match(value_str) else [value_str]
+        for value in values:
+            rows.append({
+                'record_id': record_id,
+                'option_name': name,
+                'option_value': truncate_option_value(value)
+            })
+    return rows
+
+def start():
+
+    # Find every record with options that has not been normalised yet.
+    # Running this again is safe as processed records are excluded.
+    records = get_records_without_options(DB)
+    if not records:
+        print('No audit records require backfill!')
+        return
+
+    # Insert in chunks to keep each round trip to a reasonable size.
+    rows = list()
+    skipped = 0
+    for record_id, formatted_options in zip(records.get('record_id'), records.get('command_options')):
+        record_rows = split_command_options(record_id, formatted_options)
+        if record_rows is None:
+            print(f'Skipped audit record {record_id} with unparseable options: {formatted_options}')
+            skipped += 1
+            continue
+        rows += record_rows
+    for chunk in chunks(rows, 1000):
+        insert_audit_options(DB, chunk)
+
+    print(f"Backfilled {len(rows)} option(s) for {len(records.get('record_id')) - skipped} audit record(s), skipped {skipped}!")
+
+if __name__ == '__main__':
+    start()
\ No newline at end of file
@@ -4,6 +4,8 @@ from api.client import DiscordInterface, DiscordInterfaceError
 from db.client import DatabaseService
 from db.query.headers import get_guilds
 from db.query.members import insert_or_update_member
+from db.query.signals import publish_signal
+from util.enum import SignalType
 from util.time import get_current_time
 
 API = DiscordInterface()
@@ -23,6 +25,10 @@ def force_register_user(user_id, destiny_id, destiny_mtype, bnet_id, bnet_mtype)
     _, delete_list = insert_or_update_member(DB, data)
     print('Captured registration request!')
 
+    # Let the bot know which members have changed.
+    for changed_id in set([str(user_id)]) | (delete_list or set()):
+        publish_signal(DB, SignalType.MEMBERS.value, changed_id)
+
     # Update user roles in all guilds for this new member.
     headers = get_guilds(DB)
     if headers:
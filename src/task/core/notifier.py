@@ -89,5 +89,60 @@ class EcumeneNotifier():
                     self.log.warn(f'Notification to "channel={channel_id}" unsuccessful')
                     continue
         
+        # Succeeded notification.
+        return
+
+    def pending_requests_reviewed(self, guild_ids, clan_name, clan_id, approved, awaiting):
+        """Notify on pending requests handled by the automated approval job."""
+        if not approved and not awaiting:
+            return
+        self.log.info('Notifying "approve_pending_requests" results...')
+
+        # Message generation.
+        # Anyone left waiting is unregistered so needs reviewing by hand.
+        list_separator = "\n"
+        description = f'Reviewed pending requests to join {clan_name}#{clan_id}.'
+        fields = list()
+        if approved:
+            fields.append({
+                'name': 'Approved',
+                'value': list_separator.join(approved),
+                'inline': False
+            })
+        if awaiting:
+            description += '\n\nThe following users are not registered with Ecumene and were left for review with `/clan request`.'
+            fields.append({
+                'name': 'Awaiting Review',
+                'value': list_separator.join(awaiting),
+                'inline': False
+            })
+        content = {
+            'embeds': [
+                {
+                    'title': 'Ecumene Automation — Notify',
+                    'description': description,
+                    'fields': fields,
+                    'footer': {
+                        'text': 'ecumene.cc',
+                        'icon_url': WEB_RESOURCES.logo
+                    },
+                    'thumbnail': {
+                        'url': WEB_RESOURCES.logo
+                    }
+                }
+            ]
+        }
+
+        # Post into the automation channels of every guild that opted in for this clan.
+        for guild_id in guild_ids:
+            channel_configuration = get_guild_channels_by_purpose(self.db, guild_id, 'automation')
+            for channel_id in channel_configuration.get('channel_id', list()):
+                try:
+                    self.api.create_message(channel_id, content)
+                    self.log.info(f'Notification sent to "channel={channel_id}" successfully')
+                except DiscordInterfaceError:
+                    self.log.warn(f'Notification to "channel={channel_id}" unsuccessful')
+                    continue
+
         # Succeeded notification.
         return
\ No newline at end of file
@@ -5,10 +5,33 @@ import logging
 from api.client import DiscordInterface
 from bnet.client import BungieInterface, BungieInterfaceError
 from db.client import DatabaseService
-from db.query.admins import insert_or_update_admin, get_tokens_to_refresh, get_orphans, delete_orphans, get_dead
-from db.query.audit import get_expired_records, clean_expired_records
+from db.query.clans import get_all_clans
+from db.query.members import get_members_matching_by_all_ids
+from db.query.rosters import record_roster, delete_roster_changes_before
+from db.query.automations import get_clans_with_automation
+from db.query.admins import get_admin_by_id, insert_or_update_admin, get_tokens_to_refresh, get_orphans, delete_orphans, get_dead
+from db.query.signals import publish_signal, delete_signals_before
+from db.archive import HISTORY, HISTORY_OPTIONS, write_archive
+from db.query.audit import \
+    get_expired_records, \
+    clean_expired_records, \
+    get_oldest_record_time, \
+    get_records_in_range, \
+    get_options_for_records, \
+    delete_records
 from task.core.notifier import EcumeneNotifier
-from util.time import get_current_time
+from util.data import \
+    parse_clan_roster, \
+    parse_pending_requests, \
+    filter_recent_requests, \
+    get_roster_identifiers, \
+    join_clan_roster, \
+    get_roster_snapshot, \
+    get_display_names, \
+    split_registered_roster
+from util.enum import SignalType, AutomationType
+from util.local import get_audit_retention_days
+from util.time import get_current_time, get_month_start, get_next_month_start, epoch_to_month
 
 TOP_PRIORITY = 1
 HIGH_PRIORITY = 2
@@ -19,13 +42,24 @@ TOKEN_REFRESH_SCHEDULE = 15*60
 TOKEN_REFRESH_URGENT_SCHEDULE = 5*60
 CLEAN_ADMIN_SCHEDULE = 24*60*60
 CLEAN_AUDIT_SCHEDULE = 24*60*60
+ARCHIVE_AUDIT_SCHEDULE = 24*60*60
+CLEAN_SIGNALS_SCHEDULE = 60*60
+ROSTER_SNAPSHOT_SCHEDULE = 30*60
+APPROVE_PENDING_SCHEDULE = 10*60
+CLEAN_ROSTER_CHANGES_SCHEDULE = 24*60*60
 
 AUDIT_TIMEOUT_BUFFER = 15*60
 TOKEN_PROCESSING_BUFFER = 5*60
+SIGNAL_RETENTION_BUFFER = 60*60
+ROSTER_CHANGE_RETENTION = 31*24*60*60 # Longest period offered by /clan changes.
+
+EMPTY = ""
 
 STATUS_FAILURE = 0
 STATUS_SUCCESS = 10
 
+BUNGIE_SUCCESS = 1
+
 class EcumeneScheduler():
 
     def __init__(self):
@@ -47,6 +81,11 @@ class EcumeneScheduler():
         self.clean_admin_cache()
         self.refresh_tokens()
         self.time_out_pending_audit()
+        self.archive_audit_history()
+        self.clean_signals()
+        self.snapshot_rosters()
+        self.clean_roster_changes()
+        self.approve_pending_requests()
 
     # This task must be run every fifteen minutes!
     def refresh_tokens(self, delay=TOKEN_REFRESH_SCHEDULE):
@@ -82,6 +121,7 @@ class EcumeneScheduler():
                         'refresh_expires_at': request_time + (1000 * token_data.get('refresh_expires_in'))
                     }
                     insert_or_update_admin(self.db, admin)
+                    publish_signal(self.db, SignalType.ADMINS.value, admin_id) # Bot drops its cached copy.
                     updated += 1
 
                 # Check if any credentials failed to update.
@@ -169,4 +209,200 @@ class EcumeneScheduler():
             NO_PRIORITY,
             self.time_out_pending_audit
         )
+        return STATUS_SUCCESS
+
+    def archive_audit_history(self, delay=ARCHIVE_AUDIT_SCHEDULE):
+        """Move audit records beyond the retention horizon into monthly archive files."""
+        self.log.info('Running "archive_audit_history" scheduled task...')
+
+        # Put this whole thing into a try-except block to avoid scheduler death.
+        try:
+
+            # Only whole months are archived so round the horizon down to the start of its month.
+            horizon = get_current_time() - (1000 * 24*60*60 * get_audit_retention_days())
+            cutoff = get_month_start(horizon)
+
+            # Walk month-by-month from the oldest record to keep each batch a reasonable size.
+            oldest = get_oldest_record_time(self.db, cutoff)
+            month_start = None
+            if oldest:
+                month_start = get_month_start(oldest)
+            while month_start and month_start < cutoff:
+                month_end = get_next_month_start(month_start)
+                records = get_records_in_range(self.db, month_start, month_end)
+                if records:
+                    # Archive first and delete after so a failure never loses records.
+                    # Archives are merged on write, so re-archiving the same rows is harmless.
+                    month = epoch_to_month(month_start)
+                    record_ids = records.get('record_id')
+                    options = get_options_for_records(self.db, record_ids)
+                    write_archive(HISTORY, month, records)
+                    if options:
+                        write_archive(HISTORY_OPTIONS, month, options)
+                    delete_records(self.db, record_ids)
+                    self.log.info(f"Archived {len(record_ids)} audit record(s) for {month}")
+                month_start = month_end
+
+        # If something goes wrong, log and reschedule again.
+        except Exception as e:
+            self.log.error(e)
+
+        # Ensure this task is rescheduled to run again.
+        # Like the timeout task, this is not critical for functionality.
+        self.schedule.enter(
+            delay,
+            NO_PRIORITY,
+            self.archive_audit_history
+        )
+        return STATUS_SUCCESS
+
+    def clean_signals(self, delay=CLEAN_SIGNALS_SCHEDULE):
+        """Remove signals old enough that every listener has already seen them."""
+        self.log.info('Running "clean_signals" scheduled task...')
+
+        # Put this whole thing into a try-except block to avoid scheduler death.
+        try:
+            delete_signals_before(self.db, get_current_time() - (1000 * SIGNAL_RETENTION_BUFFER))
+
+        # If something goes wrong, log and reschedule again.
+        except Exception as e:
+            self.log.error(e)
+
+        # Ensure this task is rescheduled to run again.
+        # Listeners poll far more often than this so there is no rush.
+        self.schedule.enter(
+            delay,
+            NO_PRIORITY,
+            self.clean_signals
+        )
+        return STATUS_SUCCESS
+
+    def snapshot_rosters(self, delay=ROSTER_SNAPSHOT_SCHEDULE):
+        """Store a fresh snapshot of every registered clan's roster joined with registrations, logging any changes."""
+        self.log.info('Running "snapshot_rosters" scheduled task...')
+
+        # Put this whole thing into a try-except block to avoid scheduler death.
+        try:
+
+            # Clans can be registered in more than one guild but only need fetching once.
+            clans = get_all_clans(self.db)
+            clan_ids = sorted(set(clans.get('clan_id', list())))
+            updated = 0
+            for clan_id in clan_ids:
+                # Keep going if one clan fails so the others still refresh.
+                try:
+                    snapshot_at = get_current_time()
+                    details = parse_clan_roster(self.bnet.get_members_in_group(clan_id), EMPTY)
+                    search_bnet, search_destiny = get_roster_identifiers(details, EMPTY)
+                    records = get_members_matching_by_all_ids(self.db, search_bnet, search_destiny)
+                    roster = join_clan_roster(details, records, EMPTY)
+                    changes = record_roster(self.db, clan_id, get_roster_snapshot(roster, clan_id, snapshot_at))
+                    if changes:
+                        self.log.info(f"Logged {changes} roster change(s) for clan {clan_id}")
+                    updated += 1
+                except Exception as e:
+                    self.log.error(f"Unable to snapshot roster for clan {clan_id}: {e}")
+            if clan_ids:
+                self.log.info(f"Snapshotted {updated} of {len(clan_ids)} clan roster(s)")
+
+        # If something goes wrong, log and reschedule again.
+        except Exception as e:
+            self.log.error(e)
+
+        # Ensure this task is rescheduled to run again.
+        # Commands can always build a roster live so this is not urgent.
+        self.schedule.enter(
+            delay,
+            LOW_PRIORITY,
+            self.snapshot_rosters
+        )
+        return STATUS_SUCCESS
+
+    def clean_roster_changes(self, delay=CLEAN_ROSTER_CHANGES_SCHEDULE):
+        """Remove logged roster changes older than any period they can be listed for."""
+        self.log.info('Running "clean_roster_changes" scheduled task...')
+
+        # Put this whole thing into a try-except block to avoid scheduler death.
+        try:
+            delete_roster_changes_before(self.db, get_current_time() - (1000 * ROSTER_CHANGE_RETENTION))
+
+        # If something goes wrong, log and reschedule again.
+        except Exception as e:
+            self.log.error(e)
+
+        # Ensure this task is rescheduled to run again.
+        # Old changes are never read so there is no rush.
+        self.schedule.enter(
+            delay,
+            NO_PRIORITY,
+            self.clean_roster_changes
+        )
+        return STATUS_SUCCESS
+
+    def approve_pending_requests(self, delay=APPROVE_PENDING_SCHEDULE):
+        """Approve pending requests to join from registered users in clans whose guilds have opted in."""
+        self.log.info('Running "approve_pending_requests" scheduled task...')
+
+        # Put this whole thing into a try-except block to avoid scheduler death.
+        try:
+
+            # Clans can be registered in more than one opted-in guild but are only reviewed once.
+            clans = get_clans_with_automation(self.db, AutomationType.APPROVE.value)
+            to_review = dict()
+            for guild_id, clan_id, clan_name, admin_id in zip(clans.get('guild_id', list()), clans.get('clan_id', list()), clans.get('clan_name', list()), clans.get('admin_id', list())):
+                review = to_review.setdefault(clan_id, {'clan_name': clan_name, 'admin_id': admin_id, 'guild_ids': set()})
+                review['guild_ids'].add(guild_id)
+
+            # Requests made before the previous run were already reported so only new ones are notified.
+            notify_after = get_current_time() - (1000 * delay)
+            for clan_id, review in sorted(to_review.items()):
+                # Keep going if one clan fails so the others are still reviewed.
+                try:
+                    admin = get_admin_by_id(self.db, review.get('admin_id'))
+                    if not admin or admin.get('access_expires_at')[0] <= get_current_time():
+                        self.log.warn(f"No usable administrator credentials to review requests for clan {clan_id}")
+                        continue
+                    token = admin.get('access_token')[0]
+                    pending = self.bnet.get_pending_in_group(token, clan_id)
+                    if not pending:
+                        continue
+
+                    # Match requests to registrations.
+                    details = parse_pending_requests(pending, EMPTY)
+                    search_bnet, search_destiny = get_roster_identifiers(details, EMPTY)
+                    records = get_members_matching_by_all_ids(self.db, search_bnet, search_destiny)
+                    registered, unregistered = split_registered_roster(join_clan_roster(details, records, EMPTY), EMPTY)
+
+                    # Registered users are approved in a single batch for the clan.
+                    approved = list()
+                    if not registered.empty:
+                        results = self.bnet.approve_requests_to_join_group(
+                            token,
+                            clan_id,
+                            list(zip(registered['membership_type'], registered['destiny_id']))
+                        )
+                        succeeded = set(str(result.get('entityId')) for result in results or list() if result.get('result') == BUNGIE_SUCCESS)
+                        approved = [
+                            name for name, destiny_id in zip(get_display_names(registered, EMPTY), registered['destiny_id'])
+                            if destiny_id in succeeded
+                        ]
+                        self.log.info(f"Approved {len(approved)} of {registered.shape[0]} registered request(s) for clan {clan_id}")
+
+                    # Everyone else is left for review by hand.
+                    awaiting = get_display_names(filter_recent_requests(unregistered, notify_after), EMPTY)
+                    self.notify.pending_requests_reviewed(sorted(review.get('guild_ids')), review.get('clan_name'), clan_id, approved, awaiting)
+                except Exception as e:
+                    self.log.error(f"Unable to review pending requests for clan {clan_id}: {e}")
+
+        # If something goes wrong, log and reschedule again.
+        except Exception as e:
+            self.log.error(e)
+
+        # Ensure this task is rescheduled to run again.
+        # Requests can always be handled by hand so this is not urgent.
+        self.schedule.enter(
+            delay,
+            LOW_PRIORITY,
+            self.approve_pending_requests
+        )
         return STATUS_SUCCESS
\ No newline at end of file
@@ -0,0 +1,33 @@
+import asyncio
+import contextvars
+import functools
+
+async def gather_bounded(coros, limit, return_exceptions=True, interval=0):
+    """
+    Await coroutines concurrently with at most limit in flight at once.
+    Starts can also be spaced at least interval seconds apart to stay under a rate limit.
+    Results are returned in order. Exceptions are returned in place by default so one failure does not cancel the rest.
+    """
+    semaphore = asyncio.Semaphore(limit)
+    lock = asyncio.Lock()
+    next_start = [0]
+    async def bounded(coro):
+        async with semaphore:
+            if interval:
+                # Reserve the next free start slot and wait for it.
+                async with lock:
+                    now = asyncio.get_event_loop().time()
+                    start = max(now, next_start[0])
+                    next_start[0] = start + interval
+                await asyncio.sleep(start - now)
+            return await coro
+    return await asyncio.gather(*[bounded(coro) for coro in coros], return_exceptions=return_exceptions)
+
+async def run_blocking(func, *args, **kwargs):
+    """
+    Run a blocking call in the default executor without holding up the event loop.
+    The current context is copied across so per-command call counting still applies.
+    """
+    context = contextvars.copy_context()
+    call = functools.partial(context.run, func, *args, **kwargs)
+    return await asyncio.get_event_loop().run_in_executor(None, call)
\ No newline at end of file
@@ -1,14 +1,30 @@
+import hashlib
 import numpy as np
 import pandas as pd
 
+from util.enum import RosterChangeType
 from util.time import get_current_time, humanize_timedelta
 
+INACTIVE_AFTER_SECONDS = 30*24*60*60 # Members not seen online for longer than this are inactive.
+OPTION_VALUE_SIZE = 400 # Bytes held by history_options.option_value.
+
 # Primitive helpers.
 def chunks(lst, n):
     """Yield successive n-sized chunks from list."""
     for i in range(0, len(lst), n):
         yield lst[i:i + n]
 
+def truncate_option_value(value):
+    """
+    Cut an option value down to fit the options table.
+    The full value is still kept in the formatted command options.
+    """
+    encoded = value.encode('utf-8')
+    if len(encoded) <= OPTION_VALUE_SIZE:
+        return value
+    # Drop any character split by the cut rather than writing half of it.
+    return encoded[:OPTION_VALUE_SIZE].decode('utf-8', errors='ignore')
+
 # Basic constructors and wrappers.
 def make_empty_structure() -> pd.DataFrame:
     return pd.DataFrame()
@@ -19,38 +35,229 @@ def make_structure(data) -> pd.DataFrame:
 def append_frames(*frames) -> pd.DataFrame:
     return pd.concat(frames, axis=0, ignore_index=True)
 
+def _has_identifier_(series: pd.Series, empty_str) -> pd.Series:
+    return series.notnull() & (series != empty_str)
+
 def coalesce_clan_list(df_api: pd.DataFrame, df_db: pd.DataFrame, empty_str):
     """Join all the various data structures to retain."""
 
-    # Split out API data depending on which values are available.
-    # Priority is to utilise Bungie identifier where present.
-    df_api_bnet = df_api.loc[(df_api['bnet_id'].notnull()) & (df_api['bnet_id'] != empty_str)]
-    df_api_destiny = df_api.loc[((df_api['bnet_id'].isnull()) | (df_api['bnet_id'] == empty_str)) & (df_api['destiny_id'].notnull()) & (df_api['destiny_id'] != empty_str)]
+    # Priority is to utilise Bungie identifier where present, so key each API row by one identifier.
+    # Users with neither Destiny or Bungie identifiers are dropped. Unsure if that would ever be possible.
+    has_bnet = _has_identifier_(df_api['bnet_id'], empty_str)
+    has_destiny = _has_identifier_(df_api['destiny_id'], empty_str)
+    df_api = df_api.loc[has_bnet | has_destiny].copy()
+    df_api['match_key'] = np.where(
+        has_bnet[has_bnet | has_destiny],
+        'bnet:' + df_api['bnet_id'].astype(str),
+        'destiny:' + df_api['destiny_id'].astype(str)
+    )
 
-    # Handle merges seperately.
-    # Note left merges to avoid duplication of records.
-    df_bnet = df_api_bnet.merge(df_db, how='left', on=['bnet_id'], suffixes=['_api', '_db'])
-    df_destiny = df_api_destiny.merge(df_db, how='left', on=['destiny_id'], suffixes=['_api', '_db'])
+    # Database records are reachable by either identifier so key them under both.
+    keyed = pd.concat([
+        df_db.loc[df_db['bnet_id'].notnull()].assign(match_key='bnet:' + df_db['bnet_id'].astype(str)),
+        df_db.loc[df_db['destiny_id'].notnull()].assign(match_key='destiny:' + df_db['destiny_id'].astype(str))
+    ]).drop_duplicates(subset=['match_key'])
 
-    # Handle separate merge suffixes, retaining API values where possible.
-    df_bnet['destiny_id'] = np.where((df_bnet['destiny_id_api'].notnull()) & (df_bnet['destiny_id_api'] != empty_str), df_bnet['destiny_id_api'], df_bnet['destiny_id_db'])
-    df_destiny['bnet_id'] = df_destiny['bnet_id_db'] # We can always replace as the null condition is checked when data is first split.
-    df_bnet.drop(columns=['destiny_id_api', 'destiny_id_db'], inplace=True)
-    df_destiny.drop(columns=['bnet_id_api', 'bnet_id_db'], inplace=True)
+    # One left merge so records are never duplicated.
+    df = df_api.merge(keyed, how='left', on='match_key', suffixes=['_api', '_db'])
 
-    # Rejoin data - this will lose users who have neither Destiny or Bungie identifiers.
-    # Unsure if that would ever be possible.
-    df = pd.concat([df_bnet, df_destiny])
+    # Retain API identifiers where possible, filling any gaps from the database.
+    for col in ['bnet_id', 'destiny_id']:
+        df[col] = np.where(_has_identifier_(df[f'{col}_api'], empty_str), df[f'{col}_api'], df[f'{col}_db'])
+    df.drop(columns=['match_key', 'bnet_id_api', 'bnet_id_db', 'destiny_id_api', 'destiny_id_db'], inplace=True)
 
     return df
 
+def parse_clan_roster(results, empty_str) -> pd.DataFrame:
+    """Structure clan members returned by Bungie into their identifiers and activity."""
+
+    # Pull every field we read into columns in one pass over the payload.
+    # It's also possible for the user to not have a Bungie.net login!
+    bnet_info = [member.get('bungieNetUserInfo') or dict() for member in results]
+    destiny_info = [member.get('destinyUserInfo') or dict() for member in results]
+
+    # The user's global display information may only be contained in one key! (Why Bungie?!)
+    # Leave display names null if they're incomplete.
+    names = [
+        (bnet.get('bungieGlobalDisplayName') or destiny.get('bungieGlobalDisplayName'), bnet.get('bungieGlobalDisplayNameCode') or destiny.get('bungieGlobalDisplayNameCode'))
+        for bnet, destiny in zip(bnet_info, destiny_info)
+    ]
+    df = make_structure({
+        'bnet_id': [str(info.get('membershipId', empty_str)) for info in bnet_info],
+        'destiny_id': [str(info.get('membershipId', empty_str)) for info in destiny_info],
+        'membership_type': [info.get('membershipType') for info in destiny_info],
+        'bungie_name': [f"{name}#{str(code).zfill(4)}" if name and code else None for name, code in names],
+        'join_date': [member.get('joinDate') for member in results],
+        'last_online': [member.get('lastOnlineStatusChange') for member in results],
+        'member_type': [member.get('memberType') for member in results]
+    })
+
+    # Bungie sends epoch seconds as strings but snapshots store them as numbers.
+    df['last_online'] = pd.to_numeric(df['last_online'], errors='coerce')
+    return df
+
+def parse_pending_requests(results, empty_str) -> pd.DataFrame:
+    """Structure pending requests to join a clan like a roster, adding when each request was made."""
+    df = parse_clan_roster(results, empty_str)
+    df['requested_at'] = pd.to_datetime([pendee.get('creationDate') for pendee in results], errors='coerce', utc=True)
+    return df
+
+def filter_recent_requests(df: pd.DataFrame, since) -> pd.DataFrame:
+    """Keep only pending requests made after the given epoch time in milliseconds."""
+    return df.loc[df['requested_at'] > pd.Timestamp(since, unit='ms', tz='UTC')]
+
+def get_display_names(df: pd.DataFrame, empty_str):
+    """List a display name for each roster row, falling back to the Destiny identifier when there is no Bungie name."""
+    return df['bungie_name'].where(_has_identifier_(df['bungie_name'], empty_str), df['destiny_id']).to_list()
+
+def split_registered_roster(df: pd.DataFrame, empty_str):
+    """Split a joined roster into members registered with Ecumene and everyone else."""
+    if 'discord_id' not in df.columns:
+        return df.iloc[0:0], df
+    registered = _has_identifier_(df['discord_id'], empty_str)
+    return df.loc[registered], df.loc[~registered]
+
+def get_inactive_cutoff(inactive_after=INACTIVE_AFTER_SECONDS):
+    """Return the epoch time in seconds that members must have been last online before to be inactive."""
+    return (get_current_time() // 1000) - inactive_after
+
+def filter_inactive_roster(df: pd.DataFrame, inactive_after=INACTIVE_AFTER_SECONDS) -> pd.DataFrame:
+    """Keep only roster members who have not been online since the inactive cutoff."""
+    last_online = pd.to_numeric(df['last_online'], errors='coerce')
+    return df.loc[last_online < get_inactive_cutoff(inactive_after)]
+
+def get_rank_changes(df: pd.DataFrame, holder_ids, holder_rank, other_rank=None, inactive_rank=None, inactive_after=INACTIVE_AFTER_SECONDS, protected_rank=None, protected_ids=None):
+    """
+    Apply a rank rule to a joined roster and keep only members whose rank would change.
+    Role holders get their rank, inactive members without the role get theirs and everyone else gets the rest.
+    Any rank left as None leaves that group unchanged.
+    Members at or above a protected rank, or whose Bungie or Destiny identifier is protected, are never touched.
+    """
+    df = df.copy()
+    current = pd.to_numeric(df['member_type'], errors='coerce')
+    holds = df['discord_id'].isin(list(holder_ids)) if 'discord_id' in df.columns else pd.Series(False, index=df.index)
+    target = current.copy()
+    if other_rank is not None:
+        target = target.where(holds, other_rank)
+    if inactive_rank is not None:
+        inactive = pd.to_numeric(df['last_online'], errors='coerce') < get_inactive_cutoff(inactive_after)
+        target = target.where(holds | ~inactive, inactive_rank)
+    target = target.where(~holds, holder_rank)
+    df['target_rank'] = target
+    changed = current.notnull() & (target != current)
+    if protected_rank is not None:
+        changed &= current < protected_rank
+    if protected_ids:
+        protected_ids = [str(protected_id) for protected_id in protected_ids]
+        changed &= ~(df['bnet_id'].isin(protected_ids) | df['destiny_id'].isin(protected_ids))
+    return df.loc[changed]
+
+def get_roster_identifiers(df: pd.DataFrame, empty_str):
+    """Return the Bungie and Destiny identifiers present in a roster for matching registrations."""
+    search_bnet = df.loc[(df['bnet_id'].notnull()) & (df['bnet_id'] != empty_str), 'bnet_id'].to_list()
+    search_destiny = df.loc[(df['destiny_id'].notnull()) & (df['destiny_id'] != empty_str), 'destiny_id'].to_list()
+    return search_bnet, search_destiny
+
+def join_clan_roster(df_api: pd.DataFrame, records, empty_str):
+    """Join a parsed roster with any matching member records, leaving it untouched if there are none."""
+    if not records:
+        return df_api
+    return coalesce_clan_list(df_api, make_structure(records), empty_str)
+
+def get_roster_snapshot(df: pd.DataFrame, clan_id, snapshot_at):
+    """Reduce a joined roster to the rows stored as its snapshot."""
+    snapshot_cols = [
+        'bnet_id',
+        'destiny_id',
+        'discord_id',
+        'bungie_name',
+        'join_date',
+        'last_online',
+        'member_type'
+    ]
+    df = df.copy()
+    for col in snapshot_cols:
+        if col not in df.columns:
+            df[col] = None
+    df = df.loc[:, snapshot_cols]
+    df['clan_id'] = clan_id
+    df['snapshot_at'] = snapshot_at
+
+    # Databases want nulls rather than missing numbers.
+    # Whole numbers are stored as integers so they compare and print the same as those read back.
+    records = df.astype(object).where(df.notnull(), None).to_dict('records')
+    for record in records:
+        for col in ['last_online', 'member_type']:
+            if record[col] is not None:
+                record[col] = int(record[col])
+    return records
+
+def get_roster_key(record):
+    """Identify a roster member by Destiny identifier, falling back to Bungie identifier."""
+    return record.get('destiny_id') or record.get('bnet_id')
+
+def fingerprint_roster(records):
+    """Hash every stored roster value so an unchanged roster can be recognised without comparing members."""
+    fields = ['bnet_id', 'destiny_id', 'discord_id', 'bungie_name', 'join_date', 'last_online', 'member_type']
+    rows = sorted('|'.join(str(record.get(field)) for field in fields) for record in records)
+    return hashlib.sha256('\n'.join(rows).encode('utf-8')).hexdigest()
+
+def diff_roster_snapshots(previous, current, clan_id, changed_at):
+    """Compare two roster snapshots and return a change record for each join, departure, rank change or activity."""
+    before = {get_roster_key(record): record for record in previous}
+    after = {get_roster_key(record): record for record in current}
+    changes = list()
+    def change(record, change_type, old_value=None, new_value=None):
+        changes.append({
+            'clan_id': clan_id,
+            'bnet_id': record.get('bnet_id'),
+            'destiny_id': record.get('destiny_id'),
+            'bungie_name': record.get('bungie_name'),
+            'change_type': change_type.value,
+            'old_value': None if old_value is None else str(old_value),
+            'new_value': None if new_value is None else str(new_value),
+            'changed_at': changed_at
+        })
+    for key, record in after.items():
+        old = before.get(key)
+        if old is None:
+            change(record, RosterChangeType.JOINED, new_value=record.get('member_type'))
+            continue
+        if old.get('member_type') != record.get('member_type'):
+            change(record, RosterChangeType.RANK, old.get('member_type'), record.get('member_type'))
+        if old.get('last_online') != record.get('last_online'):
+            change(record, RosterChangeType.ONLINE, old.get('last_online'), record.get('last_online'))
+    for key, record in before.items():
+        if key not in after:
+            change(record, RosterChangeType.LEFT, old_value=record.get('member_type'))
+    return changes
+
 # Processing functionality.
+def humanize_timedeltas(deltas: pd.Series) -> pd.Series:
+    """
+    Describe many time deltas for humans without formatting every row.
+    Deltas are rounded to the unit humans would read them in, so only distinct buckets are formatted.
+    """
+    seconds = deltas.dt.total_seconds()
+    buckets = pd.Series(
+        np.select(
+            [seconds < 60, seconds < 60*60, seconds < 24*60*60],
+            [seconds // 1, (seconds / 60).round() * 60, (seconds / (60*60)).round() * 60*60],
+            seconds // (24*60*60) * 24*60*60
+        ),
+        index=deltas.index
+    )
+    labels = {
+        bucket: humanize_timedelta(pd.Timedelta(bucket, 's').to_pytimedelta()) for bucket in buckets.dropna().unique()
+    }
+    return buckets.map(labels)
+
 def format_clan_list(df: pd.DataFrame):
     """Apply preprocess and format to clan list structure."""
 
     # Convert epoch timestamp into a datetime object.
     # Create a readable string for humans, too.
-    df['last_online_dt'] = pd.to_datetime(df['last_online'], unit='s')
+    df['last_online_dt'] = pd.to_datetime(pd.to_numeric(df['last_online'], errors='coerce'), unit='s')
     df['last_online_str'] = df['last_online_dt'].dt.strftime('%Y-%m-%d %H:%M:%S')
 
     # Do the same but for join dates.
@@ -59,15 +266,43 @@ def format_clan_list(df: pd.DataFrame):
 
     # Compute last online as a relative time from current.
     df['last_online_rel'] = pd.to_datetime(get_current_time(), unit='ms') - df['last_online_dt']
-    df['last_online_rel_str'] = df['last_online_rel'].apply(humanize_timedelta)
+    df['last_online_rel_str'] = humanize_timedeltas(df['last_online_rel'])
 
     # Use this to calculate status.
-    df['status'] = np.where(df['last_online_rel'] > pd.Timedelta(30, 'd'), 'Inactive', 'Active')
+    inactive = (df['last_online_rel'] > pd.Timedelta(INACTIVE_AFTER_SECONDS, 's')).astype(int)
+    df['status'] = pd.Categorical.from_codes(inactive, categories=['Active', 'Inactive'])
+    if 'clan_name' in df.columns:
+        df['clan_name'] = df['clan_name'].astype('category')
 
     # Sorting magic.
     df['bnet_id_num'] = pd.to_numeric(df['bnet_id'], errors='coerce')
     df.sort_values(by=['clan_id', 'bnet_id_num'], inplace=True)
 
+# Processing functionality.
+def format_roster_changes(df: pd.DataFrame):
+    """Apply preprocess and format to roster changes structure."""
+
+    # Convert epoch timestamp into a datetime object.
+    # Create a readable string for humans, too.
+    df['changed_at_dt'] = pd.to_datetime(df['changed_at'], unit='ms')
+    df['changed_at_str'] = df['changed_at_dt'].dt.strftime('%Y-%m-%d %H:%M:%S')
+    df.sort_values(by=['changed_at', 'clan_id'], inplace=True)
+
+    # Final output columns for the "pretty" output.
+    output_cols = [
+        'clan_id',
+        'clan_name',
+        'changed_at_str', # Created by format_roster_changes processing.
+        'change_type',
+        'bnet_id',
+        'destiny_id',
+        'bungie_name',
+        'old_value',
+        'new_value'
+    ]
+    output = df.loc[:, output_cols]
+    return output
+
 # Processing functionality.
 def format_audit_records(df: pd.DataFrame):
     """Apply preprocess and format to audit records structure."""
@@ -97,4 +332,45 @@ def format_audit_records(df: pd.DataFrame):
         'status'
     ]
     output = df.loc[:, output_cols]
-    return output
\ No newline at end of file
+    return output
+
+def format_audit_summary(df: pd.DataFrame, key):
+    """Combine and format summary counts grouped by some key."""
+
+    # Database and archive counts can share keys so add them together.
+    df = df.groupby(key, as_index=False)[['total', 'failed']].sum()
+    df['total'] = df['total'].astype(int)
+    df['failed'] = df['failed'].astype(int)
+    df['failure_rate'] = (df['failed'] / df['total']).round(3)
+    df.sort_values(by=['total', key], ascending=[False, True], inplace=True)
+    return df
+
+def format_audit_histogram(df: pd.DataFrame):
+    """Format summary counts grouped by day into a per-day histogram."""
+    df = format_audit_summary(df, 'day')
+
+    # Days are whole days since epoch so convert back into a readable date.
+    df['date'] = pd.to_datetime(df['day'].astype(int), unit='D').dt.strftime('%Y-%m-%d')
+    df.sort_values(by=['day'], inplace=True)
+
+    # Final output columns for the "pretty" output.
+    output_cols = [
+        'date',
+        'total',
+        'failed',
+        'failure_rate'
+    ]
+    output = df.loc[:, output_cols]
+    return output
+
+def format_audit_latency(df: pd.DataFrame):
+    """Apply preprocess and format to audit latency structure."""
+
+    # Percentiles and averages come back as decimals so round them into something readable.
+    for col in ['p50', 'p95', 'p99']:
+        df[col] = pd.to_numeric(df[col]).round(0).astype(int)
+    for col in ['bnet_calls', 'discord_calls', 'db_calls']:
+        df[col] = pd.to_numeric(df[col]).round(1)
+    df['total'] = df['total'].astype(int)
+    df.sort_values(by=['p95', 'command_id'], ascending=[False, True], inplace=True)
+    return df
\ No newline at end of file
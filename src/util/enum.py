@@ -18,4 +18,18 @@ class AuditRecordType(str, enum.Enum, metaclass=EcumeneEnum):
     FAILED_CONTEXT = 'failed_context'
     FAILED_UNREGISTERED = 'failed_unregistered'
     FAILED_TIMEOUT = 'failed_timed_out'
-    EXPIRED_OR_UNHANDLED = 'expired_or_unhandled'
\ No newline at end of file
+    EXPIRED_OR_UNHANDLED = 'expired_or_unhandled'
+
+class SignalType(str, enum.Enum, metaclass=EcumeneEnum):
+    CLANS = 'clans'
+    ADMINS = 'admins'
+    MEMBERS = 'members'
+
+class RosterChangeType(str, enum.Enum, metaclass=EcumeneEnum):
+    JOINED = 'joined'
+    LEFT = 'left'
+    RANK = 'rank_changed'
+    ONLINE = 'online_changed'
+
+class AutomationType(str, enum.Enum, metaclass=EcumeneEnum):
+    APPROVE = 'approve_requests'
\ No newline at end of file
@@ -4,10 +4,14 @@ import json
 
 TMP_ROOT = 'tmp'
 LOC_ROOT = 'conf/{0}.json'
+ARCHIVE_ROOT = 'archive'
 
 def file_path(fname):
     return os.path.join(TMP_ROOT, fname)
 
+def archive_path(table, fname):
+    return os.path.join(ARCHIVE_ROOT, table, fname)
+
 def delete_file(path):
     return os.remove(path)
 
@@ -34,4 +38,11 @@ def get_system_role():
     role_name = os.getenv('DISCORD_SYSTEM_ROLE')
     if not role_name:
         role_name = 'Amiable' # Hardcode this for now.
-    return role_name
\ No newline at end of file
+    return role_name
+
+def get_audit_retention_days():
+    # Audit history older than this is archived out of the database.
+    days = os.getenv('AUDIT_RETENTION_DAYS')
+    if not days:
+        return 90
+    return int(days)
\ No newline at end of file
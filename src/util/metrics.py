@@ -0,0 +1,48 @@
+import contextvars
+
+from util.time import get_current_time
+
+# Each command runs in its own task so a context variable keeps counters per invocation.
+# Anything counted outside of a command (startup, scheduled jobs, other processes) is ignored.
+CALL_BNET = 'bnet'
+CALL_DISCORD = 'discord'
+CALL_DB = 'db'
+_COUNTER = contextvars.ContextVar('ecumene_call_counter', default=None)
+
+class CallCounter():
+    """Counts outbound calls made while handling a single command."""
+    def __init__(self):
+        self.started_at = get_current_time()
+        self.calls = {
+            CALL_BNET: 0,
+            CALL_DISCORD: 0,
+            CALL_DB: 0
+        }
+
+    def as_data(self):
+        """Return completion time, duration and call counts as a data structure."""
+        completed_at = get_current_time()
+        return {
+            'completed_at': completed_at,
+            'duration_ms': completed_at - self.started_at,
+            'bnet_calls': self.calls.get(CALL_BNET),
+            'discord_calls': self.calls.get(CALL_DISCORD),
+            'db_calls': self.calls.get(CALL_DB)
+        }
+
+def start_counter():
+    """Begin counting calls for the current context."""
+    counter = CallCounter()
+    _COUNTER.set(counter)
+    return counter
+
+def get_counter():
+    """Return the counter for the current context if there is one."""
+    return _COUNTER.get()
+
+def count_call(kind):
+    """Increment a call count for the current context if counting."""
+    counter = _COUNTER.get()
+    if counter is None:
+        return
+    counter.calls[kind] += 1
\ No newline at end of file
@@ -27,4 +27,22 @@ def get_timedelta(tgt_dt):
     return datetime.datetime.now(tz_info) - tgt_dt
 
 def humanize_timedelta(delta):
-    return humanize.naturaltime(delta)
\ No newline at end of file
+    return humanize.naturaltime(delta)
+
+def get_month_start(epoch_ms):
+    """Returns epoch time in milliseconds for the start of the (UTC) month containing the input."""
+    dt = datetime.datetime.fromtimestamp(int(epoch_ms) / 1000, tz=datetime.timezone.utc)
+    start = datetime.datetime(dt.year, dt.month, 1, tzinfo=datetime.timezone.utc)
+    return int(start.timestamp() * 1000)
+
+def get_next_month_start(epoch_ms):
+    """Returns epoch time in milliseconds for the start of the (UTC) month following the input."""
+    dt = datetime.datetime.fromtimestamp(get_month_start(epoch_ms) / 1000, tz=datetime.timezone.utc)
+    year, month = divmod(dt.month, 12) # Month is 1-indexed so this rolls December over.
+    start = datetime.datetime(dt.year + year, month + 1, 1, tzinfo=datetime.timezone.utc)
+    return int(start.timestamp() * 1000)
+
+def epoch_to_month(epoch_ms):
+    """Returns a sortable month key from epoch in milliseconds."""
+    dt = datetime.datetime.fromtimestamp(int(epoch_ms) / 1000, tz=datetime.timezone.utc)
+    return f"{dt.year}_{str(dt.month).zfill(2)}"
\ No newline at end of file
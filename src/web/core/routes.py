@@ -9,8 +9,9 @@ from db.query.transactions import get_transaction, update_transaction
 from db.query.members import insert_or_update_member
 from db.query.admins import insert_or_update_admin
 from db.query.clans import insert_or_update_clan
+from db.query.signals import publish_signal
 from util.time import get_current_time, bnet_to_time, epoch_to_time
-from util.enum import TransactionType
+from util.enum import TransactionType, SignalType
 
 class EcumeneRouteHandler():
 
@@ -112,6 +113,10 @@ class EcumeneRouteHandler():
             _, delete_list = insert_or_update_member(self.db, data)
             self.log.info('Captured registration request!')
 
+            # Let the bot know which members have changed, including anyone displaced by this registration.
+            for changed_id in set([user_id]) | (delete_list or set()):
+                publish_signal(self.db, SignalType.MEMBERS.value, changed_id)
+
             # Update user roles in all guilds for this new member.
             headers = get_guilds(self.db)
             if headers:
@@ -239,6 +244,7 @@ class EcumeneRouteHandler():
                 'refresh_expires_at': request_time + (1000 * token_data.get('refresh_expires_in'))
             }
             insert_or_update_admin(self.db, admin)
+            publish_signal(self.db, SignalType.ADMINS.value, admin.get('admin_id'))
 
             # Now we need to record or update information about the clan.
             detail = self.bnet.get_group_by_id(result.get('request_id')[0])
@@ -252,6 +258,9 @@ class EcumeneRouteHandler():
             }
             insert_or_update_clan(self.db, clan)
 
+            # Let the bot know the clan directory for this guild has changed.
+            publish_signal(self.db, SignalType.CLANS.value, clan.get('guild_id'))
+
             # Complete registration request.
             self.log.info('Captured registration request!')
 